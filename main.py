@@ -8,6 +8,17 @@ Usage:
     python main.py                       # defaults: 200 m HEC-RAS buffer, 100 m QGIS buffer
     python main.py --buffer 500          # 500 m HEC-RAS study area
     python main.py --buffer 1000 --stream-threshold 2000
+    python main.py --stream-threshold 250 500 1000 2000  # one streams layer per threshold
+    python main.py --jobs 8              # clip shapefile layers in 8 worker processes
+    python main.py --sites sites.csv --jobs 8   # batch: one folder per site in output/sites/
+    python main.py --dem-dir /data/3dep  # mosaic the tiles around the site (no merging on disk)
+    python main.py --cog                 # write clipped DEMs / terrain.tif as Cloud-Optimized GeoTIFF
+    python main.py --buffer 15000 --stream-clip  # clip huge buffers tile by tile (bounded memory)
+    python main.py --stream-weights runoff.tif   # accumulate runoff instead of cell counts
+    python main.py --buffer 5000 --stream-tiles  # delineate streams tile by tile (DEM larger than RAM)
+    python main.py --buffer 5000 --stream-memory 4  # keep stream delineation under 4 GB
+    python main.py --conditioning breach  # carve through embankments instead of filling
+    python main.py --simplify 1          # drop stream vertices within 1 m of the cell path
 """
 import argparse
 import sys
@@ -25,8 +36,15 @@ from src.config import (
     OUTPUT_DIR,
     BUFFER_200M,
     BUFFER_100M,
+    VECTOR_CACHE_DIR,
+    DEM_MOSAIC_PATH,
+    DEM_VALIDATION_CACHE,
+    HYDRO_TILE_SIZE,
+    HYDRO_CACHE_DIR,
+    BREACH_MAX_DEPTH,
+    BREACH_MAX_LENGTH,
 )
-from src.utils import read_coordinates
+from src.utils import read_coordinates, read_sites
 from src.validation import (
     validate_asset_dem,
     validate_asset_shapefiles,
@@ -38,11 +56,15 @@ from src.validation import (
     validate_generated_files,
     print_validation_summary,
 )
-from src.clipping import run_clip
+from src.clipping import run_clip_multi
 from src.qgis_project import write_qgis_project
 from src.streams import delineate_streams
 from src.hecras_export import export_for_hecras
+from src.vector_cache import build_vector_cache
+from src.batch import run_batch
+from src.dem_catalog import build_dem_catalog, write_site_mosaic
 import rasterio
+from rasterio.crs import CRS
 
 
 def parse_args() -> argparse.Namespace:
@@ -58,11 +80,84 @@ def parse_args() -> argparse.Namespace:
         help=f"QGIS visualization buffer radius in meters (default: {BUFFER_100M})",
     )
     p.add_argument(
-        "--stream-threshold", type=int, default=500,
+        "--stream-threshold", type=int, nargs="+", default=[500],
         help="Min flow accumulation (cells) for stream extraction (default: 500). "
-             "Higher = fewer/larger streams.",
+             "Higher = fewer/larger streams. Several values write one streams "
+             "layer per threshold (streams_<N>m_t<threshold>.shp) from a single "
+             "routing pass; the first is used for the HEC-RAS export.",
     )
-    return p.parse_args()
+    p.add_argument(
+        "--stream-weights", type=Path, default=None,
+        help="Raster of per-cell weights (e.g. rainfall or runoff coefficient) "
+             "for flow accumulation; the stream threshold is then in weighted cells.",
+    )
+    p.add_argument(
+        "--stream-tiles", action="store_true",
+        help=f"Delineate streams in {HYDRO_TILE_SIZE}x{HYDRO_TILE_SIZE} tiles on disk-backed "
+             "scratch arrays, for DEMs larger than RAM.",
+    )
+    p.add_argument(
+        "--stream-memory", type=float, default=None, metavar="GB",
+        help="Memory ceiling for stream delineation: float32 routing when the "
+             "whole DEM fits, else float64 tiles sized to fit, with peak memory per stage.",
+    )
+    p.add_argument(
+        "--conditioning", choices=("fill", "breach"), default="fill",
+        help="How depressions are removed before routing: fill them to their spill "
+             "level, or breach them with channels carved through their lowest "
+             "barrier (fewer flats behind embankments), filling the rest (default: fill).",
+    )
+    p.add_argument(
+        "--breach-depth", type=float, default=BREACH_MAX_DEPTH, metavar="Z",
+        help=f"Deepest cut of a breach channel, in DEM units (default: {BREACH_MAX_DEPTH:g}).",
+    )
+    p.add_argument(
+        "--breach-length", type=int, default=BREACH_MAX_LENGTH, metavar="CELLS",
+        help=f"Longest breach channel in cells (default: {BREACH_MAX_LENGTH}).",
+    )
+    p.add_argument(
+        "--simplify", type=float, default=None, metavar="TOL",
+        help="Simplify stream links to this tolerance in CRS units (e.g. 1 m), "
+             "removing D8 staircase vertices; links keep their confluence "
+             "endpoints and do not cross.",
+    )
+    p.add_argument(
+        "--jobs", type=int, default=1,
+        help="Worker processes for clipping shapefile layers, or for sites "
+             "in --sites mode (default: 1).",
+    )
+    p.add_argument(
+        "--sites", type=Path, default=None,
+        help="Batch mode: CSV (name, lat, lon) or GeoJSON of sites to process "
+             "instead of cooridante.txt.",
+    )
+    p.add_argument(
+        "--sites-out", type=Path, default=OUTPUT_DIR / "sites",
+        help="Batch mode output folder, one sub-folder per site (default: output/sites).",
+    )
+    p.add_argument(
+        "--dem-dir", type=Path, default=None,
+        help="Folder of DEM tiles (searched recursively) to mosaic around the "
+             "site(s) instead of the single DEM in assets.",
+    )
+    p.add_argument(
+        "--cog", action="store_true",
+        help="Write clipped DEMs and terrain.tif as Cloud-Optimized GeoTIFFs "
+             "(tiled, DEFLATE-compressed, with overviews).",
+    )
+    p.add_argument(
+        "--stream-clip", action="store_true",
+        help="Clip the DEM tile by tile so memory stays bounded for very large buffers.",
+    )
+    p.add_argument(
+        "--no-cache", action="store_true",
+        help="Read shapefiles directly instead of the reprojected vector cache, and "
+             "route streams from scratch instead of using cached hydrology rasters.",
+    )
+    args = p.parse_args()
+    if args.conditioning == "breach" and args.stream_tiles:
+        p.error("--conditioning breach needs the whole DEM in memory; drop --stream-tiles")
+    return args
 
 
 def main() -> int:
@@ -70,6 +165,11 @@ def main() -> int:
     buffer_hecras = args.buffer
     buffer_qgis = args.buffer_qgis
     stream_threshold = args.stream_threshold
+    if len(stream_threshold) == 1:
+        stream_threshold = stream_threshold[0]
+    raster_profile = "cog" if args.cog else "gtiff"
+    stream_tile_size = HYDRO_TILE_SIZE if args.stream_tiles else None
+    hydro_cache_dir = None if args.no_cache else HYDRO_CACHE_DIR
 
     suffix_hecras = f"{buffer_hecras}m"
     suffix_qgis = f"{buffer_qgis}m"
@@ -81,36 +181,98 @@ def main() -> int:
     print("=" * 60)
     print(f"  HEC-RAS buffer: {buffer_hecras} m")
     print(f"  QGIS buffer:    {buffer_qgis} m")
-    print(f"  Stream threshold: {stream_threshold} cells")
+    print(f"  Stream threshold: {', '.join(map(str, args.stream_threshold))} cells")
+    if args.stream_weights is not None:
+        print(f"  Stream weights: {args.stream_weights}")
+    if args.conditioning == "breach":
+        print(f"  Conditioning: breach (max depth {args.breach_depth:g}, "
+              f"max length {args.breach_length} cells)")
 
     # ── 1) Validate assets ──────────────────────────────────────
     print(f"\n[1/5] Validating assets...")
-    dem_result = validate_asset_dem(DEM_PATH)
-    if not dem_result["valid"]:
-        print(f"ERROR: DEM invalid - {dem_result.get('error')}")
-        return 1
-    print("  DEM: OK")
+    dem_path = DEM_PATH
+    catalog = None
+    if args.dem_dir is not None:
+        catalog = build_dem_catalog(args.dem_dir)
+        if not catalog["tiles"]:
+            print(f"ERROR: No georeferenced DEM tiles in {args.dem_dir}")
+            return 1
+        asset_crs = CRS.from_wkt(catalog["crs"])
+        print(f"  DEM catalog: {len(catalog['tiles'])} tiles")
+        if catalog["skipped"]:
+            print(f"  DEM catalog: skipped {len(catalog['skipped'])} tiles (no CRS or different CRS)")
+    else:
+        dem_result = validate_asset_dem(DEM_PATH, cache_path=DEM_VALIDATION_CACHE)
+        if not dem_result["valid"]:
+            print(f"ERROR: DEM invalid - {dem_result.get('error')}")
+            return 1
+        asset_crs = dem_result["crs"]
+        print("  DEM: OK")
+
+    cache_dir = None
+    if not args.no_cache and build_vector_cache(SHAPE_DIR, asset_crs) is not None:
+        cache_dir = VECTOR_CACHE_DIR
+        print(f"  Vector cache: {cache_dir}")
 
-    shp_result = validate_asset_shapefiles(SHAPE_DIR)
+    shp_result = validate_asset_shapefiles(SHAPE_DIR, cache_dir)
     if not shp_result["valid"]:
         print(f"ERROR: Shapefiles invalid - missing CRS: {shp_result.get('missing_crs')}")
         return 1
     print(f"  Shapefiles: OK ({shp_result['count']} layers)")
 
+    if args.sites is not None:
+        sites = read_sites(args.sites)
+        if catalog is not None:
+            try:
+                dem_path = write_site_mosaic(
+                    catalog, [(lat, lon) for _, lat, lon in sites],
+                    max(buffer_hecras, buffer_qgis), args.sites_out / "dem_mosaic.vrt",
+                )
+            except ValueError as e:
+                print(f"ERROR: {e}")
+                return 1
+            print(f"  DEM mosaic: {dem_path}")
+        print(f"\n[batch] Processing {len(sites)} sites from {args.sites} "
+              f"({args.jobs} worker{'s' if args.jobs > 1 else ''})...")
+        results = run_batch(
+            sites, [buffer_hecras, buffer_qgis], args.sites_out,
+            stream_threshold=stream_threshold, cache_dir=cache_dir, jobs=args.jobs,
+            dem_path=dem_path, raster_profile=raster_profile,
+            stream_clip=args.stream_clip, stream_weights=args.stream_weights,
+            stream_tile_size=stream_tile_size, hydro_cache_dir=hydro_cache_dir,
+            stream_memory_gb=args.stream_memory, stream_conditioning=args.conditioning,
+            breach_depth=args.breach_depth, breach_length=args.breach_length,
+            stream_simplify=args.simplify,
+        )
+        return 0 if all(r["status"] == "ok" for r in results) else 1
+
     lat, lon = read_coordinates(COORD_FILE)
     print(f"  Site (WGS84): {lat}, {lon}")
 
-    with rasterio.open(DEM_PATH) as src:
+    if catalog is not None:
+        try:
+            dem_path = write_site_mosaic(
+                catalog, [(lat, lon)], max(buffer_hecras, buffer_qgis), DEM_MOSAIC_PATH,
+            )
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return 1
+        print(f"  DEM mosaic: {dem_path}")
+
+    with rasterio.open(dem_path) as src:
         dem_crs = src.crs
         dem_bounds = src.bounds
-    validate_inputs(DEM_PATH, SHAPE_DIR, lat, lon, dem_crs, dem_bounds)
+    validate_inputs(dem_path, SHAPE_DIR, lat, lon, dem_crs, dem_bounds)
 
     # ── 2) Clip DEM and shapefiles ─────────────────────────────
     print(f"\n[2/5] Clipping ({suffix_hecras} HEC-RAS, {suffix_qgis} QGIS)...")
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    run_clip(lat, lon, dem_crs, buffer_hecras, OUTPUT_DIR, suffix_hecras)
-    run_clip(lat, lon, dem_crs, buffer_qgis, qgis_dir, suffix_qgis)
+    run_clip_multi(lat, lon, dem_crs, [
+        (buffer_hecras, OUTPUT_DIR, suffix_hecras),
+        (buffer_qgis, qgis_dir, suffix_qgis),
+    ], cache_dir, jobs=args.jobs, dem_path=dem_path, raster_profile=raster_profile,
+        stream=args.stream_clip)
 
     # ── 3) Stream delineation ──────────────────────────────────
     print(f"\n[3/5] Delineating streams...")
@@ -120,16 +282,27 @@ def main() -> int:
         streams_out = OUTPUT_DIR / f"streams_{suffix_hecras}.shp"
         streams_hecras = delineate_streams(
             dem_hecras_path, streams_out, threshold=stream_threshold,
+            weights_path=args.stream_weights, tile_size=stream_tile_size,
+            cache_dir=hydro_cache_dir, memory_limit_gb=args.stream_memory,
+            conditioning=args.conditioning, breach_depth=args.breach_depth,
+            breach_length=args.breach_length, simplify=args.simplify,
         )
+        if isinstance(streams_hecras, dict):  # several thresholds: export the first
+            streams_hecras = streams_hecras[args.stream_threshold[0]]
 
-    # Also run on QGIS buffer for visualization
+    # Also run on QGIS buffer for visualization (every threshold as a layer)
     dem_qgis_path = qgis_dir / f"dem_clipped_{suffix_qgis}.tif"
-    streams_qgis = None
+    streams_qgis = []
     if dem_qgis_path.exists():
         streams_qgis_out = qgis_dir / f"streams_{suffix_qgis}.shp"
-        streams_qgis = delineate_streams(
+        written = delineate_streams(
             dem_qgis_path, streams_qgis_out, threshold=stream_threshold,
+            weights_path=args.stream_weights, tile_size=stream_tile_size,
+            cache_dir=hydro_cache_dir, memory_limit_gb=args.stream_memory,
+            conditioning=args.conditioning, breach_depth=args.breach_depth,
+            breach_length=args.breach_length, simplify=args.simplify,
         )
+        streams_qgis = list(written.values()) if isinstance(written, dict) else [written]
 
     # ── 4) HEC-RAS export package ─────────────────────────────
     print(f"\n[4/5] Preparing HEC-RAS export...")
@@ -137,7 +310,7 @@ def main() -> int:
     if dem_hecras_path.exists() and buffer_shp.exists():
         export_for_hecras(
             dem_hecras_path, buffer_shp, streams_hecras,
-            hecras_dir, buffer_hecras,
+            hecras_dir, buffer_hecras, raster_profile,
         )
     print(f"  HEC-RAS files in: {hecras_dir}")
 
@@ -146,8 +319,7 @@ def main() -> int:
     dem_qgis = qgis_dir / f"dem_clipped_{suffix_qgis}.tif"
     shp_qgis = sorted(qgis_dir.glob(f"*_clipped_{suffix_qgis}.shp"))
     shp_list = [f"site_buffer_{suffix_qgis}.shp"] + [p.name for p in shp_qgis]
-    if streams_qgis and streams_qgis.exists():
-        shp_list.append(streams_qgis.name)
+    shp_list += [p.name for p in streams_qgis if p and p.exists()]
     if dem_qgis.exists():
         write_qgis_project(qgis_dir, dem_qgis.name, shp_list)
 
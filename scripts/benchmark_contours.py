@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark contour generation: native marching squares vs the previous
+matplotlib path (ax.contour + one LineString per segment).
+
+Square windows of increasing size are cut from the centre of a DEM and
+contoured at a fixed interval. Time, peak traced memory and the result
+(line count and total length) are printed for both. The first matplotlib
+call also pays for importing pyplot; it is reported separately. Without
+matplotlib installed only the native engine is timed.
+
+    python scripts/benchmark_contours.py                        # assets DEM, 1 m interval
+    python scripts/benchmark_contours.py --dem USGS_1m_tile.tif --sizes 1000 4000 --interval 0.5
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+import shapely
+from shapely.geometry import LineString
+
+from src.config import DEM_PATH
+from src.contours import contour_lines
+
+
+def _legacy_contour_lines(dem: np.ndarray, levels: np.ndarray, transform):
+    """Previous generate_contours body: matplotlib contour, then a LineString per segment."""
+    from matplotlib import pyplot as plt
+
+    rows, cols = dem.shape
+    col_coords = np.arange(cols) * transform.a + transform.c + transform.a / 2
+    row_coords = np.arange(rows) * transform.e + transform.f + transform.e / 2
+    fig, ax = plt.subplots()
+    cs = ax.contour(col_coords, row_coords, dem, levels=levels)
+    plt.close(fig)
+
+    lines, elevations = [], []
+    for level_idx, level_val in enumerate(cs.levels):
+        for path in cs.allsegs[level_idx]:
+            if len(path) >= 2:
+                lines.append(LineString(path))
+                elevations.append(float(level_val))
+    return np.array(lines, dtype=object), np.array(elevations)
+
+
+def _measured(fn, *args):
+    """(seconds, peak traced MB, result) of one call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def _read_window(dem_path: Path, size: int):
+    """Centred size x size window (clamped to the raster) as float64 with NaN nodata."""
+    with rasterio.open(dem_path) as src:
+        h, w = min(size, src.height), min(size, src.width)
+        window = Window((src.width - w) // 2, (src.height - h) // 2, w, h)
+        dem = src.read(1, window=window).astype(np.float64)
+        if src.nodata is not None:
+            dem[dem == src.nodata] = np.nan
+        return dem, src.window_transform(window)
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Benchmark contour generation")
+    p.add_argument("--dem", type=Path, default=DEM_PATH, help="DEM GeoTIFF (default: assets DEM)")
+    p.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000],
+                   help="Window edge lengths in cells (default: 500 1000 2000)")
+    p.add_argument("--interval", type=float, default=1.0,
+                   help="Contour interval in DEM units (default: 1)")
+    args = p.parse_args()
+
+    try:
+        start = time.perf_counter()
+        from matplotlib import pyplot  # noqa: F401  (import cost of the legacy path)
+        print(f"matplotlib.pyplot import: {time.perf_counter() - start:.2f} s")
+        legacy = True
+    except ImportError:
+        print("matplotlib not installed: timing the native engine only")
+        legacy = False
+
+    for size in args.sizes:
+        dem, transform = _read_window(args.dem, size)
+        zmin, zmax = np.nanmin(dem), np.nanmax(dem)
+        levels = np.arange(np.floor(zmin / args.interval) * args.interval,
+                           zmax + args.interval, args.interval)
+        print(f"\n{dem.shape[0]} x {dem.shape[1]} cells ({dem.size / 1e6:.1f} M), "
+              f"{len(levels)} levels from {args.dem.name}")
+        runs = [("native", contour_lines)] + ([("matplotlib", _legacy_contour_lines)] if legacy else [])
+        for name, fn in runs:
+            seconds, peak, (lines, _) = _measured(fn, dem, levels, transform)
+            print(f"    {name:<12} {seconds:8.2f} s   peak {peak:8.0f} MB   "
+                  f"lines {len(lines):>8}   length {shapely.length(lines).sum():14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
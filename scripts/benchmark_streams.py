@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Benchmark stream-delineation stages against the previous implementations.
+
+Square windows of increasing size are cut from the centre of a DEM (use a
+real 1 m lidar tile for meaningful numbers) and each stage is timed on them.
+
+    python scripts/benchmark_streams.py                          # assets DEM
+    python scripts/benchmark_streams.py --dem USGS_1m_tile.tif --sizes 1000 2000 5000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from shapely.geometry import LineString
+
+from src.config import BREACH_MAX_DEPTH, BREACH_MAX_LENGTH, DEM_PATH
+from src.stencil import DC, DR
+from src.streams import (
+    _breach_depressions, _fill_sinks, _flow_accumulation, _flow_direction_d8, _resolve_flats,
+    _stream_network,
+)
+
+
+def _legacy_fill_sinks(dem: np.ndarray, nodata: float | None) -> np.ndarray:
+    """Previous _fill_sinks: raise single-cell pits, at most 50 full-raster passes."""
+    filled = dem.astype(np.float64, copy=True)
+    if nodata is not None:
+        mask = filled == nodata
+        filled[mask] = np.nan
+    rows, cols = filled.shape
+
+    for _ in range(50):
+        padded = np.pad(filled, 1, mode="constant", constant_values=np.inf)
+        min_nb = np.full_like(filled, np.inf)
+        for i in range(8):
+            nb = padded[1 + DR[i]:rows + 1 + DR[i], 1 + DC[i]:cols + 1 + DC[i]]
+            min_nb = np.minimum(min_nb, nb)
+        valid = ~np.isnan(filled)
+        pits = valid & (filled < min_nb) & (min_nb < np.inf)
+        if not np.any(pits):
+            break
+        filled[pits] = min_nb[pits]
+
+    if nodata is not None:
+        filled[mask] = nodata
+    return filled
+
+
+def _legacy_flow_accumulation(fdir: np.ndarray) -> tuple[np.ndarray, int]:
+    """Previous _flow_accumulation: level-synchronous BFS. Also returns the wave count."""
+    rows, cols = fdir.shape
+    n = rows * cols
+    flat_fdir = fdir.ravel()
+    r_all, c_all = np.mgrid[0:rows, 0:cols]
+    r_flat = r_all.ravel()
+    c_flat = c_all.ravel()
+    valid = flat_fdir >= 0
+    nr = r_flat + DR[np.clip(flat_fdir, 0, 7)]
+    nc = c_flat + DC[np.clip(flat_fdir, 0, 7)]
+    in_bounds = valid & (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+    target = np.full(n, -1, dtype=np.int64)
+    target[in_bounds] = nr[in_bounds] * cols + nc[in_bounds]
+
+    in_degree = np.zeros(n, dtype=np.int32)
+    np.add.at(in_degree, target[target >= 0], 1)
+    acc = np.ones(n, dtype=np.float64)
+    queue = np.where((in_degree == 0) & valid)[0]
+    waves = 0
+    while len(queue) > 0:
+        waves += 1
+        tgt = target[queue]
+        valid_q = tgt >= 0
+        if not np.any(valid_q):
+            break
+        valid_tgt = tgt[valid_q]
+        np.add.at(acc, valid_tgt, acc[queue[valid_q]])
+        np.add.at(in_degree, valid_tgt, -1)
+        candidates = np.unique(valid_tgt)
+        queue = candidates[in_degree[candidates] == 0]
+    return acc.reshape(rows, cols), waves
+
+
+def _legacy_trace_streams(fdir: np.ndarray, acc: np.ndarray, threshold: int,
+                          transform) -> list[LineString]:
+    """Previous _trace_streams: walk each head downstream one cell at a time."""
+    rows, cols = fdir.shape
+    stream_mask = acc >= threshold
+    visited = np.zeros((rows, cols), dtype=bool)
+
+    # Find stream heads: stream cells with no upstream stream neighbor flowing in
+    is_head = stream_mask.copy()
+    for i in range(8):
+        opp = (i + 4) % 8  # opposite direction
+        padded_fdir = np.pad(fdir, 1, mode="constant", constant_values=-1)
+        padded_stream = np.pad(stream_mask, 1, mode="constant", constant_values=False)
+        # Neighbor in direction 'opp' from each cell
+        nb_fdir = padded_fdir[1 + DR[opp]:rows + 1 + DR[opp],
+                              1 + DC[opp]:cols + 1 + DC[opp]]
+        nb_stream = padded_stream[1 + DR[opp]:rows + 1 + DR[opp],
+                                  1 + DC[opp]:cols + 1 + DC[opp]]
+        # If that neighbor is a stream cell and flows toward us (direction i)
+        flows_in = nb_stream & (nb_fdir == i)
+        is_head[flows_in] = False
+
+    # Trace from each head
+    lines = []
+    head_rows, head_cols = np.where(is_head)
+    for start_r, start_c in zip(head_rows, head_cols):
+        if visited[start_r, start_c]:
+            continue
+        coords = []
+        cr, cc = int(start_r), int(start_c)
+        while (0 <= cr < rows and 0 <= cc < cols
+               and stream_mask[cr, cc] and not visited[cr, cc]):
+            x, y = transform * (cc + 0.5, cr + 0.5)
+            coords.append((x, y))
+            visited[cr, cc] = True
+            d = fdir[cr, cc]
+            if d < 0:
+                break
+            cr, cc = cr + int(DR[d]), cc + int(DC[d])
+        # Include junction point
+        if (0 <= cr < rows and 0 <= cc < cols
+                and stream_mask[cr, cc] and visited[cr, cc]):
+            x, y = transform * (cc + 0.5, cr + 0.5)
+            coords.append((x, y))
+        if len(coords) >= 2:
+            lines.append(LineString(coords))
+    return lines
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _read_window(dem_path: Path, size: int) -> tuple[np.ndarray, float | None]:
+    """Centred size x size window (clamped to the raster) as float64."""
+    with rasterio.open(dem_path) as src:
+        h, w = min(size, src.height), min(size, src.width)
+        window = Window((src.width - w) // 2, (src.height - h) // 2, w, h)
+        return src.read(1, window=window).astype(np.float64), src.nodata
+
+
+def _dead_ends(filled: np.ndarray, nodata: float | None) -> int:
+    """Interior valid cells with no D8 direction (flow stops there)."""
+    dem = filled if nodata is None else np.where(filled == nodata, np.nan, filled)
+    fdir = _flow_direction_d8(dem)
+    inner = ~np.isnan(dem[1:-1, 1:-1])
+    return int(((fdir[1:-1, 1:-1] == -1) & inner).sum())
+
+
+def bench_fill(dem: np.ndarray, nodata: float | None) -> None:
+    """Depression filling: previous pit fill vs priority-flood (exact and epsilon)."""
+    reference = None
+    for name, fn, kwargs in [
+        ("legacy pit fill", _legacy_fill_sinks, {}),
+        ("priority-flood", _fill_sinks, {}),
+        ("priority-flood+eps", _fill_sinks, {"epsilon": True}),
+    ]:
+        seconds, filled = _timed(fn, dem, nodata, **kwargs)
+        if reference is None:
+            reference = _fill_sinks(dem, nodata)
+        # Cells still below their spill level, i.e. inside an unfilled depression
+        unfilled = int((reference - filled > 1e-9).sum())
+        print(f"    {name:<20} {seconds:8.2f} s   unfilled cells {unfilled:>9}   "
+              f"dead ends {_dead_ends(filled, nodata):>9}")
+
+
+def bench_flats(dem: np.ndarray, nodata: float | None) -> None:
+    """Flat resolution on the priority-flood result (cells left without a direction)."""
+    filled = _fill_sinks(dem, nodata)
+    if nodata is not None:
+        filled[dem == nodata] = np.nan
+    fdir = _flow_direction_d8(filled)
+    seconds, resolved = _timed(_resolve_flats, filled, fdir)
+    inner = ~np.isnan(filled[1:-1, 1:-1])
+    before = int(((fdir[1:-1, 1:-1] == -1) & inner).sum())
+    after = int(((resolved[1:-1, 1:-1] == -1) & inner).sum())
+    print(f"    {'resolve flats':<20} {seconds:8.2f} s   dead ends {before:>9} -> {after}")
+
+
+def bench_conditioning(dem: np.ndarray, nodata: float | None) -> None:
+    """Fill vs breach: flat cells left for flat resolution, and routing time."""
+    for name, condition in [
+        ("fill", lambda: _fill_sinks(dem, nodata)),
+        ("breach", lambda: _breach_depressions(dem, nodata, BREACH_MAX_DEPTH, BREACH_MAX_LENGTH)),
+    ]:
+        start = time.perf_counter()
+        filled = condition()
+        if nodata is not None:
+            filled[dem == nodata] = np.nan
+        conditioned = time.perf_counter() - start
+        fdir = _flow_direction_d8(filled)
+        flat = int(((fdir == -1) & ~np.isnan(filled)).sum())
+        fdir = _resolve_flats(filled, fdir)
+        _flow_accumulation(fdir)
+        total = time.perf_counter() - start
+        changed = int((filled != dem)[~np.isnan(filled)].sum())
+        print(f"    {name:<20} {conditioned:8.2f} s   routing {total:6.2f} s   "
+              f"flat cells {flat:>9}   changed cells {changed:>9}")
+
+
+def _serpentine(rows: int, cols: int) -> np.ndarray:
+    """D8 grid whose cells form one path snaking row by row (worst case for waves)."""
+    fdir = np.full((rows, cols), 0, dtype=np.int8)
+    fdir[1::2] = 4
+    fdir[0::2, -1] = fdir[1::2, 0] = 2
+    fdir[-1, 0 if rows % 2 == 0 else -1] = -1
+    return fdir
+
+
+def bench_accumulation(fdir: np.ndarray) -> None:
+    """Flow accumulation: previous BFS waves vs one ordering + one sweep."""
+    legacy_s, (legacy, waves) = _timed(_legacy_flow_accumulation, fdir)
+    seconds, acc = _timed(_flow_accumulation, fdir)
+    same = "identical" if np.array_equal(acc, legacy) else "DIFFERENT"
+    print(f"    {'legacy BFS waves':<20} {legacy_s:8.2f} s   waves {waves:>9}")
+    print(f"    {'ordered sweep':<20} {seconds:8.2f} s   {same}")
+
+
+def bench_network(filled: np.ndarray, fdir: np.ndarray, threshold: int) -> None:
+    """Stream extraction: previous per-cell trace vs vectorized link network."""
+    acc = _flow_accumulation(fdir)
+    transform = rasterio.transform.from_origin(0, filled.shape[0], 1, 1)
+    legacy_s, lines = _timed(_legacy_trace_streams, fdir, acc, threshold, transform)
+    seconds, gdf = _timed(_stream_network, fdir, acc, filled, threshold, transform, None)
+    cells = int((acc >= threshold).sum())
+    print(f"    {'legacy trace':<20} {legacy_s:8.2f} s   lines {len(lines):>9}   stream cells {cells}")
+    print(f"    {'link network':<20} {seconds:8.2f} s   links {len(gdf):>9}   "
+          f"max Strahler {gdf['strahler'].max() if len(gdf) else 0}")
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Benchmark stream-delineation stages")
+    p.add_argument("--dem", type=Path, default=DEM_PATH, help="DEM GeoTIFF (default: assets DEM)")
+    p.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000],
+                   help="Window edge lengths in cells (default: 500 1000 2000)")
+    p.add_argument("--threshold", type=int, default=100,
+                   help="Stream threshold in cells for the extraction benchmark (default: 100)")
+    p.add_argument("--channel-sizes", type=int, nargs="*", default=[50, 100, 200],
+                   help="Edge lengths of synthetic one-path grids for accumulation "
+                        "(default: 50 100 200)")
+    args = p.parse_args()
+
+    for size in args.sizes:
+        dem, nodata = _read_window(args.dem, size)
+        print(f"\n{dem.shape[0]} x {dem.shape[1]} cells ({dem.size / 1e6:.1f} M) from {args.dem.name}")
+        print("  Fill:")
+        bench_fill(dem, nodata)
+        print("  Flats:")
+        bench_flats(dem, nodata)
+        print(f"  Conditioning (breach depth {BREACH_MAX_DEPTH:g}, length {BREACH_MAX_LENGTH}):")
+        bench_conditioning(dem, nodata)
+        print("  Accumulation:")
+        filled = _fill_sinks(dem, nodata)
+        if nodata is not None:
+            filled[dem == nodata] = np.nan
+        fdir = _resolve_flats(filled, _flow_direction_d8(filled))
+        bench_accumulation(fdir)
+        print(f"  Streams (threshold {args.threshold} cells):")
+        bench_network(filled, fdir, args.threshold)
+
+    for edge in args.channel_sizes:
+        print(f"\nSingle {edge} x {edge} serpentine channel ({edge * edge} cells on one path)")
+        print("  Accumulation:")
+        bench_accumulation(_serpentine(edge, edge))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
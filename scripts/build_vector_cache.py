@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Build (or refresh) the reprojected vector cache for the GOVTUNIT shapefiles.
+main.py does this automatically; run it on its own after updating assets.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.config import DEM_PATH, SHAPE_DIR, VECTOR_CACHE_DIR
+from src.vector_cache import build_vector_cache
+import rasterio
+
+
+def main() -> int:
+    with rasterio.open(DEM_PATH) as src:
+        dem_crs = src.crs
+    print(f"Building vector cache in {VECTOR_CACHE_DIR}...")
+    manifest = build_vector_cache(SHAPE_DIR, dem_crs, VECTOR_CACHE_DIR)
+    if manifest is None:
+        return 1
+    print(f"  {len(manifest['layers'])} layers up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
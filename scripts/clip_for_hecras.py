@@ -30,7 +30,7 @@ from src.validation import (
     validate_qgis_project,
     print_validation_summary,
 )
-from src.clipping import run_clip
+from src.clipping import run_clip_multi
 from src.qgis_project import write_qgis_project
 import rasterio
 
@@ -46,8 +46,11 @@ def main() -> None:
         dem_bounds = src.bounds
     validate_inputs(DEM_PATH, SHAPE_DIR, lat, lon, dem_crs, dem_bounds)
 
-    print("\n--- 200 m buffer (output/) ---")
-    run_clip(lat, lon, dem_crs, BUFFER_200M, OUTPUT_DIR, "200m")
+    print("\n--- 200 m buffer (output/), 100 m buffer (output/site_100m/) ---")
+    run_clip_multi(lat, lon, dem_crs, [
+        (BUFFER_200M, OUTPUT_DIR, "200m"),
+        (BUFFER_100M, QGIS_100M_DIR, "100m"),
+    ])
 
     dem_200_path = OUTPUT_DIR / "dem_clipped_200m.tif"
     buffer_200_path = OUTPUT_DIR / "site_buffer_200m.shp"
@@ -57,9 +60,6 @@ def main() -> None:
         "shapefiles": validate_shapefiles(OUTPUT_DIR, "200m"),
     }
 
-    print("\n--- 100 m buffer (output/site_100m/) ---")
-    run_clip(lat, lon, dem_crs, BUFFER_100M, QGIS_100M_DIR, "100m")
-
     dem_100 = QGIS_100M_DIR / "dem_clipped_100m.tif"
     buffer_100_path = QGIS_100M_DIR / "site_buffer_100m.shp"
     shp_100 = sorted(QGIS_100M_DIR.glob("*_clipped_100m.shp"))
@@ -2,7 +2,11 @@
 """
 Validate assets before processing.
 Run this first to ensure DEM and shapefiles are valid.
+
+    python scripts/validate_assets.py           # stored stats / overviews / block sample
+    python scripts/validate_assets.py --exact   # scan every DEM block
 """
+import argparse
 import sys
 from pathlib import Path
 
@@ -11,13 +15,19 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from src.validation import validate_asset_dem, validate_asset_shapefiles
-from src.config import DEM_PATH, SHAPE_DIR
+from src.config import DEM_PATH, DEM_VALIDATION_CACHE, SHAPE_DIR, VECTOR_CACHE_DIR
 
 
 def main() -> int:
+    p = argparse.ArgumentParser(description="Validate DEM and shapefile assets")
+    p.add_argument(
+        "--exact", action="store_true",
+        help="Check DEM data by scanning every block instead of stored stats/overviews/samples.",
+    )
+    args = p.parse_args()
     print("Validating assets...")
 
-    dem_result = validate_asset_dem(DEM_PATH)
+    dem_result = validate_asset_dem(DEM_PATH, exact=args.exact, cache_path=DEM_VALIDATION_CACHE)
     print(f"DEM: {'VALID' if dem_result['valid'] else 'INVALID'}")
     if not dem_result["valid"]:
         print(f"  Error: {dem_result.get('error')}")
@@ -25,8 +35,9 @@ def main() -> int:
     print(f"  CRS: {dem_result.get('crs')}")
     print(f"  Shape: {dem_result.get('shape')}")
     print(f"  Bounds: {dem_result.get('bounds')}")
+    print(f"  Has data: {dem_result.get('has_data')} (checked via {dem_result.get('data_check')})")
 
-    shp_result = validate_asset_shapefiles(SHAPE_DIR)
+    shp_result = validate_asset_shapefiles(SHAPE_DIR, VECTOR_CACHE_DIR)
     print(f"Shapefiles: {'VALID' if shp_result['valid'] else 'INVALID'}")
     print(f"  Found: {shp_result['count']}")
     print(f"  With CRS: {shp_result['with_crs']}")
@@ -0,0 +1,263 @@
+"""Batch mode: clip and delineate streams for many named sites in one run."""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+from pathlib import Path
+import csv
+import time
+import traceback
+
+import fiona
+import geopandas as gpd
+import rasterio
+from pyproj import Transformer
+
+from .clipping import clip_site_loaded
+from .config import BREACH_MAX_DEPTH, BREACH_MAX_LENGTH, DEM_PATH, HYDRO_CACHE_DIR, SHAPE_DIR
+from .streams import delineate_streams
+from .utils import bounds_in_crs, buffer_distance_meters
+from .vector_cache import cache_matches_crs, fresh_cache_entries, read_cached_layer
+
+SUMMARY_NAME = "batch_summary.csv"
+_SUMMARY_FIELDS = ["name", "lat", "lon", "status", "seconds", "error"]
+
+# Per-process resources, opened once by _init_worker and reused for every site
+_WORKER: dict = {}
+
+
+def _sites_bounds(sites: list[tuple[str, float, float]], dem_crs, buffer_m: int) -> tuple | None:
+    """Bounds in the DEM CRS of all sites, grown by buffer_m (None for no sites)."""
+    if not sites:
+        return None
+    _, lats, lons = zip(*sites)
+    xs, ys = Transformer.from_crs("EPSG:4326", dem_crs, always_xy=True).transform(lons, lats)
+    grow = buffer_distance_meters(dem_crs, buffer_m)
+    return (min(xs) - grow, min(ys) - grow, max(xs) + grow, max(ys) + grow)
+
+
+def _load_layers(
+    shape_dir: Path, dem_crs, cache_dir: Path | None, bounds: tuple | None,
+) -> list[tuple[str, gpd.GeoDataFrame]]:
+    """Load every layer with a CRS in the DEM CRS and build its spatial index.
+
+    Only features whose envelope touches bounds (DEM CRS; None = all) are
+    read, so each worker holds the part of the layers the sites can reach.
+    """
+    cached = {}
+    if cache_dir is not None and cache_matches_crs(dem_crs, cache_dir):
+        cached = fresh_cache_entries(shape_dir, cache_dir)
+    layers = []
+    for shp in sorted(shape_dir.glob("*.shp")):
+        entry = cached.get(shp.stem)
+        if entry is not None:
+            if not entry["has_crs"]:
+                continue
+            gdf = read_cached_layer(entry, bounds, cache_dir)
+        else:
+            with fiona.open(shp) as layer:
+                layer_crs = layer.crs_wkt
+            if not layer_crs:
+                continue
+            bbox = bounds_in_crs(bounds, dem_crs, layer_crs) if bounds is not None else None
+            gdf = gpd.read_file(shp, bbox=bbox).to_crs(dem_crs)
+        gdf.sindex  # built once here, reused by gpd.clip for every site
+        layers.append((shp.stem, gdf))
+    return layers
+
+
+def _init_worker(dem_path: Path, cache_dir: Path | None, bounds: tuple | None) -> None:
+    """Open the DEM, load the vector layers within bounds and build the CRS transformer."""
+    src = rasterio.open(dem_path)
+    _WORKER.update(
+        src=src,
+        layers=_load_layers(SHAPE_DIR, src.crs, cache_dir, bounds),
+        to_dem=Transformer.from_crs("EPSG:4326", src.crs, always_xy=True),
+    )
+
+
+def _site_clips(site_dir: Path, buffers_m: list[int]) -> list[tuple[int, Path, str]]:
+    """First buffer goes in the site folder, the others in site_<N>m/ below it."""
+    return [
+        (b, site_dir if k == 0 else site_dir / f"site_{b}m", f"{b}m")
+        for k, b in enumerate(buffers_m)
+    ]
+
+
+def _run_site(
+    name: str,
+    lat: float,
+    lon: float,
+    out_root: Path,
+    buffers_m: list[int],
+    stream_threshold: int | list[int] | None,
+    raster_profile: str = "gtiff",
+    stream_clip: bool = False,
+    stream_weights: Path | None = None,
+    stream_tile_size: int | None = None,
+    hydro_cache_dir: Path | None = HYDRO_CACHE_DIR,
+    stream_memory_gb: float | None = None,
+    stream_conditioning: str = "fill",
+    breach_depth: float = BREACH_MAX_DEPTH,
+    breach_length: int = BREACH_MAX_LENGTH,
+    stream_simplify: float | None = None,
+) -> dict:
+    """Process one site with the worker's shared resources.
+
+    Everything the site prints goes to <out_root>/<name>/batch.log so that
+    parallel sites do not interleave on the console.
+    """
+    start = time.perf_counter()
+    site_dir = out_root / name
+    site_dir.mkdir(parents=True, exist_ok=True)
+    src = _WORKER["src"]
+    status, error = "ok", ""
+    with open(site_dir / "batch.log", "w", encoding="utf-8") as log, redirect_stdout(log):
+        try:
+            x, y = _WORKER["to_dem"].transform(lon, lat)
+            b = src.bounds
+            if not (b.left <= x <= b.right and b.bottom <= y <= b.top):
+                raise ValueError(f"Site ({x:.0f}, {y:.0f}) is outside DEM bounds")
+            if next(src.sample([(x, y)], masked=True)).mask.all():
+                # e.g. a gap between the tiles of a multi-site mosaic
+                raise ValueError(f"Site ({x:.0f}, {y:.0f}) has no DEM data")
+            clips = _site_clips(site_dir, buffers_m)
+            clip_site_loaded(src, x, y, clips, _WORKER["layers"], raster_profile, stream_clip)
+            if stream_threshold is not None:
+                suffix = clips[0][2]
+                delineate_streams(
+                    site_dir / f"dem_clipped_{suffix}.tif",
+                    site_dir / f"streams_{suffix}.shp",
+                    threshold=stream_threshold,
+                    weights_path=stream_weights,
+                    tile_size=stream_tile_size,
+                    cache_dir=hydro_cache_dir,
+                    memory_limit_gb=stream_memory_gb,
+                    conditioning=stream_conditioning,
+                    breach_depth=breach_depth,
+                    breach_length=breach_length,
+                    simplify=stream_simplify,
+                )
+        except Exception as e:
+            traceback.print_exc(file=log)
+            status, error = "failed", str(e)
+    return {
+        "name": name,
+        "lat": lat,
+        "lon": lon,
+        "status": status,
+        "seconds": round(time.perf_counter() - start, 2),
+        "error": error,
+    }
+
+
+def run_batch(
+    sites: list[tuple[str, float, float]],
+    buffers_m: list[int],
+    out_root: Path,
+    stream_threshold: int | list[int] | None = None,
+    cache_dir: Path | None = None,
+    jobs: int = 1,
+    dem_path: Path = DEM_PATH,
+    raster_profile: str = "gtiff",
+    stream_clip: bool = False,
+    stream_weights: Path | None = None,
+    stream_tile_size: int | None = None,
+    hydro_cache_dir: Path | None = HYDRO_CACHE_DIR,
+    stream_memory_gb: float | None = None,
+    stream_conditioning: str = "fill",
+    breach_depth: float = BREACH_MAX_DEPTH,
+    breach_length: int = BREACH_MAX_LENGTH,
+    stream_simplify: float | None = None,
+) -> list[dict]:
+    """Clip (and optionally delineate streams for) many sites.
+
+    Each worker process opens the DEM, loads the vector layers and builds the
+    WGS84 -> DEM transformer once, then handles its share of the sites. Only
+    the features within the largest buffer of some site are loaded (the
+    bounds of all sites, grown by that buffer). Every
+    site gets its own folder under out_root; a summary of status and timing
+    per site is written to out_root/batch_summary.csv and returned.
+
+    Parameters
+    ----------
+    sites : (name, lat, lon) per site, e.g. from ``read_sites``.
+    buffers_m : Buffer radii; the first is written to the site folder, the
+        others to site_<N>m/ inside it.
+    out_root : Folder that receives one sub-folder per site.
+    stream_threshold : Run stream delineation on the first buffer's DEM
+        with this threshold (None = clipping only); a list writes one
+        streams layer per threshold from a single routing pass.
+    cache_dir : Vector cache to load layers from (see ``build_vector_cache``).
+    jobs : Worker processes (1 = run in this process).
+    dem_path : DEM to clip (e.g. a tile mosaic).
+    raster_profile : "gtiff" or "cog" for the clipped DEMs.
+    stream_clip : Clip the DEM tile by tile in bounded memory.
+    stream_weights : Weights raster for flow accumulation (see
+        ``delineate_streams``).
+    stream_tile_size : Delineate streams out of core in tiles of this size.
+    hydro_cache_dir : Cache of routed hydrology rasters for stream
+        delineation (None = route every site from scratch).
+    stream_memory_gb : Memory ceiling per stream delineation (per worker).
+    stream_conditioning : "fill" or "breach" depressions before routing;
+        breach_depth and breach_length limit the breach channels (see
+        ``delineate_streams``).
+    stream_simplify : Vertex-reduction tolerance for stream links, in CRS
+        units (None = one vertex per cell).
+    """
+    out_root.mkdir(parents=True, exist_ok=True)
+    run_one = partial(
+        _run_site,
+        out_root=out_root,
+        buffers_m=buffers_m,
+        stream_threshold=stream_threshold,
+        raster_profile=raster_profile,
+        stream_clip=stream_clip,
+        stream_weights=stream_weights,
+        stream_tile_size=stream_tile_size,
+        hydro_cache_dir=hydro_cache_dir,
+        stream_memory_gb=stream_memory_gb,
+        stream_conditioning=stream_conditioning,
+        breach_depth=breach_depth,
+        breach_length=breach_length,
+        stream_simplify=stream_simplify,
+    )
+    names, lats, lons = zip(*sites) if sites else ((), (), ())
+    with rasterio.open(dem_path) as src:
+        bounds = _sites_bounds(sites, src.crs, max(buffers_m))
+    results: list[dict] = []
+    if jobs > 1 and len(sites) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(sites)),
+            initializer=_init_worker,
+            initargs=(dem_path, cache_dir, bounds),
+        ) as pool:
+            for result in pool.map(run_one, names, lats, lons):
+                _print_site_result(result, len(results) + 1, len(sites))
+                results.append(result)
+    else:
+        _init_worker(dem_path, cache_dir, bounds)
+        try:
+            for result in map(run_one, names, lats, lons):
+                _print_site_result(result, len(results) + 1, len(sites))
+                results.append(result)
+        finally:
+            _WORKER.pop("src").close()
+
+    summary_path = out_root / SUMMARY_NAME
+    with summary_path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=_SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    ok = sum(r["status"] == "ok" for r in results)
+    total_s = sum(r["seconds"] for r in results)
+    print(f"  {ok}/{len(results)} sites succeeded ({total_s:.1f} s of site time)")
+    print(f"  Summary written: {summary_path}")
+    return results
+
+
+def _print_site_result(result: dict, n: int, total: int) -> None:
+    """One progress line per site."""
+    line = f"  [{n}/{total}] {result['name']}: {result['status']} ({result['seconds']:.1f} s)"
+    if result["error"]:
+        line += f" - {result['error']}"
+    print(line)
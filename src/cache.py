@@ -0,0 +1,38 @@
+"""On-disk cache helpers: source fingerprints and JSON manifests."""
+from pathlib import Path
+import json
+import os
+
+# Files that make up a shapefile; any change to them invalidates derived data
+_SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def file_fingerprint(path: Path) -> dict:
+    """Return {mtime_ns, size} for a file (cheap change detection)."""
+    st = path.stat()
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def shapefile_fingerprint(shp: Path) -> dict:
+    """Fingerprint every existing part of a shapefile, keyed by extension."""
+    return {
+        ext: file_fingerprint(shp.with_suffix(ext))
+        for ext in _SHAPEFILE_PARTS
+        if shp.with_suffix(ext).exists()
+    }
+
+
+def read_manifest(path: Path) -> dict:
+    """Load a JSON manifest; missing or unreadable manifests are empty."""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(path: Path, data: dict) -> None:
+    """Write a JSON manifest atomically (readers never see a partial file)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
@@ -1,79 +1,370 @@
 """Clipping: DEM and shapefiles to buffer."""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 import warnings
 
+import fiona
 import geopandas as gpd
 from shapely.geometry import Point, mapping
 import rasterio
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.io import MemoryFile
 from rasterio.mask import mask
+from rasterio.windows import Window
 
 from .config import DEM_PATH, SHAPE_DIR
-from .utils import buffer_distance_meters
+from .raster_io import copy_raster, write_raster
+from .utils import buffer_distance_meters, bounds_in_crs
+from .vector_cache import cache_matches_crs, fresh_cache_entries, read_cached_layer
 
+# Output tile edge (pixels) for streamed clips; one tile is in memory at a time
+STREAM_BLOCK_SIZE = 512
 
-def run_clip(
+
+def _write_clipped_layer(clipped: gpd.GeoDataFrame, out_shp: Path) -> None:
+    """Write a clipped layer as shapefile (datetimes as text, empty allowed)."""
+    for col in clipped.select_dtypes(include=["datetime64"]).columns:
+        clipped = clipped.assign(**{col: clipped[col].astype(str)})
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            "ignore",
+            message="You are attempting to write an empty DataFrame",
+            category=UserWarning,
+            module="geopandas",
+        )
+        clipped.to_file(out_shp, engine="fiona")
+
+
+def _write_site_buffers(
+    site_x: float,
+    site_y: float,
+    dem_crs,
+    clips: list[tuple[int, Path, str]],
+) -> tuple[list[gpd.GeoDataFrame], list[list[Path]]]:
+    """Buffer the (projected) site for each clip and write site_buffer_<suffix>.shp.
+
+    Returns the buffer frames and, per clip, the list of paths written so far.
+    """
+    site_proj = gpd.GeoSeries([Point(site_x, site_y)], crs=dem_crs)
+    buffer_gdfs = []
+    written: list[list[Path]] = []
+    for buffer_m, out_dir, suffix in clips:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        buffer_dist = buffer_distance_meters(dem_crs, buffer_m)
+        buffer_geom = site_proj.buffer(buffer_dist).iloc[0]
+        buffer_gdf = gpd.GeoDataFrame(geometry=[buffer_geom], crs=dem_crs)
+        buffer_gdfs.append(buffer_gdf)
+
+        buffer_path = out_dir / f"site_buffer_{suffix}.shp"
+        buffer_gdf.to_file(buffer_path)
+        written.append([buffer_path])
+        print(f"Buffer written: {buffer_path}")
+    return buffer_gdfs, written
+
+
+def _clip_order(clips: list[tuple[int, Path, str]]) -> list[int]:
+    """Clip indices by decreasing buffer radius (the first one encloses the rest)."""
+    return sorted(range(len(clips)), key=lambda i: clips[i][0], reverse=True)
+
+
+def _stream_clip(src, geom, out_path: Path, raster_profile: str = "gtiff") -> None:
+    """Clip an open raster to geom tile by tile, like mask(crop=True) but in bounded memory.
+
+    The output window and pixel mask match ``rasterio.mask.mask``; each tile
+    is read, masked against geom and written before the next one is read.
+    """
+    shapes = [mapping(geom)]
+    try:
+        window = geometry_window(src, shapes)
+    except WindowError:
+        raise ValueError("Input shapes do not overlap raster.")
+    nodata = src.nodata if src.nodata is not None else 0
+    meta = src.meta.copy()
+    meta.update({
+        "driver": "GTiff",
+        "height": int(window.height),
+        "width": int(window.width),
+        "transform": src.window_transform(window),
+        "tiled": True,
+        "blockxsize": STREAM_BLOCK_SIZE,
+        "blockysize": STREAM_BLOCK_SIZE,
+    })
+    # COGs can only be created by copying, so stream into a tiled GeoTIFF first
+    target = out_path if raster_profile == "gtiff" else out_path.with_suffix(".part.tif")
+    with rasterio.open(target, "w", **meta) as dst:
+        for _, block in dst.block_windows(1):
+            src_block = Window(
+                window.col_off + block.col_off, window.row_off + block.row_off,
+                block.width, block.height,
+            )
+            data = src.read(window=src_block, masked=True)
+            data.mask |= geometry_mask(
+                shapes, transform=dst.window_transform(block),
+                out_shape=(block.height, block.width),
+            )
+            dst.write(data.filled(nodata), window=block)
+    if target != out_path:
+        copy_raster(target, out_path, raster_profile)
+        target.unlink()
+
+
+def _clip_dem_streamed(
+    src,
+    buffer_gdfs: list[gpd.GeoDataFrame],
+    clips: list[tuple[int, Path, str]],
+    written: list[list[Path]],
+    raster_profile: str = "gtiff",
+) -> None:
+    """Stream the largest clip from src; stream the nested clips from that file."""
+    outer_path = None
+    for i in _clip_order(clips):
+        _, out_dir, suffix = clips[i]
+        clipped_dem_path = out_dir / f"dem_clipped_{suffix}.tif"
+        geom = buffer_gdfs[i].geometry.iloc[0]
+        if outer_path is None:
+            _stream_clip(src, geom, clipped_dem_path, raster_profile)
+            outer_path = clipped_dem_path
+        else:
+            with rasterio.open(outer_path) as outer:
+                _stream_clip(outer, geom, clipped_dem_path, raster_profile)
+        written[i].append(clipped_dem_path)
+        print(f"Clipped DEM written: {clipped_dem_path}")
+
+
+def _clip_dem(
+    src,
+    buffer_gdfs: list[gpd.GeoDataFrame],
+    clips: list[tuple[int, Path, str]],
+    written: list[list[Path]],
+    raster_profile: str = "gtiff",
+    stream: bool = False,
+) -> None:
+    """Mask an open DEM once to the largest buffer; derive the nested clips in memory."""
+    if stream:
+        _clip_dem_streamed(src, buffer_gdfs, clips, written, raster_profile)
+        return
+    order = _clip_order(clips)
+    largest = order[0]
+    outer_img, outer_transform = mask(
+        src, [mapping(buffer_gdfs[largest].geometry.iloc[0])], crop=True
+    )
+    outer_meta = src.meta.copy()
+    outer_meta.update({
+        "driver": "GTiff",  # src may be a VRT mosaic
+        "height": outer_img.shape[1],
+        "width": outer_img.shape[2],
+        "transform": outer_transform,
+    })
+
+    with MemoryFile() as memfile:
+        with memfile.open(**outer_meta) as mem:
+            mem.write(outer_img)
+        with memfile.open() as outer:
+            for i in order:
+                _, out_dir, suffix = clips[i]
+                if i == largest:
+                    clipped_img, clipped_meta = outer_img, outer_meta
+                else:
+                    clipped_img, clipped_transform = mask(
+                        outer, [mapping(buffer_gdfs[i].geometry.iloc[0])], crop=True
+                    )
+                    clipped_meta = outer_meta.copy()
+                    clipped_meta.update({
+                        "height": clipped_img.shape[1],
+                        "width": clipped_img.shape[2],
+                        "transform": clipped_transform,
+                    })
+                clipped_dem_path = out_dir / f"dem_clipped_{suffix}.tif"
+                write_raster(clipped_dem_path, clipped_img, clipped_meta, raster_profile)
+                written[i].append(clipped_dem_path)
+                print(f"Clipped DEM written: {clipped_dem_path}")
+
+
+def _clip_targets(
+    buffer_gdfs: list[gpd.GeoDataFrame],
+    clips: list[tuple[int, Path, str]],
+) -> list[tuple[int, gpd.GeoDataFrame, Path, str]]:
+    """(clip index, buffer, out_dir, suffix) per clip, largest buffer first."""
+    return [(i, buffer_gdfs[i], clips[i][1], clips[i][2]) for i in _clip_order(clips)]
+
+
+def _clip_to_targets(
+    stem: str,
+    gdf: gpd.GeoDataFrame,
+    targets: list[tuple[int, gpd.GeoDataFrame, Path, str]],
+) -> tuple[list[tuple[int, Path]], list[str]]:
+    """Clip a layer (already in the DEM CRS) to every target and write the results.
+
+    Returns ``(written, log_lines)`` where written holds ``(clip index, path)``.
+    """
+    written: list[tuple[int, Path]] = []
+    lines: list[str] = []
+    # targets[0] is the largest buffer; the others are clipped from its result
+    outer_clip = gpd.clip(gdf, targets[0][1])
+    for n, (i, buffer_gdf, out_dir, suffix) in enumerate(targets):
+        clipped = outer_clip if n == 0 else gpd.clip(outer_clip, buffer_gdf)
+        if clipped.empty:
+            lines.append(f"  {stem}: no features in buffer (empty clip)")
+        out_shp = out_dir / f"{stem}_clipped_{suffix}.shp"
+        _write_clipped_layer(clipped, out_shp)
+        written.append((i, out_shp))
+        lines.append(f"Clipped shapefile written: {out_shp}")
+    return written, lines
+
+
+def _clip_layer(
+    shp: Path,
+    entry: dict | None,
+    dem_crs,
+    outer_bounds: tuple,
+    targets: list[tuple[int, gpd.GeoDataFrame, Path, str]],
+    cache_dir: Path | None,
+) -> tuple[list[tuple[int, Path]], list[str]]:
+    """Read, reproject and clip one layer to every target buffer.
+
+    Runs in worker processes, so log lines are returned (not printed) and the
+    caller prints them in layer order. Returns ``(written, log_lines)`` where
+    written holds ``(clip index, path)`` pairs.
+    """
+    if entry is not None:
+        if not entry["has_crs"]:
+            return [], []
+        gdf = read_cached_layer(entry, outer_bounds, cache_dir)
+    else:
+        with fiona.open(shp) as layer:
+            layer_crs = layer.crs_wkt
+        if not layer_crs:
+            return [], []
+        # Only decode features whose envelope touches the buffer (layer's own CRS)
+        bbox = bounds_in_crs(outer_bounds, dem_crs, layer_crs)
+        gdf = gpd.read_file(shp, bbox=bbox)
+        gdf = gdf.to_crs(dem_crs)
+    return _clip_to_targets(shp.stem, gdf, targets)
+
+
+def _collect_layer_results(results, written: list[list[Path]]) -> None:
+    """Print per-layer log lines and record outputs, in layer order."""
+    for layer_written, lines in results:
+        for line in lines:
+            print(line)
+        for i, path in layer_written:
+            written[i].append(path)
+
+
+def clip_site_loaded(
+    src,
+    site_x: float,
+    site_y: float,
+    clips: list[tuple[int, Path, str]],
+    layers: list[tuple[str, gpd.GeoDataFrame]],
+    raster_profile: str = "gtiff",
+    stream: bool = False,
+) -> list[list[Path]]:
+    """Like ``run_clip_multi`` but with resources the caller keeps open.
+
+    Parameters
+    ----------
+    src : Open DEM dataset.
+    site_x, site_y : Site in the DEM CRS.
+    clips : One ``(buffer_m, out_dir, suffix)`` entry per buffer.
+    layers : ``(name, GeoDataFrame)`` per layer, already in the DEM CRS.
+    raster_profile : "gtiff" or "cog" for the clipped DEMs (see ``write_raster``).
+    stream : Clip the DEM tile by tile in bounded memory (see ``run_clip_multi``).
+
+    Returns the paths written for each entry of ``clips``, in the same order.
+    """
+    buffer_gdfs, written = _write_site_buffers(site_x, site_y, src.crs, clips)
+    _clip_dem(src, buffer_gdfs, clips, written, raster_profile, stream)
+    targets = _clip_targets(buffer_gdfs, clips)
+    _collect_layer_results(
+        (_clip_to_targets(stem, gdf, targets) for stem, gdf in layers), written,
+    )
+    return written
+
+
+def run_clip_multi(
     lat: float,
     lon: float,
     dem_crs,
-    buffer_m: int,
-    out_dir: Path,
-    suffix: str,
-) -> list[Path]:
-    """Clip DEM and shapefiles to buffer; write to out_dir. Returns paths written."""
-    out_dir.mkdir(parents=True, exist_ok=True)
-    written: list[Path] = []
+    clips: list[tuple[int, Path, str]],
+    cache_dir: Path | None = None,
+    jobs: int = 1,
+    dem_path: Path = DEM_PATH,
+    raster_profile: str = "gtiff",
+    stream: bool = False,
+) -> list[list[Path]]:
+    """Clip DEM and shapefiles to several buffers around one site in a single pass.
 
-    site_wgs84 = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326")
-    site_proj = site_wgs84.to_crs(dem_crs)
-    buffer_dist = buffer_distance_meters(dem_crs, buffer_m)
-    buffer_geom = site_proj.buffer(buffer_dist).iloc[0]
-    buffer_gdf = gpd.GeoDataFrame(geometry=[buffer_geom], crs=dem_crs)
+    The DEM window and every shapefile are read (and reprojected) once for the
+    largest buffer; the smaller, nested clips are derived from that in memory.
 
-    buffer_path = out_dir / f"site_buffer_{suffix}.shp"
-    buffer_gdf.to_file(buffer_path)
-    written.append(buffer_path)
-    print(f"Buffer written: {buffer_path}")
+    Parameters
+    ----------
+    lat, lon : Site in WGS84.
+    dem_crs : DEM coordinate reference system (buffers are built in it).
+    clips : One ``(buffer_m, out_dir, suffix)`` entry per buffer.
+    cache_dir : Vector cache (see ``build_vector_cache``). Layers with an
+        up-to-date entry are read from it instead of the shapefiles.
+    jobs : Worker processes for the per-layer read/clip/write (1 = serial).
+        Outputs and log lines are identical and in the same order either way.
+    dem_path : DEM to clip, e.g. a tile mosaic from ``write_site_mosaic``.
+    raster_profile : "gtiff" (same layout as the source) or "cog" (tiled,
+        compressed, with overviews) for the clipped DEMs.
+    stream : Read, mask and write the DEM clip in STREAM_BLOCK_SIZE tiles so
+        peak memory does not grow with the buffer radius. Pixel values match
+        the in-memory clip; the output GeoTIFF is tiled.
 
-    buffer_geom_for_mask = mapping(buffer_geom)
+    Returns the paths written for each entry of ``clips``, in the same order.
+    """
+    site_wgs84 = gpd.GeoSeries([Point(lon, lat)], crs="EPSG:4326")
+    site_proj = site_wgs84.to_crs(dem_crs)
+    buffer_gdfs, written = _write_site_buffers(
+        site_proj.x.iloc[0], site_proj.y.iloc[0], dem_crs, clips,
+    )
 
-    with rasterio.open(DEM_PATH) as src:
-        clipped_img, clipped_transform = mask(
-            src, [buffer_geom_for_mask], crop=True
-        )
-        clipped_meta = src.meta.copy()
-        clipped_meta.update({
-            "height": clipped_img.shape[1],
-            "width": clipped_img.shape[2],
-            "transform": clipped_transform,
-        })
-
-    clipped_dem_path = out_dir / f"dem_clipped_{suffix}.tif"
-    with rasterio.open(clipped_dem_path, "w", **clipped_meta) as dst:
-        dst.write(clipped_img)
-    written.append(clipped_dem_path)
-    print(f"Clipped DEM written: {clipped_dem_path}")
+    with rasterio.open(dem_path) as src:
+        _clip_dem(src, buffer_gdfs, clips, written, raster_profile, stream)
 
+    targets = _clip_targets(buffer_gdfs, clips)
+    outer_bounds = tuple(targets[0][1].total_bounds)
+    cached = {}
+    if cache_dir is not None and cache_matches_crs(dem_crs, cache_dir):
+        cached = fresh_cache_entries(SHAPE_DIR, cache_dir)
+    clip_one = partial(
+        _clip_layer,
+        dem_crs=dem_crs,
+        outer_bounds=outer_bounds,
+        targets=targets,
+        cache_dir=cache_dir,
+    )
     shp_paths = sorted(SHAPE_DIR.glob("*.shp"))
-    for shp in shp_paths:
-        gdf = gpd.read_file(shp)
-        if gdf.crs is None:
-            continue
-        gdf = gdf.to_crs(dem_crs)
-        clipped = gpd.clip(gdf, buffer_gdf)
-        if clipped.empty:
-            print(f"  {shp.stem}: no features in buffer (empty clip)")
-        for col in clipped.select_dtypes(include=["datetime64"]).columns:
-            clipped = clipped.assign(**{col: clipped[col].astype(str)})
-        out_shp = out_dir / f"{shp.stem}_clipped_{suffix}.shp"
-        with warnings.catch_warnings():
-            warnings.filterwarnings(
-                "ignore",
-                message="You are attempting to write an empty DataFrame",
-                category=UserWarning,
-                module="geopandas",
-            )
-            clipped.to_file(out_shp, engine="fiona")
-        written.append(out_shp)
-        print(f"Clipped shapefile written: {out_shp}")
+    entries = [cached.get(shp.stem) for shp in shp_paths]
+    if jobs > 1 and len(shp_paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(shp_paths))) as pool:
+            _collect_layer_results(pool.map(clip_one, shp_paths, entries), written)
+    else:
+        _collect_layer_results(map(clip_one, shp_paths, entries), written)
 
     return written
+
+
+def run_clip(
+    lat: float,
+    lon: float,
+    dem_crs,
+    buffer_m: int,
+    out_dir: Path,
+    suffix: str,
+    cache_dir: Path | None = None,
+    jobs: int = 1,
+    dem_path: Path = DEM_PATH,
+    raster_profile: str = "gtiff",
+    stream: bool = False,
+) -> list[Path]:
+    """Clip DEM and shapefiles to buffer; write to out_dir. Returns paths written."""
+    return run_clip_multi(
+        lat, lon, dem_crs, [(buffer_m, out_dir, suffix)], cache_dir, jobs, dem_path,
+        raster_profile, stream,
+    )[0]
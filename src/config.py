@@ -14,6 +14,29 @@ if not DEM_PATH.exists() and _DEM_GLOB:
 SHAPE_DIR = ASSETS_DIR / "GOVTUNIT_California_State_Shape" / "Shape"
 OUTPUT_DIR = PROJECT_ROOT / "output"
 QGIS_100M_DIR = OUTPUT_DIR / "site_100m"
+CACHE_DIR = PROJECT_ROOT / "cache"
+VECTOR_CACHE_DIR = CACHE_DIR / "vectors"
+HYDRO_CACHE_DIR = CACHE_DIR / "hydrology"
+DEM_CATALOG_PATH = CACHE_DIR / "dem_catalog.json"
+DEM_MOSAIC_PATH = CACHE_DIR / "dem_mosaic.vrt"
+DEM_VALIDATION_CACHE = CACHE_DIR / "dem_validation.json"
+
+# Tile edge (cells) for out-of-core stream delineation (--stream-tiles);
+# a tile needs roughly 1 GB of working memory at 2048
+HYDRO_TILE_SIZE = 2048
+# Peak working memory of stream delineation in bytes per cell: whole DEM in
+# memory with float32 elevations (float64 needs ~150), and per tile cell when
+# tiled. A --stream-memory ceiling picks between the two from these
+HYDRO_BYTES_PER_CELL = 130
+HYDRO_BYTES_PER_TILE_CELL = 260
+# Limits of --conditioning breach: deepest cut (DEM units, e.g. a road
+# embankment) and longest channel (cells) carved out of a depression.
+# Depressions that need more are filled instead
+BREACH_MAX_DEPTH = 3.0
+BREACH_MAX_LENGTH = 100
+# Tile edge (cells) for tiled contour generation; one float64 tile plus the
+# crossings traced in it is a few hundred MB at 1 m interval in steep terrain
+CONTOUR_TILE_SIZE = 2048
 
 BUFFER_200M = 200
 BUFFER_100M = 100
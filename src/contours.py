@@ -1,16 +1,368 @@
-"""Generate elevation contour lines from a DEM GeoTIFF."""
+"""Generate elevation contour lines from a DEM GeoTIFF.
+
+Contours are traced by a vectorized marching-squares pass (no plotting
+backend): every cell of four pixel centres that a level crosses gives one
+segment, or two at a saddle, and segments are joined into polylines where
+they share a crossing point. Cells with a nodata corner are skipped, so
+lines stop at the edge of nodata holes instead of being drawn across them.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import geopandas as gpd
 import numpy as np
 import rasterio
-from shapely.geometry import LineString
+from rasterio.windows import Window
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import shapely
+
+from .config import CONTOUR_TILE_SIZE
+from .simplify import simplify_lines
+
+
+def _case_table() -> tuple[np.ndarray, np.ndarray]:
+    """Directed segments (from edge, to edge) for each marching-squares case.
+
+    Corners of a cell clockwise from top-left are bits 0-3 of the case (set
+    = at or above the level); edge k joins corner k to corner k + 1: 0=top,
+    1=right, 2=bottom, 3=left. A segment runs from an edge where the
+    clockwise walk goes up through the level to one where it goes down, so
+    a shared edge ends the segment of one cell and starts the next cell's.
+    Index 16 + case is used at a saddle whose centre is above the level
+    (the high corners are joined instead of cut off). Unused slots are -1.
+    """
+    start = np.full((32, 2), -1, dtype=np.int8)
+    end = np.full((32, 2), -1, dtype=np.int8)
+    for case in range(16):
+        above = [bool(case >> k & 1) for k in range(4)]
+        ups = [k for k in range(4) if not above[k] and above[(k + 1) % 4]]
+        downs = [k for k in range(4) if above[k] and not above[(k + 1) % 4]]
+        for joined in (0, 1):
+            for i, up in enumerate(ups):
+                # next down edge clockwise cuts off the high corners; the
+                # previous one cuts off the low corners (centre above)
+                after = [d for d in downs if d > up] or downs
+                before = [d for d in downs if d < up] or downs
+                down = before[-1] if joined else after[0]
+                start[16 * joined + case, i] = up
+                end[16 * joined + case, i] = down
+    return start, end
+
+
+_SEG_START, _SEG_END = _case_table()
+
+
+def _list_rank(nxt: np.ndarray) -> np.ndarray:
+    """Steps from each node to the end of its chain (nxt = -1 at the end)."""
+    dist = (nxt >= 0).astype(np.int64)
+    jump = nxt.copy()
+    while True:
+        more = jump >= 0
+        if not more.any():
+            return dist
+        dist[more] += dist[jump[more]]
+        jump[more] = jump[jump[more]]
+
+
+def _chains(
+    src: np.ndarray, dst: np.ndarray, m: int, repeat_head: bool = True,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Order m nodes joined by links src -> dst (at most one in and out each) into chains.
+
+    Returns (node, part, head): every node once in drawing order, the chain
+    of each (sorted), and the first node of each chain. A chain with no
+    start (every node has a predecessor) is closed: it is opened before its
+    lowest node, which is repeated at the end if repeat_head.
+    """
+    nxt = np.full(m, -1, dtype=np.int64)
+    nxt[src] = dst
+    has_prev = np.zeros(m, dtype=bool)
+    has_prev[dst] = True
+    graph = coo_matrix((np.ones(len(src)), (src, dst)), shape=(m, m))
+    n_parts, part = connected_components(graph, directed=True, connection="weak")
+    del graph
+
+    is_open = np.zeros(n_parts, dtype=bool)
+    is_open[part[~has_prev]] = True
+    head = np.full(n_parts, m, dtype=np.int64)
+    np.minimum.at(head, part, np.arange(m))
+    closed_head = head[~is_open]
+    prev = np.empty(m, dtype=np.int64)
+    prev[dst] = src
+    nxt[prev[closed_head]] = -1
+    # Open chains start at the node with no predecessor, not their lowest one
+    start = np.flatnonzero(~has_prev)
+    head[part[start]] = start
+
+    rank = -_list_rank(nxt)  # the start of a chain has the most steps to go
+    node = np.arange(m)
+    if repeat_head:
+        node = np.concatenate([node, closed_head])
+        part = np.concatenate([part, part[closed_head]])
+        rank = np.concatenate([rank, np.ones(closed_head.size, dtype=np.int64)])
+    order = np.lexsort((rank, part))
+    return node[order], part[order], head
+
+
+def _marching_squares(
+    z: np.ndarray, levels: np.ndarray, return_edges: bool = False,
+) -> tuple[np.ndarray, ...]:
+    """Trace contour polylines of z (NaN = nodata) at sorted levels.
+
+    Returns (vertices, part, part_level): vertices are (row, col) positions
+    in pixel-centre units, in drawing order; part gives the line each vertex
+    belongs to (sorted); part_level the index into levels of each line.
+    Closed lines repeat their first vertex at the end. With return_edges,
+    also the cell edge each vertex lies on: horizontal edges numbered row
+    by row (rows x cols - 1), then vertical ones (rows - 1 x cols).
+    """
+    rows, cols = z.shape
+    empty = (np.empty((0, 2)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    empty += (np.empty(0, dtype=np.int64),) if return_edges else ()
+    if rows < 2 or cols < 2 or levels.size == 0:
+        return empty
+
+    corners = [z[:-1, :-1], z[:-1, 1:], z[1:, 1:], z[1:, :-1]]  # tl, tr, br, bl
+    lo = np.fmin(np.fmin(corners[0], corners[1]), np.fmin(corners[2], corners[3]))
+    hi = np.fmax(np.fmax(corners[0], corners[1]), np.fmax(corners[2], corners[3]))
+    cell = np.flatnonzero(~np.isnan(sum(corners)))  # no nodata corner
+    # Levels crossing a cell: lo < level <= hi, a contiguous run of levels
+    first = np.searchsorted(levels, lo.ravel()[cell], side="right")
+    count = np.searchsorted(levels, hi.ravel()[cell], side="right") - first
+    del lo, hi
+    cell, first = cell[count > 0], first[count > 0]
+    count = count[count > 0]
+    if cell.size == 0:
+        return empty
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    level_idx = np.repeat(first, count) + offset
+    cell = np.repeat(cell, count)
+    del first, count, offset
+
+    level = levels[level_idx]
+    value = np.stack([c.ravel()[cell] for c in corners], axis=1)  # (pairs, 4)
+    case = ((value >= level[:, None]) << np.arange(4)).sum(axis=1)
+    saddle = (case == 5) | (case == 10)
+    joined = np.zeros(cell.size, dtype=bool)
+    joined[saddle] = value[saddle].mean(axis=1) >= level[saddle]
+    table = case + 16 * joined
+
+    # One row per segment: the pair it came from and its two cell edges
+    second = _SEG_START[table, 1] >= 0
+    pair = np.concatenate([np.arange(cell.size), np.flatnonzero(second)])
+    slot = np.repeat([0, 1], [cell.size, int(second.sum())])
+    edges = np.stack([_SEG_START[table[pair], slot], _SEG_END[table[pair], slot]], axis=1)
+    del case, saddle, joined, table, second, slot
+
+    # Crossing point on each segment end, interpolated along the edge from
+    # its top or left corner, so both cells sharing an edge get the same point
+    r, c = np.divmod(cell[pair], cols - 1)
+    r, c = r[:, None], c[:, None]
+    a = np.array([0, 1, 3, 0])[edges]  # corner the edge is measured from
+    b = np.array([1, 2, 2, 3])[edges]
+    za = np.take_along_axis(value[pair], a, axis=1)
+    zb = np.take_along_axis(value[pair], b, axis=1)
+    t = (level[pair][:, None] - za) / (zb - za)
+    horizontal = edges % 2 == 0
+    vr = np.where(horizontal, r + (edges == 2), r + t)
+    vc = np.where(horizontal, c + t, c + (edges == 1))
+    # Global id of the edge, per level: horizontal edges, then vertical ones
+    n_h = rows * (cols - 1)
+    edge_id = np.where(
+        horizontal,
+        (r + (edges == 2)) * (cols - 1) + c,
+        n_h + r * cols + c + (edges == 1),
+    )
+    key = level_idx[pair][:, None] * (n_h + (rows - 1) * cols) + edge_id
+    del r, c, a, b, za, zb, t, horizontal, edge_id, value
+
+    keys, where, point = np.unique(key.ravel(), return_index=True, return_inverse=True)
+    point = point.reshape(-1, 2)
+    xy = np.stack([vr.ravel()[where], vc.ravel()[where]], axis=1)
+    point_level, point_edge = np.divmod(keys, n_h + (rows - 1) * cols)
+    del key, vr, vc, keys, where
+    m = xy.shape[0]
+
+    vertex, part, head = _chains(point[:, 0], point[:, 1], m)
+    # Lines by level, then in the order their points were found
+    line_level = point_level[head]
+    by_level = np.argsort(line_level, kind="stable")
+    renumber = np.empty(head.size, dtype=np.int64)
+    renumber[by_level] = np.arange(head.size)
+    part = renumber[part]
+    order = np.argsort(part, kind="stable")
+    vertex = vertex[order]
+    if return_edges:
+        return xy[vertex], part[order], line_level[by_level], point_edge[vertex]
+    return xy[vertex], part[order], line_level[by_level]
+
+
+def contour_lines(
+    dem: np.ndarray, levels: np.ndarray, transform,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Contour LineStrings of dem (NaN = nodata) in map coordinates, and their levels.
+
+    Vertices are placed between pixel centres, as for any raster contour.
+    """
+    levels = np.sort(np.asarray(levels, dtype=np.float64))
+    xy, part, part_level = _marching_squares(dem, levels)
+    if part.size == 0:
+        return np.empty(0, dtype=object), np.empty(0)
+    lines = shapely.linestrings(_to_map(xy, transform), indices=part)
+    keep = shapely.length(lines) > 0  # a level touching a single pixel centre
+    return lines[keep], levels[part_level][keep]
+
+
+def _to_map(xy: np.ndarray, transform) -> np.ndarray:
+    """(row, col) positions in pixel-centre units to map (x, y) coordinates."""
+    row, col = xy[:, 0] + 0.5, xy[:, 1] + 0.5
+    return np.stack([
+        transform.a * col + transform.b * row + transform.c,
+        transform.d * col + transform.e * row + transform.f,
+    ], axis=1)
+
+
+def _levels(zmin: float, zmax: float, interval: float) -> np.ndarray:
+    """Multiples of interval from below zmin up to zmax.
+
+    Computed as integer multiples, so tiles with different ranges get
+    bit-identical values for the levels they share.
+    """
+    return np.arange(np.floor(zmin / interval), np.floor(zmax / interval) + 1) * interval
+
+
+def _tiles(rows: int, cols: int, size: int):
+    """(r0, r1, c0, c1) of each tile; neighbours share one row or column of pixels."""
+    for r0 in range(0, max(rows - 1, 1), size):
+        for c0 in range(0, max(cols - 1, 1), size):
+            yield r0, min(r0 + size + 1, rows), c0, min(c0 + size + 1, cols)
+
+
+def _contour_tile(
+    dem_path: Path, tile: tuple[int, int, int, int], interval: float,
+    shape: tuple[int, int],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Contour one tile of the DEM: (vertices, part, elevation, ends) of its pieces.
+
+    Vertices are in pixel-centre units of the whole DEM (shape). ends holds
+    the first and last vertex of each piece as a key of its level (as a
+    multiple of interval) and the cell edge it lies on, numbered over the
+    whole DEM like _marching_squares does. A neighbour tile sharing the
+    seam row or column gives its crossing there the same key, however the
+    level meets the seam (e.g. exactly at a pixel centre).
+    """
+    r0, r1, c0, c1 = tile
+    with rasterio.open(dem_path) as src:
+        z = src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0)).astype(np.float64)
+        nodata = src.nodata
+    if nodata is not None:
+        z[z == nodata] = np.nan
+    if np.isnan(z).all():
+        return (np.empty((0, 2)), np.empty(0, dtype=np.int64), np.empty(0),
+                np.empty((0, 2), dtype=np.int64))
+    zmin = np.nanmin(z)
+    levels = _levels(zmin, np.nanmax(z), interval)
+    xy, part, part_level, edge = _marching_squares(z, levels, return_edges=True)
+    del z
+    xy += (r0, c0)
+
+    # Endpoint edges, from tile to DEM numbering
+    size = np.bincount(part, minlength=part_level.size)
+    first = np.cumsum(size) - size
+    edge = edge[np.stack([first, first + size - 1], axis=1)]
+    rows, cols = shape
+    h, w = r1 - r0, c1 - c0
+    vertical = edge >= h * (w - 1)
+    r, c = np.divmod(np.where(vertical, edge - h * (w - 1), edge), np.where(vertical, w, w - 1))
+    r, c = r + r0, c + c0
+    edge = np.where(vertical, rows * (cols - 1) + r * cols + c, r * (cols - 1) + c)
+    k = np.floor(zmin / interval).astype(np.int64) + part_level
+    ends = k[:, None] * (rows * (cols - 1) + (rows - 1) * cols) + edge
+    return xy, part, levels[part_level], ends
+
+
+def _merge_pieces(
+    pieces: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Join tile pieces whose end is another's start (same level and edge key).
+
+    Returns (vertices, part, elevation of each part) like a single tile.
+    Pieces keep their direction, so joined lines are directed as in an
+    untiled run; a chain of pieces that comes back to its start is closed.
+    """
+    xy = np.concatenate([p[0] for p in pieces])
+    if xy.shape[0] == 0:
+        return xy, np.empty(0, dtype=np.int64), np.empty(0)
+    # Number pieces globally; size and first vertex of each
+    shift = np.cumsum([0] + [p[2].size for p in pieces])
+    part = np.concatenate([p[1] + k for p, k in zip(pieces, shift)])
+    elevation = np.concatenate([p[2] for p in pieces])
+    ends = np.concatenate([p[3] for p in pieces])
+    n = elevation.size
+    size = np.bincount(part, minlength=n)
+    first = np.cumsum(size) - size
+
+    # Seam endpoints: open pieces only (a closed piece would join itself).
+    # A crossing is the end of at most one piece and the start of at most
+    # one, as in _marching_squares, so every match is unambiguous
+    opened = np.flatnonzero(ends[:, 0] != ends[:, 1])
+    src = dst = np.empty(0, dtype=np.int64)
+    if opened.size:
+        by_start = opened[np.argsort(ends[opened, 0])]
+        pos = np.searchsorted(ends[by_start, 0], ends[opened, 1]).clip(max=opened.size - 1)
+        linked = ends[by_start[pos], 0] == ends[opened, 1]
+        src, dst = opened[linked], by_start[pos[linked]]
+
+    piece, chain, head = _chains(src, dst, n, repeat_head=False)
+    # Vertices of each piece in chain order, dropping the first vertex of
+    # every piece but the first in its chain (it is the previous one's end)
+    joined = np.r_[False, chain[1:] == chain[:-1]]
+    start = first[piece] + joined
+    count = size[piece] - joined
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    vertex = np.repeat(start, count) + offset
+    return xy[vertex], np.repeat(chain, count), elevation[head]
+
+
+def contour_lines_tiled(
+    dem_path: Path, interval: float, tile_size: int = CONTOUR_TILE_SIZE, jobs: int = 1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Contour a DEM file tile by tile; same lines as ``contour_lines`` on the whole grid.
+
+    Each worker reads and contours one tile_size x tile_size window, so peak
+    memory is bounded by the tile, not the DEM. Pieces are then merged
+    across seams by level and the cell edge they end on (see ``_merge_pieces``).
+    """
+    with rasterio.open(dem_path) as src:
+        rows, cols = src.height, src.width
+        transform = src.transform
+    tiles = list(_tiles(rows, cols, tile_size))
+    contour_one = partial(_contour_tile, dem_path, interval=interval, shape=(rows, cols))
+    if jobs > 1 and len(tiles) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tiles))) as pool:
+            pieces = list(pool.map(contour_one, tiles))
+    else:
+        pieces = list(map(contour_one, tiles))
+
+    xy, part, elevation = _merge_pieces(pieces)
+    del pieces
+    if part.size == 0:
+        return np.empty(0, dtype=object), np.empty(0)
+    lines = shapely.linestrings(_to_map(xy, transform), indices=part)
+    keep = np.flatnonzero(shapely.length(lines) > 0)
+    keep = keep[np.argsort(elevation[keep], kind="stable")]  # by level, as untiled
+    return lines[keep], elevation[keep]
 
 
 def generate_contours(
     dem_path: Path,
     out_path: Path,
     interval: float = 1.0,
+    tile_size: int | None = None,
+    jobs: int = 1,
+    simplify: float | None = None,
 ) -> Path | None:
     """Generate contour lines from a DEM and save as shapefile.
 
@@ -19,48 +371,42 @@ def generate_contours(
     dem_path : Path to clipped DEM GeoTIFF.
     out_path : Path for output contours shapefile.
     interval : Contour interval in DEM vertical units (meters). Default 1 m.
+    tile_size : Contour in tiles of this edge (cells), e.g. CONTOUR_TILE_SIZE,
+        so memory is bounded for large DEMs. Lines are merged across tile
+        seams and match the untiled result. None = whole DEM in memory.
+    jobs : Worker processes for tiles (1 = serial). Only used with tile_size.
+    simplify : Reduce vertices to within this distance (CRS units) of the
+        traced line; contours of different elevation never cross (None = off).
 
     Returns the output path, or None if generation fails.
     """
-    from matplotlib import pyplot as plt
-
     with rasterio.open(dem_path) as src:
-        dem = src.read(1).astype(np.float64)
-        nodata = src.nodata
-        transform = src.transform
         crs = src.crs
+        if tile_size is None:
+            dem = src.read(1).astype(np.float64)
+            nodata = src.nodata
+            transform = src.transform
 
-    if nodata is not None:
-        dem[dem == nodata] = np.nan
-
-    valid = dem[~np.isnan(dem)]
-    if len(valid) == 0:
-        print("    No valid elevation data for contours.")
-        return None
-
-    zmin, zmax = np.nanmin(dem), np.nanmax(dem)
-    levels = np.arange(np.floor(zmin / interval) * interval, zmax + interval, interval)
-
-    rows, cols = dem.shape
-    # Build coordinate grids in map CRS
-    col_coords = np.arange(cols) * transform.a + transform.c + transform.a / 2
-    row_coords = np.arange(rows) * transform.e + transform.f + transform.e / 2
+    if tile_size is not None:
+        lines, elevations = contour_lines_tiled(dem_path, interval, tile_size, jobs)
+    else:
+        if nodata is not None:
+            dem[dem == nodata] = np.nan
 
-    fig, ax = plt.subplots()
-    cs = ax.contour(col_coords, row_coords, dem, levels=levels)
-    plt.close(fig)
+        if np.isnan(dem).all():
+            print("    No valid elevation data for contours.")
+            return None
 
-    lines = []
-    elevations = []
-    for level_idx, level_val in enumerate(cs.levels):
-        for path in cs.allsegs[level_idx]:
-            if len(path) >= 2:
-                lines.append(LineString(path))
-                elevations.append(float(level_val))
+        zmin, zmax = np.nanmin(dem), np.nanmax(dem)
+        levels = _levels(zmin, zmax, interval)
+        lines, elevations = contour_lines(dem, levels, transform)
+        del dem
 
-    if not lines:
+    if len(lines) == 0:
         print("    No contour lines generated.")
         return None
+    if simplify:
+        lines = simplify_lines(lines, simplify)
 
     gdf = gpd.GeoDataFrame(
         {"elevation": elevations},
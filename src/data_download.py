@@ -1,13 +1,75 @@
 """Download public GIS datasets (NHD streams, FEMA flood zones, parcels) via REST APIs."""
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import NamedTuple
+import http.client
 import json
-import urllib.request
+import threading
+import time
 import urllib.parse
 
-import geopandas as gpd
+import fiona
 from pyproj import Transformer
 from shapely.geometry import box
 
+_HEADERS = {"User-Agent": "HecRAS-GIS-Tool/1.0", "Connection": "keep-alive"}
+# Open connections per host at a time; further requests to the host wait
+# for one and reuse it instead of opening their own
+_CONNECTIONS_PER_HOST = 2
+_READ_CHUNK = 1 << 16
+# Shapefile field type of each ArcGIS field type; other fields (geometry,
+# blobs, rasters) are not written. Strings get the field's own length
+_FIELD_TYPES = {
+    "esriFieldTypeOID": "int",
+    "esriFieldTypeSmallInteger": "int",
+    "esriFieldTypeInteger": "int",
+    "esriFieldTypeBigInteger": "int",
+    "esriFieldTypeSingle": "float",
+    "esriFieldTypeDouble": "float",
+    "esriFieldTypeDate": "int",  # epoch milliseconds in GeoJSON output
+    "esriFieldTypeString": "str",
+    "esriFieldTypeGUID": "str",
+    "esriFieldTypeGlobalID": "str",
+}
+_GEOMETRY_TYPES = {
+    "esriGeometryPoint": "Point",
+    "esriGeometryMultipoint": "MultiPoint",
+    "esriGeometryPolyline": "LineString",
+    "esriGeometryPolygon": "Polygon",
+}
+_MAX_STR_WIDTH = 254  # dBASE limit
+# Object ids per request when a layer cannot page by resultOffset; keeps
+# the GET URL short
+_ID_BATCH = 500
+
+_NHD_URL = "https://hydro.nationalmap.gov/arcgis/rest/services/nhd/MapServer"
+
+
+class Dataset(NamedTuple):
+    """One ArcGIS REST layer fetched by ``download_all``."""
+    url: str        # MapServer URL
+    layer_id: int
+    label: str
+    filename: str   # shapefile written in out_dir
+    timeout: float  # seconds for the whole dataset: connection wait and every page
+
+
+# Keys and order of the download_all result
+DATASETS = {
+    "nhd_streams": Dataset(_NHD_URL, 6, "NHD Streams", "nhd_streams.shp", 30),
+    "nhd_waterbodies": Dataset(_NHD_URL, 3, "NHD Waterbodies", "nhd_waterbodies.shp", 30),
+    "nhd_catchments": Dataset(_NHD_URL, 10, "NHD Catchments", "nhd_catchments.shp", 30),
+    # NFHL answers slowly and parcel responses are large
+    "fema_flood_zones": Dataset(
+        "https://hazards.fema.gov/gis/nfhl/rest/services/public/NFHL/MapServer",
+        28, "FEMA Flood Zones", "fema_flood_zones.shp", 60,
+    ),
+    "parcels": Dataset(
+        "https://public.gis.lacounty.gov/public/rest/services/LACounty_Cache/LACounty_Parcel/MapServer",
+        0, "LA County Parcels", "parcels.shp", 60,
+    ),
+}
+
 
 def _bbox_wgs84(lat: float, lon: float, buffer_m: int) -> tuple[float, float, float, float]:
     """Return (xmin, ymin, xmax, ymax) in WGS84 around site, roughly buffer_m."""
@@ -17,9 +79,222 @@ def _bbox_wgs84(lat: float, lon: float, buffer_m: int) -> tuple[float, float, fl
     return (lon - deg_lon, lat - deg_lat, lon + deg_lon, lat + deg_lat)
 
 
+def _remaining(deadline: float) -> float:
+    """Seconds left until deadline (a time.monotonic() value); TimeoutError if none."""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("timed out")
+    return left
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, shared by threads and reused per host.
+
+    At most per_host requests to one host run at a time. A kept connection
+    the server has closed in the meantime is replaced transparently.
+    """
+
+    def __init__(self, per_host: int = _CONNECTIONS_PER_HOST):
+        self.per_host = per_host
+        self._idle: dict[tuple[str, str], list[http.client.HTTPConnection]] = {}
+        self._slots: dict[tuple[str, str], threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+    def _checkout(self, host: tuple[str, str], timeout: float):
+        """(connection, reused) for host, idle if there is one."""
+        with self._lock:
+            idle = self._idle.get(host)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        scheme, netloc = host
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def get(self, url: str, deadline: float) -> bytes:
+        """Body of a GET request; OSError on a network error or non-200 status.
+
+        deadline (a time.monotonic() value) bounds the wait for a connection
+        to the host and every read: TimeoutError once it has passed.
+        """
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        with self._lock:
+            slot = self._slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        if not slot.acquire(timeout=_remaining(deadline)):
+            raise TimeoutError("timed out waiting for a connection")
+        try:
+            while True:
+                conn, reused = self._checkout(host, _remaining(deadline))
+                try:
+                    conn.request("GET", target, headers=_HEADERS)
+                    sock = conn.sock  # kept: a closing response takes it from conn
+                    resp = conn.getresponse()
+                    chunks = []
+                    while chunk := resp.read(_READ_CHUNK):
+                        chunks.append(chunk)
+                        sock.settimeout(_remaining(deadline))
+                    body = b"".join(chunks)
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if reused:
+                        continue  # closed by the server while idle
+                    raise
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    raise
+                break
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle.setdefault(host, []).append(conn)
+        finally:
+            slot.release()
+        if resp.status != 200:
+            raise OSError(f"HTTP Error {resp.status}: {resp.reason}")
+        return body
+
+
+def _remove_shapefile(path: Path) -> None:
+    """Delete a (partly) written shapefile and its sidecar files."""
+    for ext in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+        path.with_suffix(ext).unlink(missing_ok=True)
+
+
+def _get_json(url: str, params: dict, deadline: float, pool: ConnectionPool) -> dict:
+    """Parsed JSON response; OSError on an error payload (sent with status 200)."""
+    data = json.loads(pool.get(f"{url}?{urllib.parse.urlencode(params)}", deadline))
+    if "error" in data:
+        error = data["error"]
+        raise OSError(f"server error {error.get('code')}: {error.get('message')}")
+    return data
+
+
+class _LayerInfo(NamedTuple):
+    """What ``_layer_info`` reads from a layer's ``?f=json`` description."""
+    schema: dict            # fiona schema of the shapefile
+    oid: str | None         # object-id field
+    paginated: bool         # supports resultOffset
+    max_records: int        # maxRecordCount
+
+
+def _field_type(field: dict) -> str:
+    """Shapefile type of an ArcGIS field; strings keep their length."""
+    kind = _FIELD_TYPES[field["type"]]
+    if kind == "str":
+        return f"str:{min(field.get('length') or _MAX_STR_WIDTH, _MAX_STR_WIDTH)}"
+    return kind
+
+
+def _layer_info(layer_url: str, deadline: float, pool: ConnectionPool) -> _LayerInfo:
+    """Schema, object-id field and paging support from a layer's description.
+
+    Every page is written with this schema, so field types and widths
+    follow the layer's field definitions, not the values that happen to
+    arrive first.
+    """
+    info = _get_json(layer_url, {"f": "json"}, deadline, pool)
+    fields = info.get("fields") or []
+    properties = {f["name"]: _field_type(f) for f in fields if f["type"] in _FIELD_TYPES}
+    oid = info.get("objectIdField") or next(
+        (f["name"] for f in fields if f["type"] == "esriFieldTypeOID"), None)
+    schema = {"geometry": _GEOMETRY_TYPES.get(info.get("geometryType"), "Unknown"),
+              "properties": properties}
+    # Servers before 10.3 do not describe it and do not page by resultOffset
+    paginated = bool((info.get("advancedQueryCapabilities") or {}).get("supportsPagination"))
+    return _LayerInfo(schema, oid, paginated, int(info.get("maxRecordCount") or 1000))
+
+
+def _feature_ids(features: list, oid: str | None) -> list:
+    """Object ids of GeoJSON features (the feature id if oid is not a property)."""
+    return [(f.get("properties") or {}).get(oid, f.get("id")) for f in features]
+
+
+def _pages(query_url: str, params: dict, deadline: float, pool: ConnectionPool,
+           oid: str | None = None):
+    """Feature lists of successive result pages of one query.
+
+    The server returns at most its maxRecordCount features per request and
+    flags exceededTransferLimit when there are more; the next page starts
+    at resultOffset = features so far. params should hold orderByFields so
+    that pages do not overlap or skip features. A page with the same object
+    ids as the one before (a server ignoring resultOffset) raises OSError.
+    One page is parsed at a time.
+    """
+    offset = 0
+    previous = None
+    while True:
+        page_params = dict(params, resultOffset=offset) if offset else params
+        data = _get_json(query_url, page_params, deadline, pool)
+        features = data.get("features") or []
+        more = data.get("exceededTransferLimit") or data.get("properties", {}).get("exceededTransferLimit")
+        del data
+        ids = _feature_ids(features, oid)
+        if features and ids == previous:
+            raise OSError(f"page at resultOffset {offset} repeats the previous one "
+                          "(server ignores resultOffset)")
+        previous = ids
+        yield features
+        if not (more and features):
+            return
+        offset += len(features)
+
+
+def _id_batches(query_url: str, params: dict, deadline: float, pool: ConnectionPool,
+                batch: int):
+    """Feature lists of one query for a layer that cannot page by resultOffset.
+
+    The matching object ids are fetched first (returnIdsOnly is not capped
+    by maxRecordCount), then their features batch ids at a time.
+    """
+    data = _get_json(query_url, dict(params, returnIdsOnly="true", f="json"), deadline, pool)
+    ids = sorted(data.get("objectIds") or [])
+    del data
+    for start in range(0, len(ids), batch):
+        chunk = ",".join(map(str, ids[start:start + batch]))
+        data = _get_json(query_url, dict(params, objectIds=chunk), deadline, pool)
+        features = data.get("features") or []
+        del data
+        yield features
+
+
 def _query_arcgis_rest(url: str, bbox_wgs84: tuple, layer_id: int,
-                       out_path: Path, label: str) -> Path | None:
-    """Query an ArcGIS REST MapServer layer and save as shapefile."""
+                       out_path: Path, label: str, timeout: float = 30,
+                       pool: ConnectionPool | None = None) -> Path | None:
+    """Query an ArcGIS REST MapServer layer and save as shapefile.
+
+    Results are fetched page by page (see ``_pages``, or ``_id_batches``
+    for layers without resultOffset support), so they are complete however
+    many features the area holds, and each page is appended to the
+    shapefile before the next is requested. Fields are typed from the
+    layer's definitions (see ``_layer_info``), the same for every page.
+    Requests go through pool (a fresh one if None), so queries to the same
+    host reuse its connections. timeout (seconds) covers the whole query:
+    waiting for a connection and all pages.
+    """
+    if pool is None:
+        with ConnectionPool() as pool:
+            return _query_arcgis_rest(url, bbox_wgs84, layer_id, out_path, label, timeout, pool)
+
+    deadline = time.monotonic() + timeout
     xmin, ymin, xmax, ymax = bbox_wgs84
     params = {
         "where": "1=1",
@@ -32,105 +307,114 @@ def _query_arcgis_rest(url: str, bbox_wgs84: tuple, layer_id: int,
         "returnGeometry": "true",
         "f": "geojson",
     }
-    query_url = f"{url}/{layer_id}/query?{urllib.parse.urlencode(params)}"
 
+    count = pages = 0
+    stage = "download"
     try:
-        req = urllib.request.Request(query_url, headers={"User-Agent": "HecRAS-GIS-Tool/1.0"})
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
+        layer = _layer_info(f"{url}/{layer_id}", deadline, pool)
+        if layer.oid:
+            params["orderByFields"] = layer.oid
+        query_url = f"{url}/{layer_id}/query"
+        if layer.paginated:
+            results = _pages(query_url, params, deadline, pool, layer.oid)
+        else:
+            batch = min(layer.max_records, _ID_BATCH)
+            results = _id_batches(query_url, params, deadline, pool, batch)
+        names = list(layer.schema["properties"])
+        stage = "save"
+        with fiona.open(out_path, "w", driver="ESRI Shapefile", crs="EPSG:4326",
+                        schema=layer.schema) as dst:
+            stage = "download"
+            for features in results:
+                if not features:
+                    break
+                stage = "save"
+                dst.writerecords(
+                    fiona.Feature.from_dict(
+                        geometry=f["geometry"],
+                        properties={n: (f.get("properties") or {}).get(n) for n in names},
+                    )
+                    for f in features
+                )
+                dst.flush()
+                count += len(features)
+                pages += 1
+                del features
+                stage = "download"
     except Exception as e:
-        print(f"    {label}: download failed ({e})")
+        _remove_shapefile(out_path)
+        print(f"    {label}: {stage} failed ({e})")
         return None
 
-    if "features" not in data or len(data["features"]) == 0:
+    if count == 0:
+        _remove_shapefile(out_path)
         print(f"    {label}: no features found in area")
         return None
+    print(f"    {label}: {count} features -> {out_path.name}"
+          + (f" ({pages} pages)" if pages > 1 else ""))
+    return out_path
 
-    try:
-        gdf = gpd.GeoDataFrame.from_features(data["features"], crs="EPSG:4326")
-        if gdf.empty:
-            print(f"    {label}: empty result")
-            return None
-        gdf.to_file(out_path)
-        print(f"    {label}: {len(gdf)} features -> {out_path.name}")
-        return out_path
-    except Exception as e:
-        print(f"    {label}: save failed ({e})")
-        return None
+
+def _download(name: str, lat: float, lon: float, buffer_m: int, out_path: Path,
+              pool: ConnectionPool | None = None) -> Path | None:
+    """Fetch one entry of DATASETS around the site into out_path."""
+    ds = DATASETS[name]
+    return _query_arcgis_rest(
+        ds.url, _bbox_wgs84(lat, lon, buffer_m), ds.layer_id, out_path, ds.label,
+        ds.timeout, pool,
+    )
 
 
 def download_nhd_streams(lat: float, lon: float, buffer_m: int,
                          out_path: Path) -> Path | None:
     """Download NHD flowlines (streams/rivers) from USGS National Map."""
-    bbox = _bbox_wgs84(lat, lon, buffer_m)
     # NHD MapServer: layer 6 = NHDFlowline
-    return _query_arcgis_rest(
-        "https://hydro.nationalmap.gov/arcgis/rest/services/nhd/MapServer",
-        bbox, 6, out_path, "NHD Streams",
-    )
+    return _download("nhd_streams", lat, lon, buffer_m, out_path)
 
 
 def download_fema_flood_zones(lat: float, lon: float, buffer_m: int,
                                out_path: Path) -> Path | None:
     """Download FEMA flood hazard zones from NFHL."""
-    bbox = _bbox_wgs84(lat, lon, buffer_m)
     # NFHL MapServer: layer 28 = Flood Hazard Zones (S_Fld_Haz_Ar)
-    return _query_arcgis_rest(
-        "https://hazards.fema.gov/gis/nfhl/rest/services/public/NFHL/MapServer",
-        bbox, 28, out_path, "FEMA Flood Zones",
-    )
+    return _download("fema_flood_zones", lat, lon, buffer_m, out_path)
 
 
 def download_parcels_la_county(lat: float, lon: float, buffer_m: int,
                                 out_path: Path) -> Path | None:
     """Download parcel boundaries from LA County Assessor."""
-    bbox = _bbox_wgs84(lat, lon, buffer_m)
-    return _query_arcgis_rest(
-        "https://public.gis.lacounty.gov/public/rest/services/LACounty_Cache/LACounty_Parcel/MapServer",
-        bbox, 0, out_path, "LA County Parcels",
-    )
+    return _download("parcels", lat, lon, buffer_m, out_path)
 
 
 def download_nhd_waterbodies(lat: float, lon: float, buffer_m: int,
                               out_path: Path) -> Path | None:
     """Download NHD waterbodies (lakes, ponds, reservoirs) from USGS."""
-    bbox = _bbox_wgs84(lat, lon, buffer_m)
     # NHD MapServer: layer 3 = NHDWaterbody
-    return _query_arcgis_rest(
-        "https://hydro.nationalmap.gov/arcgis/rest/services/nhd/MapServer",
-        bbox, 3, out_path, "NHD Waterbodies",
-    )
+    return _download("nhd_waterbodies", lat, lon, buffer_m, out_path)
 
 
 def download_nhd_catchments(lat: float, lon: float, buffer_m: int,
                              out_path: Path) -> Path | None:
     """Download NHDPlus catchment boundaries."""
-    bbox = _bbox_wgs84(lat, lon, buffer_m)
     # NHD MapServer: layer 10 = Catchment
-    return _query_arcgis_rest(
-        "https://hydro.nationalmap.gov/arcgis/rest/services/nhd/MapServer",
-        bbox, 10, out_path, "NHD Catchments",
-    )
+    return _download("nhd_catchments", lat, lon, buffer_m, out_path)
 
 
 def download_all(lat: float, lon: float, buffer_m: int,
-                 out_dir: Path) -> dict[str, Path | None]:
+                 out_dir: Path, jobs: int = len(DATASETS)) -> dict[str, Path | None]:
     """Download all available datasets for the site area.
 
+    Datasets are fetched concurrently in jobs threads over one
+    ConnectionPool, each with its own timeout (see DATASETS). Total time is
+    about that of the slowest service rather than the sum of all.
+
     Returns dict mapping dataset name to output path (or None if failed).
     """
     out_dir.mkdir(parents=True, exist_ok=True)
-    results = {}
-
-    results["nhd_streams"] = download_nhd_streams(
-        lat, lon, buffer_m, out_dir / "nhd_streams.shp")
-    results["nhd_waterbodies"] = download_nhd_waterbodies(
-        lat, lon, buffer_m, out_dir / "nhd_waterbodies.shp")
-    results["nhd_catchments"] = download_nhd_catchments(
-        lat, lon, buffer_m, out_dir / "nhd_catchments.shp")
-    results["fema_flood_zones"] = download_fema_flood_zones(
-        lat, lon, buffer_m, out_dir / "fema_flood_zones.shp")
-    results["parcels"] = download_parcels_la_county(
-        lat, lon, buffer_m, out_dir / "parcels.shp")
-
-    return results
+    names = list(DATASETS)
+    with ConnectionPool() as pool, ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        paths = executor.map(
+            lambda name: _download(name, lat, lon, buffer_m,
+                                   out_dir / DATASETS[name].filename, pool),
+            names,
+        )
+        return dict(zip(names, paths))
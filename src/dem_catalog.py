@@ -0,0 +1,172 @@
+"""DEM tile catalog: indexed tile bounds and virtual (VRT) mosaics per site."""
+from pathlib import Path
+import math
+import xml.etree.ElementTree as ET
+
+import rasterio
+from pyproj import CRS, Transformer
+from shapely import STRtree, box
+
+from .cache import file_fingerprint, read_manifest, write_manifest
+from .config import DEM_CATALOG_PATH
+from .utils import buffer_distance_meters
+
+# rasterio dtype -> GDAL VRT dataType
+_GDAL_TYPES = {
+    "uint8": "Byte",
+    "int8": "Int8",
+    "uint16": "UInt16",
+    "int16": "Int16",
+    "uint32": "UInt32",
+    "int32": "Int32",
+    "float32": "Float32",
+    "float64": "Float64",
+}
+_TILE_SUFFIXES = {".tif", ".tiff"}  # matched case-insensitively
+
+
+def _tile_entry(path: Path) -> dict:
+    """Header-only description of one tile."""
+    with rasterio.open(path) as src:
+        return {
+            "source": file_fingerprint(path),
+            "bounds": list(src.bounds),
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "res": list(src.res),
+            "shape": list(src.shape),
+            "dtype": src.dtypes[0],
+            "nodata": src.nodata,
+        }
+
+
+def build_dem_catalog(dem_dir: Path, catalog_path: Path = DEM_CATALOG_PATH) -> dict:
+    """Index the bounds of every GeoTIFF (.tif/.tiff, any case) under dem_dir.
+
+    Only tiles that are new or changed (mtime/size) are opened; the catalog
+    is persisted to catalog_path and returned. Tiles without a CRS, or whose
+    CRS differs from the first tile, are listed under "skipped".
+    """
+    catalog = read_manifest(catalog_path)
+    known = catalog.get("tiles", {}) if catalog.get("dem_dir") == str(dem_dir.resolve()) else {}
+    tiles = {}
+    skipped = []
+    crs_wkt = None
+    for path in sorted(p for p in dem_dir.rglob("*") if p.suffix.lower() in _TILE_SUFFIXES):
+        key = str(path.resolve())
+        entry = known.get(key)
+        if entry is None or entry["source"] != file_fingerprint(path):
+            entry = _tile_entry(path)
+        if entry["crs"] is None:
+            skipped.append(key)
+            continue
+        if crs_wkt is None:
+            crs_wkt = entry["crs"]
+        elif not CRS.from_wkt(entry["crs"]).equals(CRS.from_wkt(crs_wkt)):
+            skipped.append(key)
+            continue
+        tiles[key] = entry
+    catalog = {
+        "dem_dir": str(dem_dir.resolve()),
+        "crs": crs_wkt,
+        "tiles": tiles,
+        "skipped": skipped,
+    }
+    write_manifest(catalog_path, catalog)
+    return catalog
+
+
+def tiles_for_bounds(catalog: dict, bounds: tuple) -> list[tuple[str, dict]]:
+    """(path, entry) of the tiles whose extent intersects bounds, in catalog order."""
+    paths = list(catalog["tiles"])
+    if not paths:
+        return []
+    tree = STRtree([box(*catalog["tiles"][p]["bounds"]) for p in paths])
+    hits = sorted(tree.query(box(*bounds), predicate="intersects"))
+    return [(paths[i], catalog["tiles"][paths[i]]) for i in hits]
+
+
+def write_mosaic_vrt(catalog: dict, bounds: tuple, out_path: Path) -> Path:
+    """Write a VRT that mosaics only the tile windows intersecting bounds.
+
+    The VRT grid is the first intersecting tile's grid, expanded to cover
+    bounds; each tile contributes just its overlapping window (SrcRect ->
+    DstRect), so nothing is merged on disk and reads touch only those windows.
+    Raises ValueError if no tile covers bounds, the tiles' grids differ or
+    their data type has no VRT equivalent here.
+    """
+    tiles = tiles_for_bounds(catalog, bounds)
+    if not tiles:
+        raise ValueError(f"No DEM tile in the catalog intersects {tuple(round(b) for b in bounds)}")
+    ref = tiles[0][1]
+    res_x, res_y = ref["res"]
+    ref_left, ref_top = ref["bounds"][0], ref["bounds"][3]
+    for path, entry in tiles:
+        if (not math.isclose(entry["res"][0], res_x) or not math.isclose(entry["res"][1], res_y)
+                or entry["dtype"] != ref["dtype"]):
+            raise ValueError(f"Tile {path} has a different resolution or data type")
+    if ref["dtype"] not in _GDAL_TYPES:
+        raise ValueError(f"Tile {tiles[0][0]} has an unsupported data type ({ref['dtype']})")
+
+    # Snap the requested bounds outward onto the reference grid
+    left = ref_left + math.floor((bounds[0] - ref_left) / res_x) * res_x
+    top = ref_top - math.floor((ref_top - bounds[3]) / res_y) * res_y
+    width = math.ceil((bounds[2] - left) / res_x)
+    height = math.ceil((top - bounds[1]) / res_y)
+
+    root = ET.Element("VRTDataset", rasterXSize=str(width), rasterYSize=str(height))
+    ET.SubElement(root, "SRS").text = catalog["crs"]
+    ET.SubElement(root, "GeoTransform").text = f"{left!r}, {res_x!r}, 0.0, {top!r}, 0.0, {-res_y!r}"
+    band = ET.SubElement(root, "VRTRasterBand", dataType=_GDAL_TYPES[ref["dtype"]], band="1")
+    if ref["nodata"] is not None:
+        ET.SubElement(band, "NoDataValue").text = repr(ref["nodata"])
+
+    for path, entry in tiles:
+        t_left, t_bottom, t_right, t_top = entry["bounds"]
+        col_off = (t_left - left) / res_x
+        row_off = (top - t_top) / res_y
+        if abs(col_off - round(col_off)) > 1e-6 or abs(row_off - round(row_off)) > 1e-6:
+            raise ValueError(f"Tile {path} is not aligned to the mosaic grid")
+        col_off, row_off = round(col_off), round(row_off)
+        t_rows, t_cols = entry["shape"]
+        # Overlap of the tile with the mosaic, in mosaic pixel coordinates
+        c0, r0 = max(col_off, 0), max(row_off, 0)
+        c1, r1 = min(col_off + t_cols, width), min(row_off + t_rows, height)
+        if c1 <= c0 or r1 <= r0:
+            continue
+        source = ET.SubElement(band, "ComplexSource")
+        ET.SubElement(source, "SourceFilename", relativeToVRT="0").text = path
+        ET.SubElement(source, "SourceBand").text = "1"
+        ET.SubElement(
+            source, "SrcRect",
+            xOff=str(c0 - col_off), yOff=str(r0 - row_off),
+            xSize=str(c1 - c0), ySize=str(r1 - r0),
+        )
+        ET.SubElement(
+            source, "DstRect",
+            xOff=str(c0), yOff=str(r0), xSize=str(c1 - c0), ySize=str(r1 - r0),
+        )
+        if entry["nodata"] is not None:
+            # Tile nodata does not overwrite data from overlapping tiles
+            ET.SubElement(source, "NODATA").text = repr(entry["nodata"])
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    ET.ElementTree(root).write(out_path, encoding="utf-8")
+    return out_path
+
+
+def write_site_mosaic(
+    catalog: dict,
+    sites: list[tuple[float, float]],
+    buffer_m: int,
+    out_path: Path,
+) -> Path:
+    """Write a VRT covering buffer_m around every (lat, lon) site.
+
+    Several sites share one mosaic; only tiles touching the combined extent
+    are referenced, and only their windows inside it.
+    """
+    to_dem = Transformer.from_crs("EPSG:4326", catalog["crs"], always_xy=True)
+    dist = buffer_distance_meters(CRS.from_wkt(catalog["crs"]), buffer_m)
+    xs, ys = to_dem.transform([lon for _, lon in sites], [lat for lat, _ in sites])
+    bounds = (min(xs) - dist, min(ys) - dist, max(xs) + dist, max(ys) + dist)
+    return write_mosaic_vrt(catalog, bounds, out_path)
@@ -5,6 +5,8 @@ import shutil
 import rasterio
 from pyproj import CRS
 
+from .raster_io import copy_raster
+
 
 def _write_prj(crs, out_path: Path) -> None:
     """Write an ESRI-style .prj file from a CRS object."""
@@ -25,6 +27,7 @@ def export_for_hecras(
     streams_shp: Path | None,
     out_dir: Path,
     buffer_m: int,
+    raster_profile: str = "gtiff",
 ) -> None:
     """Copy terrain, projection, streams, and buffer into a HEC-RAS-ready folder.
 
@@ -35,12 +38,14 @@ def export_for_hecras(
     streams_shp : Delineated streams shapefile (or None).
     out_dir : Output directory for HEC-RAS package.
     buffer_m : Buffer distance used (for documentation).
+    raster_profile : "cog" converts terrain.tif to a Cloud-Optimized GeoTIFF
+        (unless the clipped DEM already is one); "gtiff" copies it as is.
     """
     out_dir.mkdir(parents=True, exist_ok=True)
 
     # 1) Terrain GeoTIFF
     terrain_dst = out_dir / "terrain.tif"
-    shutil.copy2(dem_path, terrain_dst)
+    copy_raster(dem_path, terrain_dst, raster_profile)
     print(f"    terrain.tif copied")
 
     # 2) Standalone .prj for RAS Mapper "Set Projection"
@@ -78,12 +83,16 @@ def export_for_hecras(
         f"  terrain.tif      - Clipped DEM (import as terrain in RAS Mapper)\n"
         f"  projection.prj   - ESRI projection file for RAS Mapper\n"
         f"  site_buffer.shp  - Study area boundary (reference layer)\n"
-        f"  streams.shp      - Delineated stream network (if available)\n\n"
+        f"  streams.shp      - Delineated stream network (if available): one line per\n"
+        f"                     link between confluences, drawn downstream, with\n"
+        f"                     ds_id (downstream link), strahler, shreve, up_area,\n"
+        f"                     length and slope\n\n"
         f"Import into HEC-RAS:\n"
         f"  1. Open RAS Mapper\n"
         f"  2. Project > Set Projection > browse to projection.prj\n"
         f"  3. Project > New Terrain > select terrain.tif\n"
-        f"  4. (Optional) Add streams.shp and site_buffer.shp as reference layers\n"
+        f"  4. (Optional) Add streams.shp and site_buffer.shp as reference layers;\n"
+        f"     trace river reaches along the higher-order (strahler) links\n"
         f"  5. Create 2D Flow Area covering the study area\n"
         f"  6. Set boundary conditions for flood return periods\n"
         f"     (1, 2, 5, 10, 25, 100, 200-year events)\n",
@@ -0,0 +1,139 @@
+"""
+Cache of routed hydrology rasters: filled DEM, D8 flow direction and flow
+accumulation.
+
+Entries live in one folder per key under cache/hydrology/. The key is a
+digest of the DEM's pixels and georeferencing, the weights raster (if any),
+the conditioning (fill, or the breach limits) and HYDRO_VERSION, so a
+rerun, or a re-clip that produces the same DEM, only repeats stream
+extraction. File times are not used: the clipped DEM is rewritten on every
+run.
+"""
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import rasterio
+from rasterio.errors import RasterioIOError
+from rasterio.windows import Window
+
+from .cache import read_manifest, write_manifest
+from .config import HYDRO_CACHE_DIR
+
+# Bump when fill, breaching, flow direction, flat resolution or accumulation
+# results change
+HYDRO_VERSION = 2
+META_NAME = "meta.json"
+_RASTERS = ("filled", "fdir", "acc")
+_BLOCK = 512
+
+
+def raster_digest(path: Path) -> str:
+    """SHA-256 of a raster's grid, CRS, nodata and pixel values (band 1)."""
+    h = hashlib.sha256()
+    with rasterio.open(path) as src:
+        h.update(json.dumps([
+            src.width, src.height, src.dtypes[0], repr(src.nodata),
+            src.crs.to_wkt() if src.crs else None, list(src.transform)[:6],
+        ]).encode())
+        for _, window in src.block_windows(1):
+            h.update(np.ascontiguousarray(src.read(1, window=window)).tobytes())
+    return h.hexdigest()
+
+
+def hydro_cache_key(dem_path: Path, weights_path: Path | None = None,
+                    dtype=np.float64, breach: tuple[float, int] | None = None) -> str:
+    """Cache key for routing dem_path (with optional weights) in dtype precision.
+
+    breach is the (max_depth, max_length) of breach conditioning, None for fill.
+    """
+    parts = {
+        "version": HYDRO_VERSION,
+        "dtype": np.dtype(dtype).name,
+        "breach": list(breach) if breach is not None else None,
+        "dem": raster_digest(dem_path),
+        "weights": raster_digest(weights_path) if weights_path is not None else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def _row_windows(height: int, width: int):
+    for row in range(0, height, _BLOCK):
+        yield Window(0, row, width, min(_BLOCK, height - row))
+
+
+def load_hydrology(key: str, cache_dir: Path = HYDRO_CACHE_DIR,
+                   scratch_dir: Path | None = None):
+    """Return cached (filled, fdir, acc) for key, or None on a miss.
+
+    Arrays are read into memory, or with scratch_dir copied block by block
+    into memory-mapped .npy files there (for DEMs larger than RAM).
+    """
+    entry = Path(cache_dir) / key
+    if read_manifest(entry / META_NAME).get("version") != HYDRO_VERSION:
+        return None
+    arrays = []
+    try:
+        for name in _RASTERS:
+            with rasterio.open(entry / f"{name}.tif") as src:
+                if scratch_dir is None:
+                    arrays.append(src.read(1))
+                    continue
+                out = np.lib.format.open_memmap(
+                    Path(scratch_dir) / f"{name}.npy", mode="w+", dtype=src.dtypes[0],
+                    shape=(src.height, src.width),
+                )
+                for window in _row_windows(src.height, src.width):
+                    rows = slice(window.row_off, window.row_off + window.height)
+                    out[rows] = src.read(1, window=window)
+                arrays.append(out)
+    except RasterioIOError:
+        return None
+    return tuple(arrays)
+
+
+def save_hydrology(key: str, filled, fdir, acc, transform, crs,
+                   cache_dir: Path = HYDRO_CACHE_DIR, source: Path | None = None) -> Path:
+    """Write (filled, fdir, acc) as tiled, compressed GeoTIFFs under cache_dir/key.
+
+    Rows are written in blocks so memory-mapped arrays are never loaded whole.
+    The entry is assembled in a temporary folder and renamed into place, so a
+    concurrent reader (e.g. another batch worker) never sees it half written.
+    """
+    cache_dir = Path(cache_dir)
+    entry = cache_dir / key
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{key}_", dir=cache_dir))
+    try:
+        for name, data in zip(_RASTERS, (filled, fdir, acc)):
+            height, width = data.shape
+            dtype = data.dtype.name
+            with rasterio.open(
+                tmp / f"{name}.tif", "w", driver="GTiff", width=width, height=height,
+                count=1, dtype=dtype, crs=crs, transform=transform,
+                nodata=-1 if dtype == "int8" else np.nan,
+                tiled=True, blockxsize=_BLOCK, blockysize=_BLOCK,
+                compress="deflate", predictor=2 if dtype == "int8" else 3,
+                BIGTIFF="IF_SAFER",
+            ) as dst:
+                for window in _row_windows(height, width):
+                    rows = slice(window.row_off, window.row_off + window.height)
+                    dst.write(np.asarray(data[rows]), 1, window=window)
+        write_manifest(tmp / META_NAME, {
+            "version": HYDRO_VERSION,
+            "source": str(source) if source is not None else None,
+        })
+        if entry.exists():
+            shutil.rmtree(entry)
+        os.replace(tmp, entry)
+    except OSError:
+        if not entry.exists():
+            raise
+        # Another process stored the same key first; its entry is identical
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return entry
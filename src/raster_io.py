@@ -0,0 +1,57 @@
+"""Raster output: plain GeoTIFF or Cloud-Optimized GeoTIFF (tiled, compressed, overviews)."""
+from pathlib import Path
+import shutil
+
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+import rasterio.shutil
+
+RASTER_PROFILES = ("gtiff", "cog")
+
+# COG creation options: 512 px internal tiles, DEFLATE with the predictor
+# matching the data type (floating point for DEMs), overviews down to one tile
+_COG_OPTIONS = {
+    "BLOCKSIZE": 512,
+    "COMPRESS": "DEFLATE",
+    "PREDICTOR": "YES",
+    "OVERVIEWS": "AUTO",
+    "OVERVIEW_RESAMPLING": "AVERAGE",
+    "NUM_THREADS": "ALL_CPUS",
+}
+
+
+def _is_cog(path: Path) -> bool:
+    """True if path was written with the COG layout."""
+    with rasterio.open(path) as src:
+        return src.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+
+
+def write_raster(path: Path, data: np.ndarray, meta: dict, profile: str = "gtiff") -> None:
+    """Write a (bands, rows, cols) array with meta using an output profile.
+
+    "gtiff" writes meta as given; "cog" writes a Cloud-Optimized GeoTIFF.
+    """
+    if profile not in RASTER_PROFILES:
+        raise ValueError(f"Unknown raster profile {profile!r} (expected one of {RASTER_PROFILES})")
+    meta = {**meta, "driver": "GTiff"}
+    if profile == "gtiff":
+        with rasterio.open(path, "w", **meta) as dst:
+            dst.write(data)
+        return
+    # The COG driver only supports CreateCopy, so stage the array in memory
+    with MemoryFile() as memfile:
+        with memfile.open(**meta) as mem:
+            mem.write(data)
+        with memfile.open() as mem:
+            rasterio.shutil.copy(mem, path, driver="COG", **_COG_OPTIONS)
+
+
+def copy_raster(src_path: Path, dst_path: Path, profile: str = "gtiff") -> None:
+    """Copy a raster file, converting it to a COG for the "cog" profile."""
+    if profile not in RASTER_PROFILES:
+        raise ValueError(f"Unknown raster profile {profile!r} (expected one of {RASTER_PROFILES})")
+    if profile == "gtiff" or _is_cog(src_path):
+        shutil.copy2(src_path, dst_path)
+        return
+    rasterio.shutil.copy(src_path, dst_path, driver="COG", **_COG_OPTIONS)
@@ -0,0 +1,66 @@
+"""D8 neighbourhood kernel shared by the hydrology code.
+
+Offsets and distances of the eight neighbours, and the eight shifted views
+of a grid padded by one cell. Padded grids and the halo windows of tiles
+are written by one kernel (window) into one buffer, which the caller may
+preallocate and reuse; the neighbours are views of it, so a loop over them
+allocates nothing.
+"""
+import numpy as np
+
+# D8 neighbor offsets: 0=E, 1=SE, 2=S, 3=SW, 4=W, 5=NW, 6=N, 7=NE
+DR = np.array([0, 1, 1, 1, 0, -1, -1, -1], dtype=np.int32)
+DC = np.array([1, 1, 0, -1, -1, -1, 0, 1], dtype=np.int32)
+DIST = np.array([1.0, 1.414, 1.0, 1.414, 1.0, 1.414, 1.0, 1.414])
+
+
+def window(arr: np.ndarray, r0: int, r1: int, c0: int, c1: int, fill,
+           width: int = 1, out: np.ndarray | None = None) -> np.ndarray:
+    """arr[r0-width:r1+width, c0-width:c1+width], with fill where it lies outside arr.
+
+    out, if given, receives the result, in any dtype arr can be cast to:
+    either of exactly that shape, or a 1-D buffer with at least as many
+    elements whose leading part is returned as the window. A buffer sized
+    for the largest tile serves every tile of a loop without allocating.
+    """
+    rows, cols = arr.shape
+    shape = (r1 - r0 + 2 * width, c1 - c0 + 2 * width)
+    if out is None:
+        out = np.empty(shape, dtype=arr.dtype)
+    elif out.shape != shape:
+        out = out[:shape[0] * shape[1]].reshape(shape)
+    a0, a1 = max(r0 - width, 0), min(r1 + width, rows)
+    b0, b1 = max(c0 - width, 0), min(c1 + width, cols)
+    i0, i1 = a0 - r0 + width, a1 - r0 + width
+    j0, j1 = b0 - c0 + width, b1 - c0 + width
+    out[:i0] = out[i1:] = fill
+    out[i0:i1, :j0] = out[i0:i1, j1:] = fill
+    out[i0:i1, j0:j1] = arr[a0:a1, b0:b1]
+    return out
+
+
+def pad(grid: np.ndarray, fill, out: np.ndarray | None = None) -> np.ndarray:
+    """grid inside a one-cell border of fill (the window of all of grid).
+
+    out is as for window: shape grid.shape + 2 on each axis, or a buffer
+    reused across calls.
+    """
+    return window(grid, 0, grid.shape[0], 0, grid.shape[1], fill, out=out)
+
+
+def shifted(padded: np.ndarray) -> list[np.ndarray]:
+    """The eight neighbour views of a padded grid, in D8 order.
+
+    View i holds, at each inner cell, the value of its neighbour in
+    direction i. They are views: no copies, and they see later writes.
+    """
+    rows, cols = padded.shape[0] - 2, padded.shape[1] - 2
+    return [
+        padded[1 + dr:rows + 1 + dr, 1 + dc:cols + 1 + dc]
+        for dr, dc in zip(DR.tolist(), DC.tolist())
+    ]
+
+
+def neighbours(grid: np.ndarray, fill, out: np.ndarray | None = None) -> list[np.ndarray]:
+    """Eight neighbour views of grid, with fill beyond its edges (pad, then shifted)."""
+    return shifted(pad(grid, fill, out))
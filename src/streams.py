@@ -1,157 +1,729 @@
 """Stream delineation from DEM using D8 flow routing (numpy-vectorized)."""
 from pathlib import Path
+import contextlib
+import tempfile
+import tracemalloc
 
 import geopandas as gpd
 import numpy as np
 import rasterio
-from shapely.geometry import LineString
+from rasterio.enums import Resampling
+from rasterio.warp import reproject
+from scipy import ndimage
+from scipy.sparse import coo_matrix, csc_matrix, csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components, minimum_spanning_tree
+from scipy.sparse.linalg import spsolve_triangular
+import shapely
+
+from .config import (
+    BREACH_MAX_DEPTH, BREACH_MAX_LENGTH, HYDRO_BYTES_PER_CELL, HYDRO_BYTES_PER_TILE_CELL,
+    HYDRO_CACHE_DIR,
+)
+from .hydro_cache import hydro_cache_key, load_hydrology, save_hydrology
+from .simplify import simplify_lines
+from .stencil import DC, DIST, DR, neighbours, pad, shifted
+
+
+@contextlib.contextmanager
+def _stage(label: str):
+    """Print a routing stage; while tracemalloc is tracing, also its peak memory.
+
+    tracemalloc sees numpy's allocations, i.e. all the large arrays.
+    """
+    print(f"    {label}...")
+    if not tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.reset_peak()
+    yield
+    print(f"      peak memory {tracemalloc.get_traced_memory()[1] / 2**20:,.0f} MB")
+
+
+@contextlib.contextmanager
+def _traced(enabled: bool):
+    """Run tracemalloc for the block (if enabled and not already running)."""
+    started = enabled and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def _index_dtype(n: int):
+    """int32 for flat indices below 2**31 (half the memory of int64), else int64."""
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+def _neighbor_edges(valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Flat indices (u, v) of every 8-connected pair of valid cells, each pair once."""
+    rows, cols = valid.shape
+    idx = np.arange(rows * cols, dtype=np.int32).reshape(rows, cols)
+    us, vs = [], []
+    for i in range(4):  # E, SE, S, SW; the other four give the same pairs reversed
+        dr, dc = int(DR[i]), int(DC[i])
+        r1, c0, c1 = rows - dr, max(0, -dc), cols - max(0, dc)
+        ok = valid[:r1, c0:c1] & valid[dr:r1 + dr, c0 + dc:c1 + dc]
+        us.append(idx[:r1, c0:c1][ok])
+        vs.append(idx[dr:r1 + dr, c0 + dc:c1 + dc][ok])
+    return np.concatenate(us), np.concatenate(vs)
+
+
+def _outlet_cells(valid: np.ndarray) -> np.ndarray:
+    """Valid cells on the raster edge or next to nodata (where water can leave)."""
+    touches = np.zeros_like(valid)
+    for nb in neighbours(~valid, True):
+        touches |= nb
+    return valid & touches
+
+
+def _flat_distance(level: np.ndarray, valid: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """8-connected BFS distance from sources, moving only between cells of equal level.
+
+    sources are flat indices; unreached cells get -1. One vectorized pass per
+    BFS ring, so the cost is O(n) plus a small overhead per ring.
+    """
+    rows, cols = level.shape
+    flat_level = level.ravel()
+    flat_valid = valid.ravel()
+    dist = np.full(rows * cols, -1, dtype=np.int32)
+    dist[sources] = 0
+    frontier = sources
+    d = 0
+    while frontier.size:
+        d += 1
+        r, c = np.divmod(frontier, cols)
+        ring = []
+        for i in range(8):
+            nr, nc = r + DR[i], c + DC[i]
+            inside = (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+            src = frontier[inside]
+            nb = nr[inside] * cols + nc[inside]
+            # A shift maps distinct cells to distinct neighbours, and cells
+            # claimed by an earlier direction fail dist < 0: no duplicates
+            take = flat_valid[nb] & (dist[nb] < 0) & (flat_level[nb] == flat_level[src])
+            nb = nb[take]
+            dist[nb] = d
+            ring.append(nb)
+        frontier = np.concatenate(ring)
+    return dist.reshape(rows, cols)
+
+
+def _flood_tree(z: np.ndarray, valid: np.ndarray, seeds: np.ndarray) -> np.ndarray:
+    """Parent of each cell on its priority-flood path to a seed (flat array).
+
+    The tree is the minimum spanning tree of the 8-neighbour graph (edge
+    weight = the higher endpoint; a virtual node joins every seed), so a
+    cell's path to the top crosses the lowest barrier between it and a
+    seed. Seeds and invalid cells are their own parent.
+    """
+    rows, cols = z.shape
+    n = rows * cols
+    zf = z.ravel()
+    flat_valid = valid.ravel()
+
+    # Graph over all cells plus a virtual outlet node n; weights are shifted
+    # to >= 1 because csgraph treats zero weight as "no edge"
+    u, v = _neighbor_edges(valid)
+    seeds = seeds.astype(np.int32)
+    base = float(zf[flat_valid].min()) - 1.0
+    weights = np.empty(u.size + seeds.size)  # float64 whatever z is: exact shift
+    np.maximum(zf[u], zf[v], out=weights[:u.size])
+    weights[u.size:] = zf[seeds]
+    weights -= base
+    heads = np.concatenate([u, np.full(seeds.size, n, dtype=np.int32)])
+    tails = np.concatenate([v, seeds])
+    del u, v
+    graph = coo_matrix((weights, (heads, tails)), shape=(n + 1, n + 1)).tocsr()
+    del weights, heads, tails
+    tree = minimum_spanning_tree(graph, overwrite=True)
+    del graph
+    _, pred = breadth_first_order(tree, n, directed=False, return_predecessors=True)
+    del tree
+    parent = pred[:n].astype(np.int32)
+    cell = np.arange(n, dtype=np.int32)
+    top = (parent < 0) | (parent == n)
+    parent[top] = cell[top]
+    return parent
+
+
+def _flood_levels(
+    z: np.ndarray, valid: np.ndarray, seeds: np.ndarray, parent: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Priority-flood levels from seed cells, and the seed each cell drains to.
+
+    z is a 2-D float grid, seeds are flat indices of valid cells where water
+    can leave. A cell's level is the lowest possible maximum elevation on a
+    path from it to a seed, which is what priority-flood computes. Here it is
+    evaluated for all cells at once: the running maximum down _flood_tree
+    from its virtual top node. O(n log n), no per-cell Python loop.
+
+    parent, if given, is a _flood_tree already built for these cells (e.g.
+    before z was lowered); levels are then the maximum of z along its paths.
+
+    Returns flat arrays (level, root): root is the seed at the top of each
+    cell's tree path (the cell itself for invalid cells).
+    """
+    zf = z.ravel()
+    flat_valid = valid.ravel()
+    if parent is None:
+        parent = _flood_tree(z, valid, seeds)
+
+    # Running max from the seeds by pointer jumping: after k rounds each
+    # cell holds the max over its 2**k nearest tree ancestors
+    level = np.full(zf.size, -np.inf, dtype=z.dtype)
+    level[flat_valid] = zf[flat_valid]
+    while True:
+        np.maximum(level, level[parent], out=level)
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+    return level, parent
 
 
-# D8 neighbor offsets: 0=E, 1=SE, 2=S, 3=SW, 4=W, 5=NW, 6=N, 7=NE
-_DR = np.array([0, 1, 1, 1, 0, -1, -1, -1], dtype=np.int32)
-_DC = np.array([1, 1, 0, -1, -1, -1, 0, 1], dtype=np.int32)
-_DIST = np.array([1.0, 1.414, 1.0, 1.414, 1.0, 1.414, 1.0, 1.414])
+def _fill_sinks(dem: np.ndarray, nodata: float | None, epsilon: bool = False) -> np.ndarray:
+    """Fill every depression to its spill elevation (priority-flood result).
 
+    Water can leave the DEM at the raster edge and at nodata cells; see
+    _flood_levels for how the levels are computed.
 
-def _fill_sinks(dem: np.ndarray, nodata: float | None) -> np.ndarray:
-    """Fill single-cell pits by raising them to the lowest neighbor."""
-    filled = dem.astype(np.float64, copy=True)
+    With epsilon=True, cells of each flat (filled depressions and natural
+    flats) are raised by 1 ulp per cell of distance from the flat's outlet,
+    so every cell has a strictly lower neighbour on its way out.
+    """
+    filled = dem.astype(np.promote_types(dem.dtype, np.float32), copy=True)
+    valid = ~np.isnan(filled)
     if nodata is not None:
-        mask = filled == nodata
-        filled[mask] = np.nan
+        valid &= filled != nodata
+    if not valid.any():
+        return filled
     rows, cols = filled.shape
+    level, _ = _flood_levels(filled, valid, np.flatnonzero(_outlet_cells(valid)))
+    filled = level.reshape(rows, cols)
+
+    if epsilon:
+        padded = pad(filled, np.inf)
+        padded[1:-1, 1:-1][~valid] = np.inf
+        has_lower = np.zeros_like(valid)
+        for nb in shifted(padded):
+            has_lower |= nb < filled
+        sources = np.flatnonzero(valid & (has_lower | _outlet_cells(valid)))
+        dist = _flat_distance(filled, valid, sources)
+        raise_by = np.where(dist > 0, dist, 0) * np.abs(np.spacing(filled))
+        filled = np.where(valid, filled + raise_by, filled)
+
+    filled[~valid] = dem[~valid] if nodata is None else nodata
+    return filled
 
-    for _ in range(50):  # iterate until stable
-        padded = np.pad(filled, 1, mode="constant", constant_values=np.inf)
-        min_nb = np.full_like(filled, np.inf)
-        for i in range(8):
-            nb = padded[1 + _DR[i]:rows + 1 + _DR[i], 1 + _DC[i]:cols + 1 + _DC[i]]
-            min_nb = np.minimum(min_nb, nb)
-        valid = ~np.isnan(filled)
-        pits = valid & (filled < min_nb) & (min_nb < np.inf)
-        if not np.any(pits):
-            break
-        filled[pits] = min_nb[pits]
 
-    if nodata is not None:
-        filled[mask] = nodata
-    return filled
+def _breach_depressions(
+    dem: np.ndarray, nodata: float | None, max_depth: float, max_length: int,
+) -> np.ndarray:
+    """Carve a channel out of each depression, and fill only what cannot be breached.
 
+    From every pit (a cell with no lower neighbour that is not an outlet)
+    the channel follows the pit's _flood_tree path, i.e. over the lowest
+    point of the barrier, and is lowered to the pit's elevation until the
+    path reaches lower ground or an outlet. The channel falls by a couple
+    of float steps per cell, so it drains without flats but cuts no deeper
+    than crossing the barrier needs, however far the ground drops beyond
+    it. A channel that would cut deeper than max_depth (DEM units) below
+    the terrain anywhere, or is longer than max_length cells, is not
+    carved. Pits are walked together, one vectorized step per cell of
+    channel length.
 
-def _flow_direction_d8(dem: np.ndarray) -> np.ndarray:
-    """Compute D8 flow direction (vectorized). Returns 0-7 or -1 for flat/nodata."""
+    Depressions left over are filled as _fill_sinks would, but only where
+    the carved DEM still has a cell above its flood-tree path: the tree is
+    reused, so breaching costs one tree build like a plain fill.
+
+    Returns the conditioned DEM (same float dtype as _fill_sinks).
+    """
+    z = dem.astype(np.promote_types(dem.dtype, np.float32), copy=True)
+    valid = ~np.isnan(z)
+    if nodata is not None:
+        valid &= z != nodata
+    if not valid.any():
+        return z
+    outlet = _outlet_cells(valid)
+    seeds = np.flatnonzero(outlet)
+    parent = _flood_tree(z, valid, seeds)
+    zf = z.ravel()
+
+    lowest = np.full(z.shape, np.inf, dtype=z.dtype)
+    for nb in neighbours(np.where(valid, z, np.inf), np.inf):
+        np.minimum(lowest, nb, out=lowest)
+    pit = (valid & ~outlet & (lowest >= z)).ravel()
+    del lowest
+    pits = np.flatnonzero(pit)
+    # A pit whose parent is a pit of the same elevation shares its channel
+    up = parent[pits]
+    pits = pits[~(pit[up] & (zf[up] == zf[pits]))]
+
+    floor = zf[pits]
+    end = floor.copy()  # elevation the channel drains to
+    cur = parent[pits]
+    length = np.zeros(pits.size, dtype=np.int32)
+    walking = np.ones(pits.size, dtype=bool)
+    cells, owners = [], []
+    for step in range(max_length + 1):
+        active = np.flatnonzero(walking)
+        at = cur[active]
+        below = zf[at] < floor[active]
+        walking[active[below]] = False  # reached lower ground: channel complete
+        end[active[below]] = zf[at[below]]
+        active, at = active[~below], at[~below]
+        if step == max_length or active.size == 0:
+            break
+        length[active] += 1
+        cells.append(at)
+        owners.append(active)
+        done = parent[at] == at  # an outlet: water leaves once it is lowered
+        walking[active[done]] = False
+        cur[active] = parent[at]
+    carved = ~walking
+
+    if cells:
+        # Channels ending at an outlet stay level; the rest fall by two float
+        # steps per cell, or evenly to their end if that is closer
+        steps = np.concatenate([
+            np.full(a.size, k + 1, dtype=np.int32) for k, a in enumerate(cells)
+        ])
+        cells, owners = np.concatenate(cells), np.concatenate(owners)
+        drop = np.minimum(
+            (floor - end) / (length + 1).astype(z.dtype), 2 * np.spacing(np.abs(floor)),
+        ).astype(z.dtype)
+        level = (floor[owners] - drop[owners] * steps).astype(z.dtype)
+        # Depth of the cut below the terrain, measured at the carved level
+        depth = np.zeros(pits.size, dtype=z.dtype)
+        np.maximum.at(depth, owners, zf[cells] - level)
+        carved &= depth <= max_depth
+        keep = carved[owners]
+        np.minimum.at(zf, cells[keep], level[keep])
+        del cells, owners, steps, drop, level, depth
+    print(f"    Breached {int(carved.sum())} of {pits.size} depressions "
+          f"(max depth {max_depth:g}, max length {max_length} cells)")
+
+    # A cell that is not above the highest point of its tree path drains
+    # without filling; the rest (depressions not breached) are filled from
+    # the draining cells around them, one connected patch at a time
+    path_max, _ = _flood_levels(z, valid, seeds, parent)
+    blocked = valid & (path_max > zf).reshape(z.shape)
+    del path_max, parent
+    if blocked.any():
+        touching = np.zeros_like(blocked)
+        for nb in neighbours(blocked, False):
+            touching |= nb
+        region = blocked | (valid & touching)
+        labels, _ = ndimage.label(region, structure=np.ones((3, 3)))
+        for k, window in enumerate(ndimage.find_objects(labels), start=1):
+            sub_region = labels[window] == k
+            sub_seeds = sub_region & (~blocked[window] | outlet[window])
+            level, _ = _flood_levels(z[window], sub_region, np.flatnonzero(sub_seeds))
+            sub_blocked = sub_region & blocked[window]
+            z[window][sub_blocked] = level.reshape(sub_region.shape)[sub_blocked]
+        print(f"    Filled {int(blocked.sum())} cells of depressions that were not breached")
+
+    z[~valid] = dem[~valid] if nodata is None else nodata
+    return z
+
+
+def _flow_direction_d8(dem: np.ndarray, padded: bool = False) -> np.ndarray:
+    """Compute D8 flow direction (vectorized). Returns 0-7 or -1 for flat/nodata.
+
+    Slopes are computed in dem's dtype (float32 halves the work arrays), into
+    one reused buffer; neighbours are stencil views. With padded=True, dem
+    already has a one-cell border (e.g. a tile with its halo) and directions
+    are returned for the cells inside it, without another padded copy.
+    """
+    nbs = shifted(dem) if padded else neighbours(dem, np.nan)
+    if padded:
+        dem = dem[1:-1, 1:-1]
     rows, cols = dem.shape
     fdir = np.full((rows, cols), -1, dtype=np.int8)
-    max_slope = np.zeros((rows, cols), dtype=np.float64)
-    padded = np.pad(dem, 1, mode="constant", constant_values=np.nan)
-
-    for i in range(8):
-        nb = padded[1 + _DR[i]:rows + 1 + _DR[i], 1 + _DC[i]:cols + 1 + _DC[i]]
-        slope = (dem - nb) / _DIST[i]
-        better = (~np.isnan(dem)) & (~np.isnan(nb)) & (slope > max_slope)
+    max_slope = np.zeros((rows, cols), dtype=dem.dtype)
+    slope = np.empty_like(max_slope)
+    better = np.empty((rows, cols), dtype=bool)
+
+    # NaN (nodata) on either side gives a NaN slope, which never compares greater
+    for i, nb in enumerate(nbs):
+        np.subtract(dem, nb, out=slope)
+        slope /= float(DIST[i])
+        np.greater(slope, max_slope, out=better)
         fdir[better] = i
-        max_slope[better] = slope[better]
+        np.copyto(max_slope, slope, where=better)
     return fdir
 
 
-def _flow_accumulation(fdir: np.ndarray) -> np.ndarray:
-    """Compute flow accumulation using vectorized topological sort."""
-    rows, cols = fdir.shape
+def _flat_edges(
+    dem: np.ndarray, fdir: np.ndarray, nb_dem: list[np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Masks (flat, low_edge, high_edge) for flat resolution.
+
+    flat: valid cells without a direction that are not outlets. low_edge:
+    draining cells next to a flat cell of the same elevation. high_edge:
+    flat cells next to higher ground. nb_dem: dem's neighbour views with
+    NaN beyond the edges, if the caller already has them.
+    """
+    valid = ~np.isnan(dem)
+    drains = (fdir >= 0) | _outlet_cells(valid)
+    flat = valid & ~drains
+    if nb_dem is None:
+        nb_dem = neighbours(dem, np.nan)
+    low_edge = np.zeros_like(flat)
+    high_edge = np.zeros_like(flat)
+    for nb, nb_flat in zip(nb_dem, neighbours(flat, False)):
+        low_edge |= drains & nb_flat & (nb == dem)
+        high_edge |= flat & (nb > dem)
+    return flat, low_edge, high_edge
+
+
+def _resolve_flats(dem: np.ndarray, fdir: np.ndarray) -> np.ndarray:
+    """Give flat cells (-1 from _flow_direction_d8) a direction across the flat.
+
+    Barnes et al. (2014): within each flat, BFS distance from its low edges
+    (same-elevation cells that already drain) is combined with the inverted
+    BFS distance from its high edges (flat cells next to higher ground) as
+    2 * toward + (max_away - away). Flow follows that mask downhill, so it
+    leaves the flat toward lower terrain and away from higher terrain, and
+    every step strictly decreases the mask (no loops). Cells on the DEM edge
+    or next to nodata (NaN) are outlets and keep -1. Returns a new array.
+    """
+    rows, cols = dem.shape
+    nb_dem = neighbours(dem, np.nan)
+    flat, low_edge, high_edge = _flat_edges(dem, fdir, nb_dem)
+    if not flat.any():
+        return fdir
+
+    toward = _flat_distance(dem, flat | low_edge, np.flatnonzero(low_edge))
+    away = _flat_distance(dem, flat, np.flatnonzero(high_edge))
+
+    # Largest away-distance per flat (flats = equal-elevation flat components)
+    u, v = _neighbor_edges(flat)
+    z = dem.ravel()
+    same = z[u] == z[v]
     n = rows * cols
-    flat_fdir = fdir.ravel()
-
-    # Build flat target array: cell → downstream cell index (or -1)
-    r_all, c_all = np.mgrid[0:rows, 0:cols]
-    r_flat = r_all.ravel()
-    c_flat = c_all.ravel()
-
-    valid = flat_fdir >= 0
-    nr = r_flat + _DR[np.clip(flat_fdir, 0, 7)]
-    nc = c_flat + _DC[np.clip(flat_fdir, 0, 7)]
-    in_bounds = valid & (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
-
-    target = np.full(n, -1, dtype=np.int64)
-    target[in_bounds] = nr[in_bounds] * cols + nc[in_bounds]
-
-    # Count in-degree for each cell
-    in_degree = np.zeros(n, dtype=np.int32)
-    valid_targets = target[target >= 0]
-    np.add.at(in_degree, valid_targets, 1)
-
-    # Topological sort with BFS
-    acc = np.ones(n, dtype=np.float64)
-    queue = np.where((in_degree == 0) & valid)[0]
-
-    while len(queue) > 0:
-        tgt = target[queue]
-        valid_q = tgt >= 0
-        if not np.any(valid_q):
-            break
-        valid_tgt = tgt[valid_q]
-        valid_acc = acc[queue[valid_q]]
-        np.add.at(acc, valid_tgt, valid_acc)
-        np.add.at(in_degree, valid_tgt, -1)
-        # Next batch: targets that now have in_degree 0
-        candidates = np.unique(valid_tgt)
-        queue = candidates[in_degree[candidates] == 0]
+    graph = coo_matrix((np.ones(int(same.sum()), dtype=np.int8), (u[same], v[same])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    labels = labels.reshape(rows, cols)
+    away_max = np.full(labels.max() + 1, -1, dtype=np.int32)
+    np.maximum.at(away_max, labels[flat], away[flat])
+
+    routable = flat & (toward > 0)  # flats with no low edge stay -1
+    mask = 2 * toward + np.where(away >= 0, away_max[labels] - away, 0)
+    key = np.where(routable, mask, np.where(low_edge, 0, np.iinfo(np.int32).max))
+    out = fdir.copy()
+    best = key.copy()
+    nb_keys = neighbours(key, np.iinfo(np.int32).max)
+    for i, (nb, nb_key) in enumerate(zip(nb_dem, nb_keys)):
+        better = routable & (nb == dem) & (nb_key < best)
+        out[better] = i
+        best[better] = nb_key[better]
+    return out
+
+
+def _flow_targets(fdir: np.ndarray) -> np.ndarray:
+    """Flat index of each cell's downstream cell (-1 where flow stops or leaves)."""
+    rows, cols = fdir.shape
+    index = _index_dtype(rows * cols)
+    d = fdir.ravel()
+    r, c = np.divmod(np.arange(rows * cols, dtype=index), index(cols))
+    step = np.clip(d, 0, 7)
+    nr, nc = r + DR[step].astype(index), c + DC[step].astype(index)
+    del r, c
+    inside = (d >= 0) & (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+    target = np.full(rows * cols, -1, dtype=index)
+    target[inside] = nr[inside] * index(cols) + nc[inside]
+    return target
+
+
+def _flow_accumulation(
+    fdir: np.ndarray, weights: np.ndarray | None = None, dtype=np.float64,
+) -> np.ndarray:
+    """Sum of weights over each cell and everything that drains into it.
+
+    weights defaults to 1 per cell (upstream cell count); pass e.g. a rainfall
+    or runoff-coefficient grid of the same shape for weighted accumulation
+    (NaN counts as 0). dtype=np.float32 halves the memory; sums are then
+    exact only up to 2**24 cells.
+
+    The flow tree is ordered once, outlets first (BFS from a virtual root
+    over upstream links). In that order each cell's downstream cell comes
+    before it, so acc[i] - acc[upstream of i] = weight[i] is an upper
+    triangular sparse system, solved by a single back substitution. O(n),
+    independent of how long the drainage paths are. Cells on a flow loop
+    (D8 with resolved flats never produces one) keep only their own weight.
+    """
+    n = fdir.size
+    w = np.ones(n, dtype=dtype) if weights is None else np.nan_to_num(
+        np.asarray(weights, dtype=dtype).ravel(), nan=0.0)
+    if w.size != n:
+        raise ValueError(f"weights shape {np.shape(weights)} does not match flow grid {fdir.shape}")
+    return _accumulate(_flow_targets(fdir), w).reshape(fdir.shape)
+
 
-    return acc.reshape(rows, cols)
+def _downstream_first(target: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Nodes ordered so each comes after its downstream node, and the target used.
 
+    target = downstream node or -1. Nodes on a loop are cut loose (target -1).
+    """
+    n = target.size
+    index = _index_dtype(n + 1)
+    # Upstream links plus virtual root n -> every node whose flow stops
+    tree = csr_matrix(
+        (np.ones(n, dtype=np.int8),
+         (np.where(target >= 0, target, n).astype(index, copy=False), np.arange(n, dtype=index))),
+        shape=(n + 1, n + 1),
+    )
+    order = breadth_first_order(tree, n, directed=True, return_predecessors=False)[1:]
+    if order.size < n:
+        looped = np.ones(n, dtype=bool)
+        looped[order] = False
+        target = np.where(looped, -1, target)
+        order = np.concatenate([order, np.flatnonzero(looped)])
+    return order, target
 
-def _trace_streams(fdir: np.ndarray, acc: np.ndarray, threshold: int,
-                   transform) -> list[LineString]:
-    """Trace stream lines from headwater cells downstream."""
+
+def _accumulate(target: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Sum w over each node and all nodes upstream; target = downstream node or -1.
+
+    The result has w's dtype (float32 or float64).
+    """
+    n = target.size
+    order, target = _downstream_first(target)
+    index = _index_dtype(2 * n)  # nonzeros of the system
+    pos = np.empty(n, dtype=index)
+    pos[order] = np.arange(n, dtype=index)
+
+    # CSC column j (cell order[j]): -1 at its downstream cell's row, 1 on the diagonal
+    down = target[order]
+    del target
+    links = down >= 0
+    indptr = np.zeros(n + 1, dtype=index)
+    np.cumsum(1 + links, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=index)
+    data = np.ones(indptr[-1], dtype=w.dtype)
+    first = indptr[:-1][links]
+    indices[first] = pos[down[links]]
+    data[first] = -1.0
+    indices[indptr[1:] - 1] = np.arange(n, dtype=index)
+    del pos, down, links, first
+    system = csc_matrix((data, indices, indptr), shape=(n, n))
+    del data, indices, indptr
+
+    acc = np.empty(n, dtype=w.dtype)
+    acc[order] = spsolve_triangular(
+        system, w[order], lower=False, unit_diagonal=True, overwrite_A=True, overwrite_b=True,
+    )
+    return acc
+
+
+def _stream_network(
+    fdir: np.ndarray, acc: np.ndarray, filled: np.ndarray, threshold: float, transform, crs,
+) -> gpd.GeoDataFrame:
+    """Stream links between confluences, with hydrologic attributes.
+
+    Stream cells have acc >= threshold. Every head (no stream cell flows in)
+    and every confluence (two or more flow in) starts a link, which follows
+    the flow to the cell above the next confluence and ends on that
+    confluence so the lines connect. Only the stream cells are touched and
+    all steps are array operations, except Strahler order (one loop over
+    links). fdir, acc and filled may be memory-mapped.
+
+    Columns: stream_id; ds_id (downstream link, -1 at an outlet); strahler;
+    shreve; up_area (acc at the link outlet x cell area, CRS units squared,
+    weighted when acc is); length (CRS units); slope (drop in filled
+    elevation over length).
+    """
     rows, cols = fdir.shape
-    stream_mask = acc >= threshold
-    visited = np.zeros((rows, cols), dtype=bool)
-
-    # Find stream heads: stream cells with no upstream stream neighbor flowing in
-    is_head = stream_mask.copy()
-    for i in range(8):
-        opp = (i + 4) % 8  # opposite direction
-        padded_fdir = np.pad(fdir, 1, mode="constant", constant_values=-1)
-        padded_stream = np.pad(stream_mask, 1, mode="constant", constant_values=False)
-        # Neighbor in direction 'opp' from each cell
-        nb_fdir = padded_fdir[1 + _DR[opp]:rows + 1 + _DR[opp],
-                              1 + _DC[opp]:cols + 1 + _DC[opp]]
-        nb_stream = padded_stream[1 + _DR[opp]:rows + 1 + _DR[opp],
-                                  1 + _DC[opp]:cols + 1 + _DC[opp]]
-        # If that neighbor is a stream cell and flows toward us (direction i)
-        flows_in = nb_stream & (nb_fdir == i)
-        is_head[flows_in] = False
-
-    # Trace from each head
-    lines = []
-    head_rows, head_cols = np.where(is_head)
-    for start_r, start_c in zip(head_rows, head_cols):
-        if visited[start_r, start_c]:
-            continue
-        coords = []
-        cr, cc = int(start_r), int(start_c)
-        while (0 <= cr < rows and 0 <= cc < cols
-               and stream_mask[cr, cc] and not visited[cr, cc]):
-            x, y = transform * (cc + 0.5, cr + 0.5)
-            coords.append((x, y))
-            visited[cr, cc] = True
-            d = fdir[cr, cc]
-            if d < 0:
-                break
-            cr, cc = cr + int(_DR[d]), cc + int(_DC[d])
-        # Include junction point
-        if (0 <= cr < rows and 0 <= cc < cols
-                and stream_mask[cr, cc] and visited[cr, cc]):
-            x, y = transform * (cc + 0.5, cr + 0.5)
-            coords.append((x, y))
-        if len(coords) >= 2:
-            lines.append(LineString(coords))
-    return lines
+    columns = ["stream_id", "ds_id", "strahler", "shreve", "up_area", "length", "slope"]
+    cells = np.flatnonzero(np.asarray(acc >= threshold).ravel())
+    if cells.size == 0:
+        return gpd.GeoDataFrame(columns=columns, geometry=[], crs=crs)
+    n = cells.size
+    node = np.arange(n)
+
+    # Downstream stream cell of each stream cell, as an index into cells
+    d = fdir.reshape(-1)[cells]
+    r, c = np.divmod(cells, cols)
+    step = np.clip(d, 0, 7)
+    nr, nc = r + DR[step], c + DC[step]
+    target = nr * cols + nc
+    pos = np.searchsorted(cells, target).clip(max=n - 1)
+    ok = (d >= 0) & (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols) & (cells[pos] == target)
+    down = np.where(ok, pos, -1)
+
+    # Heads and confluences start links; other cells have exactly one inflow
+    inflow = np.bincount(down[ok], minlength=n)
+    start = inflow != 1
+    up = node.copy()
+    up[down[ok]] = node[ok]
+    parent = np.where(start, node, up)
+    seq = (~start).astype(np.int64)  # position below the link's first cell
+    while True:
+        seq += seq[parent]
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            break
+        parent = jumped
+    link = (np.cumsum(start) - 1)[parent]
+    n_links = int(start.sum())
+
+    # First and last cell of each link, and the confluence it ends on
+    order = np.lexsort((seq, link))
+    breaks = np.flatnonzero(np.diff(link[order]))
+    first = order[np.concatenate([[0], breaks + 1])]
+    last = order[np.concatenate([breaks, [n - 1]])]
+    end = down[last]
+    ds = np.where(end >= 0, link[np.where(end >= 0, end, 0)], -1)
+
+    # Vertices: each link's cells in flow order, plus the confluence cell
+    closes = end >= 0
+    v_cell = np.concatenate([order, end[closes]])
+    v_link = np.concatenate([link[order], np.flatnonzero(closes)])
+    v_seq = np.concatenate([seq[order], seq[last[closes]] + 1])
+    v_order = np.lexsort((v_seq, v_link))
+    v_cell, v_link = v_cell[v_order], v_link[v_order]
+    v_row, v_col = r[v_cell] + 0.5, c[v_cell] + 0.5
+    xs = transform.a * v_col + transform.b * v_row + transform.c
+    ys = transform.d * v_col + transform.e * v_row + transform.f
+    same = v_link[1:] == v_link[:-1]
+    length = np.bincount(
+        v_link[1:][same], weights=np.hypot(np.diff(xs), np.diff(ys))[same], minlength=n_links,
+    )
+
+    outlet_cell = np.where(closes, end, last)
+    z = filled.reshape(-1)
+    drop = z[cells[first]] - z[cells[outlet_cell]]
+    area = acc.reshape(-1)[cells[last]].astype(np.float64) * abs(transform.a * transform.e - transform.b * transform.d)
+
+    shreve = _accumulate(ds, (inflow[first] == 0).astype(np.float64))
+    strahler = np.ones(n_links, dtype=np.int64)
+    top = [0] * n_links
+    count = [0] * n_links
+    ds_list = ds.tolist()
+    for k in _downstream_first(ds)[0][::-1].tolist():  # upstream links first
+        order_k = 1 if top[k] == 0 else top[k] + (count[k] >= 2)
+        strahler[k] = order_k
+        p = ds_list[k]
+        if p >= 0:
+            if order_k > top[p]:
+                top[p], count[p] = order_k, 1
+            elif order_k == top[p]:
+                count[p] += 1
+
+    # A link needs two vertices (a lone cell at an outlet has one); renumber
+    n_vertices = np.bincount(v_link, minlength=n_links)
+    keep = n_vertices >= 2
+    new_id = np.cumsum(keep) - 1
+    lines = shapely.linestrings(
+        np.column_stack([xs, ys])[keep[v_link]], indices=new_id[v_link[keep[v_link]]],
+    )
+    return gpd.GeoDataFrame(
+        {
+            "stream_id": np.arange(int(keep.sum())),
+            "ds_id": np.where((ds >= 0) & keep[np.where(ds >= 0, ds, 0)], new_id[ds], -1)[keep],
+            "strahler": strahler[keep],
+            "shreve": shreve[keep].astype(np.int64),
+            "up_area": area[keep],
+            "length": length[keep],
+            "slope": np.divide(drop, length, out=np.zeros(n_links), where=length > 0)[keep],
+        },
+        geometry=lines,
+        crs=crs,
+    )
+
+
+def _read_weights(
+    weights_path: Path, shape: tuple[int, int], transform, crs, dtype=np.float64,
+) -> np.ndarray:
+    """Weights raster resampled (bilinear) onto the DEM grid; nodata becomes NaN."""
+    weights = np.full(shape, np.nan, dtype=dtype)
+    with rasterio.open(weights_path) as src:
+        reproject(
+            rasterio.band(src, 1), weights,
+            dst_transform=transform, dst_crs=crs, dst_nodata=np.nan,
+            resampling=Resampling.bilinear,
+        )
+    return weights
+
+
+def _route_in_memory(
+    dem_path: Path, weights_path: Path | None, dtype=np.float64,
+    breach: tuple[float, int] | None = None,
+):
+    """Fill, D8, flats and accumulation with the whole DEM in memory.
+
+    Returns (filled, fdir, acc); filled has NaN for nodata. dtype (float64
+    or float32) is used for elevations, weights and accumulation. breach,
+    if given, is (max_depth, max_length): condition with
+    _breach_depressions instead of _fill_sinks.
+    """
+    with rasterio.open(dem_path) as src:
+        dem = src.read(1, out_dtype=dtype)
+        nodata = src.nodata
+        transform = src.transform
+        crs = src.crs
+
+    label = "Breaching depressions" if breach else "Filling depressions (priority-flood)"
+    with _stage(label):
+        if breach is not None:
+            filled = _breach_depressions(dem, nodata, *breach)
+        else:
+            filled = _fill_sinks(dem, nodata)
+        if nodata is not None:
+            filled[dem == nodata] = np.nan  # nodata is an outlet, not a downhill neighbour
+        del dem
+
+    with _stage("Computing flow direction (D8)"):
+        fdir = _flow_direction_d8(filled)
+
+    with _stage("Resolving flats"):
+        fdir = _resolve_flats(filled, fdir)
+
+    weights = None
+    if weights_path is not None:
+        print(f"    Reading weights: {Path(weights_path).name}")
+        weights = _read_weights(weights_path, filled.shape, transform, crs, dtype)
+
+    with _stage("Computing flow accumulation"):
+        acc = _flow_accumulation(fdir, weights, dtype)
+    return filled, fdir, acc
+
+
+def plan_tile_size(shape: tuple[int, int], memory_limit_gb: float) -> int | None:
+    """Tile size that keeps routing under memory_limit_gb, or None if the whole DEM fits.
+
+    Uses the measured peaks in config (float32 elevations in memory); tiles
+    are a multiple of 256 cells, at least 256.
+    """
+    limit = memory_limit_gb * 2**30
+    if shape[0] * shape[1] * HYDRO_BYTES_PER_CELL <= limit:
+        return None
+    return max(256, int((limit / HYDRO_BYTES_PER_TILE_CELL) ** 0.5) // 256 * 256)
+
+
+def threshold_path(out_path: Path, threshold: int) -> Path:
+    """Streams layer for one of several thresholds: streams_200m.shp -> streams_200m_t500.shp."""
+    out_path = Path(out_path)
+    return out_path.with_name(f"{out_path.stem}_t{threshold}{out_path.suffix}")
 
 
 def delineate_streams(
     dem_path: Path,
     out_path: Path,
-    threshold: int = 500,
-) -> Path | None:
+    threshold: int | list[int] = 500,
+    weights_path: Path | None = None,
+    tile_size: int | None = None,
+    cache_dir: Path | None = HYDRO_CACHE_DIR,
+    memory_limit_gb: float | None = None,
+    conditioning: str = "fill",
+    breach_depth: float = BREACH_MAX_DEPTH,
+    breach_length: int = BREACH_MAX_LENGTH,
+    simplify: float | None = None,
+) -> Path | None | dict[int, Path | None]:
     """Extract stream network from DEM and save as shapefile.
 
     Parameters
@@ -159,36 +731,94 @@ def delineate_streams(
     dem_path : Path to clipped DEM GeoTIFF.
     out_path : Path for output streams shapefile.
     threshold : Minimum flow accumulation (in cells) to define a stream.
-
-    Returns the output path, or None if no streams found.
+        With weights_path it is in weighted cells (sum of weights). A list
+        of thresholds routes the DEM once and writes one layer per
+        threshold, named by ``threshold_path``.
+    weights_path : Optional raster of per-cell weights (e.g. rainfall or
+        runoff coefficient), resampled onto the DEM grid.
+    tile_size : Process the DEM in tiles of this many cells per side, on
+        memory-mapped scratch files next to out_path, for DEMs larger
+        than RAM (None = whole DEM in memory). Same result either way.
+    cache_dir : Keep the filled DEM, flow direction and accumulation here,
+        keyed by the DEM and weights contents, so reruns and new thresholds
+        only repeat stream extraction (None = no cache).
+    memory_limit_gb : Memory-lean mode: route in float32 if the whole DEM
+        fits in this many GB, else in tiles sized to fit (unless tile_size
+        is given; tiles stay float64), and print the peak memory of each stage.
+    conditioning : "fill" raises every depression to its spill level.
+        "breach" first carves channels from depression bottoms through
+        their lowest barrier (e.g. road embankments), then fills what is
+        left; fewer and smaller flats. Needs the whole DEM in memory.
+    breach_depth : Deepest cut (DEM units) a breach channel may make.
+    breach_length : Longest breach channel, in cells.
+    simplify : Drop D8 staircase vertices to within this distance (CRS
+        units) of the cell path; links keep their end on the confluence and
+        do not cross. length and slope still follow the cells (None = off).
+
+    Returns the output path, or None if no streams found. For a list of
+    thresholds, a dict of the same per threshold.
     """
+    if conditioning not in ("fill", "breach"):
+        raise ValueError(f"conditioning must be 'fill' or 'breach', not {conditioning!r}")
+    breach = (float(breach_depth), int(breach_length)) if conditioning == "breach" else None
+    single = np.ndim(threshold) == 0
+    thresholds = [threshold] if single else list(dict.fromkeys(threshold))
     with rasterio.open(dem_path) as src:
-        dem = src.read(1).astype(np.float64)
-        nodata = src.nodata
         transform = src.transform
         crs = src.crs
-
-    print("    Filling sinks...")
-    filled = _fill_sinks(dem, nodata)
-
-    print("    Computing flow direction (D8)...")
-    fdir = _flow_direction_d8(filled)
-
-    print("    Computing flow accumulation...")
-    acc = _flow_accumulation(fdir)
-
-    print(f"    Extracting streams (threshold={threshold} cells)...")
-    lines = _trace_streams(fdir, acc, threshold, transform)
-
-    if not lines:
-        print("    No streams found at this threshold.")
-        return None
-
-    gdf = gpd.GeoDataFrame(
-        {"stream_id": range(len(lines))},
-        geometry=lines,
-        crs=crs,
+        shape = src.shape
+
+    lean = memory_limit_gb is not None
+    if lean and not tile_size:
+        tile_size = plan_tile_size(shape, memory_limit_gb)
+        print(f"    Memory limit {memory_limit_gb:g} GB: "
+              + (f"{tile_size} px tiles" if tile_size else "whole DEM in memory (float32)"))
+    if tile_size and breach:
+        raise ValueError("Breaching needs the whole DEM in memory; use fill with tiles")
+    dtype = np.float32 if lean and not tile_size else np.float64  # tiles work in float64
+
+    key = None
+    if cache_dir is not None:
+        key = hydro_cache_key(dem_path, weights_path, dtype, breach)
+    scratch_ctx = (
+        tempfile.TemporaryDirectory(prefix="hydro_", dir=Path(out_path).parent)
+        if tile_size else contextlib.nullcontext()
     )
-    gdf.to_file(out_path)
-    print(f"    Streams written: {out_path} ({len(lines)} segments)")
-    return out_path
+    with scratch_ctx as scratch, _traced(lean):
+        scratch = Path(scratch) if scratch else None
+        routed = load_hydrology(key, cache_dir, scratch) if key else None
+        if routed is not None:
+            print(f"    Filled DEM, flow direction and accumulation from cache ({key[:12]})")
+        else:
+            if tile_size:
+                from .tiled_hydrology import tiled_flow  # imports this module
+
+                routed = tiled_flow(dem_path, scratch, tile_size, weights_path)
+            else:
+                routed = _route_in_memory(dem_path, weights_path, dtype, breach)
+            if key:
+                save_hydrology(key, *routed, transform, crs, cache_dir, source=dem_path)
+        filled, fdir, acc = routed
+        networks = {}
+        for t in thresholds:
+            print(f"    Extracting streams (threshold={t} cells)...")
+            networks[t] = _stream_network(fdir, acc, filled, t, transform, crs)
+        del filled, fdir, acc, routed  # close any memory maps before the folder is removed
+
+    written = {}
+    for t, gdf in networks.items():
+        if gdf.empty:
+            print(f"    No streams found at threshold {t}." if not single
+                  else "    No streams found at this threshold.")
+            written[t] = None
+            continue
+        path = Path(out_path) if single else threshold_path(out_path, t)
+        if simplify:
+            gdf["geometry"] = gpd.GeoSeries(
+                simplify_lines(gdf.geometry.values, simplify), index=gdf.index, crs=crs,
+            )
+        gdf.to_file(path)
+        print(f"    Streams written: {path} ({len(gdf)} links, "
+              f"max Strahler order {gdf['strahler'].max()})")
+        written[t] = path
+    return written[threshold] if single else written
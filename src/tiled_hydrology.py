@@ -0,0 +1,394 @@
+"""Out-of-core D8 hydrology for DEMs larger than RAM.
+
+Fill, flow direction, flat resolution and flow accumulation run tile by tile
+on memory-mapped scratch arrays (.npy files in a scratch folder). Only one
+tile plus a small halo, and graphs over the cells where tiles meet, are held
+in memory. Results equal the in-memory stages in streams.py.
+"""
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components, minimum_spanning_tree
+
+from .stencil import DC, DR, window
+from .streams import (
+    _accumulate, _flat_edges, _flood_levels, _flow_accumulation, _flow_direction_d8,
+    _flow_targets, _neighbor_edges, _outlet_cells, _read_weights, _stage,
+)
+
+# Fill labels: cells draining to a real outlet (DEM edge / nodata) vs nodata
+_OCEAN = -1
+_NO_LABEL = -2
+
+
+def _tiles(rows: int, cols: int, size: int):
+    """(r0, r1, c0, c1) of each size x size tile, row by row."""
+    for r0 in range(0, rows, size):
+        for c0 in range(0, cols, size):
+            yield r0, min(r0 + size, rows), c0, min(c0 + size, cols)
+
+
+def _halo_buffer(arr: np.ndarray, size: int, h: int = 1) -> np.ndarray:
+    """Buffer for stencil.window of any size x size tile of arr with halo h.
+
+    One per array and stage; every tile's window is written into it.
+    """
+    return np.empty((size + 2 * h) ** 2, dtype=arr.dtype)
+
+
+def _scratch(scratch_dir: Path, name: str, dtype, shape: tuple[int, int]) -> np.memmap:
+    """New memory-mapped .npy array in scratch_dir."""
+    return np.lib.format.open_memmap(
+        scratch_dir / f"{name}.npy", mode="w+", dtype=dtype, shape=shape,
+    )
+
+
+def _min_per_pair(a: np.ndarray, b: np.ndarray, w: np.ndarray):
+    """Keep the smallest w for each distinct (a, b) pair."""
+    order = np.lexsort((w, b, a))
+    a, b, w = a[order], b[order], w[order]
+    first = np.ones(a.size, dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    return a[first], b[first], w[first]
+
+
+def _running_max(step: np.ndarray, parent: np.ndarray) -> np.ndarray:
+    """Max of step over each node and its tree ancestors (roots are their own parent)."""
+    value = step.copy()
+    while True:
+        np.maximum(value, value[parent], out=value)
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            return value
+        parent = jumped
+
+
+def _spill_levels(n: int, a: np.ndarray, b: np.ndarray, w: np.ndarray, root: int) -> np.ndarray:
+    """Minimax path weight from every node to root (-inf if unreachable).
+
+    a < b, and each (a, b) pair appears once.
+    """
+    base = w.min() - 1.0 if w.size else 0.0  # csgraph: zero weight = no edge
+    mst = minimum_spanning_tree(coo_matrix((w - base, (a, b)), shape=(n, n)).tocsr())
+    _, pred = breadth_first_order(mst, root, directed=False, return_predecessors=True)
+    node = np.arange(n, dtype=np.int64)
+    reached = pred >= 0
+    # Exact weight of each tree edge, looked up by pair (the shift is not exact)
+    lo = np.minimum(pred[reached], node[reached])
+    hi = np.maximum(pred[reached], node[reached])
+    step = np.full(n, -np.inf)
+    step[reached] = w[np.searchsorted(a * n + b, lo * n + hi)]
+    return _running_max(step, np.where(reached, pred, node))
+
+
+def _load_dem(src, dem: np.ndarray, size: int) -> None:
+    """Copy band 1 into dem as float64 with nodata as NaN."""
+    for r0, r1, c0, c1 in _tiles(*dem.shape, size):
+        block = src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0)).astype(np.float64)
+        if src.nodata is not None:
+            block[block == src.nodata] = np.nan
+        dem[r0:r1, c0:c1] = block
+
+
+def _fill_tiled(dem: np.ndarray, filled: np.ndarray, label: np.ndarray, size: int) -> None:
+    """Priority-flood fill of dem into filled, tile by tile.
+
+    Each tile is flooded on its own with its edge cells as extra outlets, and
+    every cell is labelled with the edge cell its water reaches (real outlets
+    share one label). Where two labels touch, inside a tile or across a
+    seam, the water can pass at max(level, level). The lowest such passes
+    between labels form a small graph whose minimax distance to the real
+    outlets is each label's spill level; the filled level is then
+    max(local level, spill level of the label).
+    """
+    rows, cols = dem.shape
+    tiles = list(_tiles(rows, cols, size))
+    a_all, b_all, w_all = [], [], []
+
+    buf = _halo_buffer(dem, size)
+    for r0, r1, c0, c1 in tiles:
+        win = window(dem, r0, r1, c0, c1, np.nan, out=buf)
+        z = win[1:-1, 1:-1]
+        valid = ~np.isnan(z)
+        label[r0:r1, c0:c1] = _NO_LABEL
+        filled[r0:r1, c0:c1] = np.nan
+        if not valid.any():
+            continue
+        outlet = _outlet_cells(~np.isnan(win))[1:-1, 1:-1]
+        edge = np.zeros_like(valid)
+        edge[[0, -1], :] = edge[:, [0, -1]] = True
+        level, root = _flood_levels(z, valid, np.flatnonzero(outlet | (edge & valid)))
+        rr, rc = np.divmod(root, z.shape[1])
+        lab = np.where(outlet.ravel()[root], _OCEAN, (rr + r0) * cols + rc + c0)
+        label[r0:r1, c0:c1] = np.where(valid, lab.reshape(z.shape), _NO_LABEL)
+        filled[r0:r1, c0:c1] = np.where(valid, level.reshape(z.shape), np.nan)
+        # With equal levels an outlet may hang below an edge cell in the tree;
+        # its label still drains at the outlet's own elevation
+        tied = outlet.ravel() & (lab != _OCEAN)
+        a_all.append(np.full(int(tied.sum()), _OCEAN, dtype=np.int64))
+        b_all.append(lab[tied])
+        w_all.append(z.ravel()[tied])
+
+    # Lowest pass between each pair of touching labels
+    lab_buf, lvl_buf = _halo_buffer(label, size), _halo_buffer(filled, size)
+    for r0, r1, c0, c1 in tiles:
+        lab = window(label, r0, r1, c0, c1, _NO_LABEL, out=lab_buf)
+        lvl = window(filled, r0, r1, c0, c1, np.nan, out=lvl_buf).ravel()
+        u, v = _neighbor_edges(lab != _NO_LABEL)
+        la, lb = lab.ravel()[u], lab.ravel()[v]
+        touch = la != lb
+        a, b, w = _min_per_pair(
+            np.minimum(la, lb)[touch], np.maximum(la, lb)[touch],
+            np.maximum(lvl[u], lvl[v])[touch],
+        )
+        a_all.append(a)
+        b_all.append(b)
+        w_all.append(w)
+    a, b, w = _min_per_pair(np.concatenate(a_all), np.concatenate(b_all), np.concatenate(w_all))
+
+    nodes = np.unique(np.concatenate([a, b, [_OCEAN]]))
+    spill = _spill_levels(
+        nodes.size, np.searchsorted(nodes, a), np.searchsorted(nodes, b), w,
+        int(np.searchsorted(nodes, _OCEAN)),
+    )
+    spill[nodes == _OCEAN] = -np.inf
+
+    for r0, r1, c0, c1 in tiles:
+        lab = np.asarray(label[r0:r1, c0:c1])
+        idx = np.searchsorted(nodes, lab).clip(max=nodes.size - 1)
+        known = nodes[idx] == lab
+        lift = np.where(known, spill[idx], -np.inf)
+        lift = np.where(lab == _NO_LABEL, np.nan, lift)
+        filled[r0:r1, c0:c1] = np.fmax(filled[r0:r1, c0:c1], lift)
+
+
+def _direction_tiled(filled: np.ndarray, fdir: np.ndarray, size: int) -> None:
+    buf = _halo_buffer(filled, size)
+    for r0, r1, c0, c1 in _tiles(*filled.shape, size):
+        win = window(filled, r0, r1, c0, c1, np.nan, out=buf)
+        fdir[r0:r1, c0:c1] = _flow_direction_d8(win, padded=True)
+
+
+def _sparse_distance(nb: np.ndarray, keep: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """_flat_distance on a neighbour table: BFS rings over cells where keep is set."""
+    dist = np.full(keep.size, -1, dtype=np.int32)
+    dist[sources] = 0
+    frontier = sources
+    d = 0
+    while frontier.size:
+        d += 1
+        ring = []
+        for i in range(8):
+            step = nb[i, frontier]
+            step = step[step >= 0]
+            step = step[keep[step] & (dist[step] < 0)]
+            dist[step] = d
+            ring.append(step)
+        frontier = np.concatenate(ring)
+    return dist
+
+
+def _route_flat_cells(gid, z, flat, low, high, rows, cols):
+    """_resolve_flats on a sparse set of cells (flat and low-edge cells only).
+
+    gid are sorted flat indices. Returns (gid, direction) for every flat
+    cell that gets a direction.
+    """
+    m = gid.size
+    r, c = np.divmod(gid, cols)
+    # Position of each same-elevation neighbour within gid, or -1
+    nb = np.full((8, m), -1, dtype=np.int32)
+    for i in range(8):
+        nr, nc = r + DR[i], c + DC[i]
+        g = nr * cols + nc
+        pos = np.searchsorted(gid, g).clip(max=m - 1)
+        inside = (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+        hit = inside & (gid[pos] == g) & (z[pos] == z)
+        nb[i] = np.where(hit, pos, -1)
+    del r, c, nr, nc, g, pos, inside, hit
+
+    toward = _sparse_distance(nb, np.ones(m, dtype=bool), np.flatnonzero(low))
+    away = _sparse_distance(nb, flat, np.flatnonzero(high))
+
+    # Largest away-distance per flat (equal-elevation components of flat cells)
+    heads, tails = [], []
+    for i in range(4):  # E, SE, S, SW; the other four give the same pairs reversed
+        pair = (nb[i] >= 0) & flat & flat[nb[i]]
+        heads.append(np.flatnonzero(pair).astype(np.int32))
+        tails.append(nb[i][pair])
+    heads, tails = np.concatenate(heads), np.concatenate(tails)
+    graph = coo_matrix((np.ones(heads.size, dtype=np.int8), (heads, tails)), shape=(m, m))
+    _, labels = connected_components(graph, directed=False)
+    away_max = np.full(labels.max() + 1, -1, dtype=np.int32)
+    np.maximum.at(away_max, labels[flat], away[flat])
+
+    big = np.iinfo(np.int32).max
+    routable = flat & (toward > 0)
+    mask = 2 * toward + np.where(away >= 0, away_max[labels] - away, 0)
+    key = np.where(routable, mask, np.where(low, 0, big))
+    best = key.copy()
+    out = np.full(m, -1, dtype=np.int8)
+    for i in range(8):
+        nb_key = np.where(nb[i] >= 0, key[nb[i]], big)
+        better = routable & (nb_key < best)
+        out[better] = i
+        best[better] = nb_key[better]
+    return gid[routable], out[routable]
+
+
+def _resolve_flats_tiled(filled: np.ndarray, fdir: np.ndarray, size: int) -> None:
+    """Collect flat and low-edge cells tile by tile, then route them together.
+
+    Flats may cross any number of tiles, so the BFS runs on just those cells
+    (usually a small fraction of the DEM) held as sorted flat indices.
+    """
+    rows, cols = filled.shape
+    parts = []
+    z_buf, d_buf = _halo_buffer(filled, size, 2), _halo_buffer(fdir, size, 2)
+    for r0, r1, c0, c1 in _tiles(rows, cols, size):
+        z = window(filled, r0, r1, c0, c1, np.nan, width=2, out=z_buf)
+        edges = _flat_edges(z, window(fdir, r0, r1, c0, c1, -1, width=2, out=d_buf))
+        flat, low, high = (m[2:-2, 2:-2] for m in edges)
+        rr, cc = np.nonzero(flat | low)
+        parts.append(((rr + r0) * cols + cc + c0, z[2:-2, 2:-2][rr, cc],
+                      flat[rr, cc], low[rr, cc], high[rr, cc]))
+    gid, z, flat, low, high = (np.concatenate(p) for p in zip(*parts))
+    if not flat.any() or not low.any():
+        return
+    order = np.argsort(gid)
+    cells, dirs = _route_flat_cells(
+        gid[order], z[order], flat[order], low[order], high[order], rows, cols,
+    )
+    fdir.reshape(-1)[cells] = dirs
+
+
+def _running_root(parent: np.ndarray) -> np.ndarray:
+    """Root of every node in a forest given as parent pointers (roots point to themselves)."""
+    while True:
+        jumped = parent[parent]
+        if np.array_equal(jumped, parent):
+            return parent
+        parent = jumped
+
+
+def _accumulate_tiled(fdir: np.ndarray, acc: np.ndarray, size: int) -> None:
+    """Flow accumulation tile by tile; acc holds the per-cell weights on entry.
+
+    Each tile is accumulated on its own first. The cells where flow leaves a
+    tile form a small forest: a leaving cell passes everything it collected
+    to the next tile, where the path from its entry cell ends at another
+    leaving cell (or inside that tile). Accumulating that forest gives the
+    inflow at every entry cell; a second pass per tile adds it as weight.
+    """
+    rows, cols = fdir.shape
+    tiles = list(_tiles(rows, cols, size))
+    out_gid, out_target, out_acc, entry_gid, entry_exit = [], [], [], [], []
+
+    buf = _halo_buffer(fdir, size)
+    for r0, r1, c0, c1 in tiles:
+        win = window(fdir, r0, r1, c0, c1, -1, out=buf)
+        d = win[1:-1, 1:-1]
+        h, w = d.shape
+        local = _flow_accumulation(d, acc[r0:r1, c0:c1]).ravel()
+        target = _flow_targets(d)
+
+        # Cells whose downstream cell is in another tile
+        r, c = np.divmod(np.arange(h * w), w)
+        step = np.clip(d.ravel(), 0, 7)
+        gr, gc = r + r0 + DR[step], c + c0 + DC[step]
+        leaves = (d.ravel() >= 0) & (target < 0) & (gr >= 0) & (gr < rows) & (gc >= 0) & (gc < cols)
+        out_gid.append((r[leaves] + r0) * cols + c[leaves] + c0)
+        out_target.append(gr[leaves] * cols + gc[leaves])
+        out_acc.append(local[leaves])
+
+        # Cells fed from the halo ring, and where their path leaves the tile
+        ring = np.ones_like(win, dtype=bool)
+        ring[1:-1, 1:-1] = False
+        hr, hc = np.nonzero(ring & (win >= 0))
+        tr, tc = hr + DR[win[hr, hc]] - 1, hc + DC[win[hr, hc]] - 1
+        inside = (tr >= 0) & (tr < h) & (tc >= 0) & (tc < w)
+        entry = np.unique(tr[inside] * w + tc[inside])
+        root = _running_root(np.where(target >= 0, target, np.arange(h * w)))[entry]
+        er, ec = np.divmod(entry, w)
+        xr, xc = np.divmod(root, w)
+        entry_gid.append((er + r0) * cols + ec + c0)
+        entry_exit.append(np.where(leaves[root], (xr + r0) * cols + xc + c0, -1))
+
+    out_gid, out_target, out_acc = (np.concatenate(p) for p in (out_gid, out_target, out_acc))
+    entry_gid, entry_exit = np.concatenate(entry_gid), np.concatenate(entry_exit)
+    if out_gid.size:
+        order = np.argsort(out_gid)
+        out_gid, out_target, out_acc = out_gid[order], out_target[order], out_acc[order]
+        order = np.argsort(entry_gid)
+        entry_gid, entry_exit = entry_gid[order], entry_exit[order]
+        exit_gid = entry_exit[np.searchsorted(entry_gid, out_target)]
+        nxt = np.where(exit_gid >= 0, np.searchsorted(out_gid, exit_gid), -1)
+        passed = _accumulate(nxt, out_acc)
+        inflow_gid, inverse = np.unique(out_target, return_inverse=True)
+        inflow = np.bincount(inverse, weights=passed)
+    else:
+        inflow_gid, inflow = np.empty(0, dtype=np.int64), np.empty(0)
+
+    # Inflow grouped by tile, in the order _tiles yields them
+    ir, ic = np.divmod(inflow_gid, cols)
+    tile_of = (ir // size) * -(-cols // size) + ic // size
+    order = np.argsort(tile_of, kind="stable")
+    ir, ic, inflow, tile_of = ir[order], ic[order], inflow[order], tile_of[order]
+    for k, (r0, r1, c0, c1) in enumerate(tiles):
+        lo, hi = np.searchsorted(tile_of, [k, k + 1])
+        w = np.nan_to_num(np.asarray(acc[r0:r1, c0:c1], dtype=np.float64), nan=0.0)
+        w[ir[lo:hi] - r0, ic[lo:hi] - c0] += inflow[lo:hi]
+        acc[r0:r1, c0:c1] = _flow_accumulation(fdir[r0:r1, c0:c1], w)
+
+
+def tiled_flow(
+    dem_path: Path,
+    scratch_dir: Path,
+    tile_size: int,
+    weights_path: Path | None = None,
+) -> tuple[np.memmap, np.memmap, np.memmap]:
+    """Filled, routed and accumulated DEM as memory-mapped (filled, fdir, acc) arrays.
+
+    Parameters
+    ----------
+    dem_path : DEM GeoTIFF.
+    scratch_dir : Existing folder for the scratch arrays (about 33 bytes per
+        DEM cell); the caller removes it.
+    tile_size : Tile edge length in cells; memory use grows with its square.
+    weights_path : Optional weights raster, as for ``delineate_streams``.
+    """
+    with rasterio.open(dem_path) as src:
+        shape = (src.height, src.width)
+        transform, crs = src.transform, src.crs
+        dem = _scratch(scratch_dir, "dem", np.float64, shape)
+        _load_dem(src, dem, tile_size)
+
+    with _stage(f"Filling depressions (priority-flood, {tile_size} px tiles)"):
+        filled = _scratch(scratch_dir, "filled", np.float64, shape)
+        _fill_tiled(dem, filled, _scratch(scratch_dir, "label", np.int64, shape), tile_size)
+
+    with _stage("Computing flow direction (D8)"):
+        fdir = _scratch(scratch_dir, "fdir", np.int8, shape)
+        _direction_tiled(filled, fdir, tile_size)
+
+    with _stage("Resolving flats"):
+        _resolve_flats_tiled(filled, fdir, tile_size)
+
+    if weights_path is not None:
+        print(f"    Reading weights: {Path(weights_path).name}")
+    with _stage("Computing flow accumulation"):
+        acc = _scratch(scratch_dir, "acc", np.float64, shape)
+        for r0, r1, c0, c1 in _tiles(*shape, tile_size):
+            if weights_path is None:
+                acc[r0:r1, c0:c1] = 1.0
+            else:
+                win_transform = window_transform(Window(c0, r0, c1 - c0, r1 - r0), transform)
+                acc[r0:r1, c0:c1] = _read_weights(
+                    weights_path, (r1 - r0, c1 - c0), win_transform, crs,
+                )
+        _accumulate_tiled(fdir, acc, tile_size)
+    return filled, fdir, acc
@@ -1,9 +1,12 @@
 """Utility functions: coordinates, CRS."""
+from collections import Counter
 from pathlib import Path
+import csv
+import re
 
 import geopandas as gpd
 from shapely.geometry import Point
-from pyproj import CRS
+from pyproj import CRS, Transformer
 
 
 def read_coordinates(path: Path) -> tuple[float, float]:
@@ -18,9 +21,60 @@ def read_coordinates(path: Path) -> tuple[float, float]:
     return lat, lon
 
 
+def _site_name(raw, index: int) -> str:
+    """Folder-safe site name; falls back to site_<n> when blank."""
+    name = re.sub(r"[^\w.-]+", "_", str(raw or "").strip()).strip("_.")
+    return name or f"site_{index:03d}"
+
+
+def read_sites(path: Path) -> list[tuple[str, float, float]]:
+    """Read named sites as (name, lat, lon) from a CSV or GeoJSON file.
+
+    CSV needs ``lat``/``lon`` (or ``latitude``/``longitude``) columns and may
+    have a ``name`` column. GeoJSON must hold points; names come from the
+    ``name`` property. Unnamed sites are numbered in file order.
+    """
+    if path.suffix.lower() in (".geojson", ".json"):
+        gdf = gpd.read_file(path)
+        if gdf.crs is not None:
+            gdf = gdf.to_crs("EPSG:4326")
+        if not (gdf.geom_type == "Point").all():
+            raise ValueError(f"Expected only Point features in {path}")
+        names = gdf["name"] if "name" in gdf.columns else [None] * len(gdf)
+        sites = [
+            (_site_name(name, i), float(pt.y), float(pt.x))
+            for i, (name, pt) in enumerate(zip(names, gdf.geometry), start=1)
+        ]
+    else:
+        with path.open(newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            lat_col = fields.get("lat") or fields.get("latitude")
+            lon_col = fields.get("lon") or fields.get("longitude")
+            if lat_col is None or lon_col is None:
+                raise ValueError(f"Expected 'lat' and 'lon' columns in {path}")
+            name_col = fields.get("name")
+            sites = [
+                (_site_name(row.get(name_col) if name_col else None, i),
+                 float(row[lat_col]), float(row[lon_col]))
+                for i, row in enumerate(reader, start=1)
+            ]
+    counts = Counter(name for name, _, _ in sites)
+    duplicates = sorted(name for name, n in counts.items() if n > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate site names in {path}: {', '.join(duplicates)}")
+    return sites
+
+
 def buffer_distance_meters(dem_crs, buffer_m: int) -> float:
     """Return buffer distance in CRS units (meters or feet)."""
     units = CRS.from_user_input(dem_crs).axis_info[0].unit_name.lower()
     if "foot" in units or "feet" in units:
         return buffer_m * 3.28084
     return float(buffer_m)
+
+
+def bounds_in_crs(bounds: tuple, src_crs, dst_crs) -> tuple[float, float, float, float]:
+    """Reproject (xmin, ymin, xmax, ymax) to dst_crs, densifying edges so the box still covers."""
+    transformer = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    return transformer.transform_bounds(*bounds, densify_pts=21)
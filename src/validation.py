@@ -1,39 +1,152 @@
 """Validation: assets, outputs, QGIS project."""
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import math
 import zipfile
 
+import fiona
 import geopandas as gpd
+import numpy as np
 from pyproj import CRS
 from shapely.geometry import Point
 import rasterio
+from rasterio.windows import Window
 
+from .cache import file_fingerprint, read_manifest, write_manifest
+from .vector_cache import fresh_cache_entries
 
-def validate_asset_dem(dem_path: Path) -> dict:
-    """Validate DEM asset before processing: exists, readable, has CRS and data."""
+# Blocks read by the sampling check before falling back to a full scan
+_SAMPLE_BLOCKS = 16
+# Pixels per read in a full scan (rows are grouped for striped GeoTIFFs)
+_SCAN_PIXELS = 1 << 22
+# Threads for header-only shapefile checks (I/O bound)
+_HEADER_WORKERS = 8
+
+
+def _scan_windows(src):
+    """Row bands of about _SCAN_PIXELS pixels, aligned to the block height."""
+    block_rows = src.block_shapes[0][0]
+    rows = max(block_rows, (_SCAN_PIXELS // max(src.width, 1)) // block_rows * block_rows)
+    for row in range(0, src.height, rows):
+        yield Window(0, row, src.width, min(rows, src.height - row))
+
+
+def _reduce(arrays, method: str) -> dict:
+    """Positive / non-zero flags over the valid pixels of masked arrays.
+
+    Stops at the first positive pixel, which settles both flags.
+    """
+    nonzero = False
+    for a in arrays:
+        valid = a.compressed()
+        if valid.size and valid.max() > 0:
+            return {"positive": True, "nonzero": True, "method": method}
+        nonzero = nonzero or bool(np.any(valid != 0))
+    return {"positive": False, "nonzero": nonzero, "method": method}
+
+
+def dem_data_summary(src, exact: bool = False) -> dict:
+    """Does an open DEM hold valid elevations above zero (and any non-zero)?
+
+    Tries, cheapest first: stored band statistics, the coarsest overview and
+    a sample of blocks. A positive pixel found by any of them settles the
+    answer; otherwise (or with exact=True) the band is reduced block by block.
+    Nodata pixels are ignored. Returns {"positive", "nonzero", "method"}.
+    """
+    if not exact:
+        tags = src.tags(1)
+        if "STATISTICS_MAXIMUM" in tags and tags.get("STATISTICS_APPROXIMATE") != "YES":
+            smax = float(tags["STATISTICS_MAXIMUM"])
+            smin = float(tags.get("STATISTICS_MINIMUM", smax))
+            return {"positive": smax > 0, "nonzero": smax != 0 or smin != 0, "method": "stats"}
+        if src.overviews(1):
+            factor = src.overviews(1)[-1]
+            out_shape = (math.ceil(src.height / factor), math.ceil(src.width / factor))
+            result = _reduce([src.read(1, out_shape=out_shape, masked=True)], "overview")
+            if result["positive"]:
+                return result
+        blocks = [w for _, w in src.block_windows(1)]
+        picks = np.unique(np.linspace(0, len(blocks) - 1, _SAMPLE_BLOCKS).round().astype(int))
+        result = _reduce((src.read(1, window=blocks[i], masked=True) for i in picks), "sample")
+        if result["positive"]:
+            return result
+    return _reduce((src.read(1, window=w, masked=True) for w in _scan_windows(src)), "exact")
+
+
+def _cached_data_summary(src, dem_path: Path, exact: bool, cache_path: Path | None) -> dict:
+    """dem_data_summary, reused from cache_path while the file is unchanged."""
+    if cache_path is None:
+        return dem_data_summary(src, exact)
+    key = str(dem_path.resolve())
+    cache = read_manifest(cache_path)
+    entry = cache.get(key)
+    source = file_fingerprint(dem_path)
+    if entry and entry["source"] == source and (entry["summary"]["method"] == "exact" or not exact):
+        return entry["summary"]
+    summary = dem_data_summary(src, exact)
+    cache[key] = {"source": source, "summary": summary}
+    write_manifest(cache_path, cache)
+    return summary
+
+
+def validate_asset_dem(dem_path: Path, exact: bool = False, cache_path: Path | None = None) -> dict:
+    """Validate DEM asset before processing: exists, readable, has CRS and data.
+
+    The data check avoids reading the whole raster (see ``dem_data_summary``);
+    with cache_path its result is kept per file fingerprint (mtime/size).
+    """
     if not dem_path.exists():
         return {"valid": False, "error": f"DEM not found: {dem_path}"}
     try:
         with rasterio.open(dem_path) as src:
-            data = src.read(1)
             crs = src.crs
             bounds = src.bounds
             shape = src.shape
-        if crs is None:
-            return {"valid": False, "error": "DEM has no CRS", "crs": None}
-        has_data = data.max() > 0 and bool(data.any())
+            if crs is None:
+                return {"valid": False, "error": "DEM has no CRS", "crs": None}
+            summary = _cached_data_summary(src, dem_path, exact, cache_path)
         return {
             "valid": True,
             "crs": crs,
             "bounds": bounds,
             "shape": shape,
-            "has_data": has_data,
+            "has_data": summary["positive"],
+            "data_check": summary["method"],
         }
     except Exception as e:
         return {"valid": False, "error": str(e), "crs": None}
 
 
-def validate_asset_shapefiles(shape_dir: Path) -> dict:
-    """Validate shapefile assets: directory exists, files have CRS."""
+def shapefile_header(shp: Path) -> dict:
+    """Layer metadata from the .prj, .shp/.shx header and .dbf schema.
+
+    No geometry is decoded; the bounds are the extent stored in the .shp header.
+    """
+    with fiona.open(shp) as layer:
+        return {
+            "crs": layer.crs_wkt or None,
+            "count": len(layer),
+            "geometry": layer.schema["geometry"],
+            "bounds": layer.bounds,
+            "fields": dict(layer.schema["properties"]),
+        }
+
+
+def _header_has_crs(shp: Path) -> bool:
+    """True if the layer header is readable and declares a CRS."""
+    try:
+        return shapefile_header(shp)["crs"] is not None
+    except Exception:
+        return False
+
+
+def validate_asset_shapefiles(shape_dir: Path, cache_dir: Path | None = None) -> dict:
+    """Validate shapefile assets: directory exists, files have CRS.
+
+    Only layer headers are read (see ``shapefile_header``), several at a time.
+    With cache_dir, layers that have an up-to-date vector cache entry are
+    answered from its manifest instead.
+    """
     if not shape_dir.exists():
         return {
             "valid": False,
@@ -42,16 +155,18 @@ def validate_asset_shapefiles(shape_dir: Path) -> dict:
             "missing_crs": [],
         }
     shp_paths = sorted(shape_dir.glob("*.shp"))
+    cached = fresh_cache_entries(shape_dir, cache_dir) if cache_dir is not None else {}
+    unchecked = [p for p in shp_paths if p.stem not in cached]
+    with ThreadPoolExecutor(max_workers=max(1, min(_HEADER_WORKERS, len(unchecked)))) as pool:
+        header_ok = dict(zip(unchecked, pool.map(_header_has_crs, unchecked)))
     missing_crs = []
     with_crs = 0
     for p in shp_paths:
-        try:
-            gdf = gpd.read_file(p)
-            if gdf.crs is not None:
-                with_crs += 1
-            else:
-                missing_crs.append(p.name)
-        except Exception:
+        entry = cached.get(p.stem)
+        has_crs = entry["has_crs"] if entry is not None else header_ok[p]
+        if has_crs:
+            with_crs += 1
+        else:
             missing_crs.append(p.name)
     return {
         "valid": len(missing_crs) == 0 and with_crs == len(shp_paths),
@@ -61,20 +176,21 @@ def validate_asset_shapefiles(shape_dir: Path) -> dict:
     }
 
 
-def validate_dem_output(dem_path: Path, expected_buffer_m: int) -> dict:
+def validate_dem_output(dem_path: Path, expected_buffer_m: int, exact: bool = False) -> dict:
     """Validate clipped DEM has data and correct properties."""
     with rasterio.open(dem_path) as src:
-        data = src.read(1)
+        summary = dem_data_summary(src, exact)
+        shape = src.shape
         bounds = src.bounds
         crs = src.crs
     width_m = bounds.right - bounds.left
     height_m = bounds.top - bounds.bottom
     return {
-        "valid": data.max() > 0 and dem_path.stat().st_size > 0,
-        "shape": (int(data.shape[0]), int(data.shape[1])),
+        "valid": summary["positive"] and dem_path.stat().st_size > 0,
+        "shape": (int(shape[0]), int(shape[1])),
         "bounds": bounds,
         "crs": crs,
-        "has_data": bool(data.any()),
+        "has_data": summary["nonzero"],
         "extent_m": (round(width_m, 2), round(height_m, 2)),
     }
 
@@ -0,0 +1,131 @@
+"""Reprojected, spatially indexed GeoParquet cache of the SHAPE_DIR layers."""
+from pathlib import Path
+
+import fiona
+import geopandas as gpd
+import numpy as np
+from pyproj import CRS
+
+from .cache import read_manifest, shapefile_fingerprint, write_manifest
+from .config import VECTOR_CACHE_DIR
+
+MANIFEST_NAME = "manifest.json"
+# Small row groups keep bbox pruning selective on statewide layers
+_ROW_GROUP_SIZE = 2048
+
+
+def _hilbert_sorted(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Order rows along a Hilbert curve so nearby features share row groups."""
+    geoms = gdf.geometry
+    present = ~(geoms.isna() | geoms.is_empty)
+    if present.sum() < 2:
+        return gdf
+    key = np.full(len(gdf), np.iinfo(np.int64).max, dtype=np.int64)
+    key[present.to_numpy()] = geoms[present].hilbert_distance().to_numpy()
+    return gdf.iloc[np.argsort(key, kind="stable")]
+
+
+def _entry_is_fresh(entry: dict | None, shp: Path, cache_dir: Path) -> bool:
+    """True if a manifest entry matches the current source files."""
+    if not entry or entry.get("source") != shapefile_fingerprint(shp):
+        return False
+    return entry.get("path") is None or (cache_dir / entry["path"]).exists()
+
+
+def _built_for(manifest: dict, dem_crs) -> bool:
+    """True if manifest is for dem_crs (the same CRS, however its WKT is written)."""
+    wkt = manifest.get("dem_crs")
+    return wkt is not None and CRS.from_wkt(wkt).equals(dem_crs)
+
+
+def build_vector_cache(
+    shape_dir: Path,
+    dem_crs,
+    cache_dir: Path = VECTOR_CACHE_DIR,
+) -> dict | None:
+    """Convert each shapefile in shape_dir to GeoParquet in the DEM CRS.
+
+    Layers are written Hilbert-sorted with per-row bbox covering columns, so
+    bbox reads only decode the row groups that touch the query window. Entries
+    are reused while the source files (mtime/size of every part, incl. .prj)
+    and the DEM CRS are unchanged.
+
+    Returns the manifest, or None if pyarrow is not installed.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("    Vector cache skipped (pyarrow not installed)")
+        return None
+
+    manifest_path = cache_dir / MANIFEST_NAME
+    manifest = read_manifest(manifest_path)
+    dem_wkt = CRS.from_user_input(dem_crs).to_wkt()
+    layers = manifest.get("layers", {}) if _built_for(manifest, dem_crs) else {}
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    shp_paths = sorted(shape_dir.glob("*.shp"))
+    fresh = {}
+    for shp in shp_paths:
+        entry = layers.get(shp.stem)
+        if _entry_is_fresh(entry, shp, cache_dir):
+            fresh[shp.stem] = entry
+            continue
+        source = shapefile_fingerprint(shp)
+        with fiona.open(shp) as layer:
+            has_crs = bool(layer.crs_wkt)
+        if not has_crs:
+            fresh[shp.stem] = {"source": source, "has_crs": False, "path": None}
+            continue
+        gdf = _hilbert_sorted(gpd.read_file(shp).to_crs(dem_crs))
+        out_name = f"{shp.stem}.parquet"
+        gdf.to_parquet(
+            cache_dir / out_name,
+            write_covering_bbox=True,
+            row_group_size=_ROW_GROUP_SIZE,
+        )
+        fresh[shp.stem] = {
+            "source": source,
+            "has_crs": True,
+            "path": out_name,
+            "count": len(gdf),
+        }
+        print(f"    Cached {shp.stem} ({len(gdf)} features)")
+
+    # Drop cache files for layers that no longer exist (or were rebuilt empty)
+    keep = {e["path"] for e in fresh.values() if e.get("path")}
+    for stale in cache_dir.glob("*.parquet"):
+        if stale.name not in keep:
+            stale.unlink()
+
+    manifest = {"dem_crs": dem_wkt, "layers": fresh}
+    write_manifest(manifest_path, manifest)
+    return manifest
+
+
+def fresh_cache_entries(shape_dir: Path, cache_dir: Path = VECTOR_CACHE_DIR) -> dict[str, dict]:
+    """Return manifest entries (by layer stem) that are still valid for shape_dir."""
+    manifest = read_manifest(cache_dir / MANIFEST_NAME)
+    layers = manifest.get("layers", {})
+    return {
+        shp.stem: layers[shp.stem]
+        for shp in sorted(shape_dir.glob("*.shp"))
+        if _entry_is_fresh(layers.get(shp.stem), shp, cache_dir)
+    }
+
+
+def cache_matches_crs(dem_crs, cache_dir: Path = VECTOR_CACHE_DIR) -> bool:
+    """True if the cache was built for dem_crs."""
+    return _built_for(read_manifest(cache_dir / MANIFEST_NAME), dem_crs)
+
+
+def read_cached_layer(
+    entry: dict,
+    bbox: tuple[float, float, float, float] | None,
+    cache_dir: Path = VECTOR_CACHE_DIR,
+) -> gpd.GeoDataFrame:
+    """Read the features of a cached layer whose bbox intersects bbox (DEM CRS).
+
+    bbox=None reads the whole layer.
+    """
+    return gpd.read_parquet(cache_dir / entry["path"], bbox=bbox)
@@ -0,0 +1,19 @@
+"""Helpers shared by the raster tests."""
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+NODATA = -9999.0
+
+
+def write_dem(path: Path, data: np.ndarray, res: float = 1.0) -> Path:
+    """Single-band float64 GeoTIFF in EPSG:6340 with NODATA as nodata."""
+    rows, cols = data.shape
+    with rasterio.open(
+        path, "w", driver="GTiff", width=cols, height=rows, count=1, dtype="float64",
+        crs="EPSG:6340", transform=from_origin(400000.0, 3800000.0, res, res), nodata=NODATA,
+    ) as dst:
+        dst.write(data, 1)
+    return path
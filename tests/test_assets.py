@@ -41,3 +41,81 @@ def test_shapefiles_have_crs():
     result = validate_asset_shapefiles(SHAPE_DIR)
     assert result["valid"], f"Shapefiles missing CRS: {result.get('missing_crs', [])}"
     assert result["with_crs"] == result["count"]
+
+
+def test_vector_cache_matches_shapefiles(tmp_path):
+    """Validation answered from the vector cache matches reading the shapefiles."""
+    pytest.importorskip("pyarrow")
+    from src.vector_cache import build_vector_cache, fresh_cache_entries
+    manifest = build_vector_cache(SHAPE_DIR, "EPSG:6340", tmp_path)
+    assert set(manifest["layers"]) == {p.stem for p in SHAPE_DIR.glob("*.shp")}
+    assert fresh_cache_entries(SHAPE_DIR, tmp_path).keys() == manifest["layers"].keys()
+    assert validate_asset_shapefiles(SHAPE_DIR, tmp_path) == validate_asset_shapefiles(SHAPE_DIR)
+
+
+def test_vector_cache_crs_compared_by_meaning(tmp_path):
+    """A cache built for the same CRS still matches when the WKT is written differently."""
+    from pyproj import CRS
+    from src.cache import write_manifest
+    from src.vector_cache import MANIFEST_NAME, cache_matches_crs
+    wkt1 = CRS.from_epsg(6340).to_wkt("WKT1_GDAL")
+    write_manifest(tmp_path / MANIFEST_NAME, {"dem_crs": wkt1, "layers": {}})
+    assert cache_matches_crs("EPSG:6340", tmp_path)
+    assert cache_matches_crs(CRS.from_epsg(6340).to_wkt(), tmp_path)
+    assert not cache_matches_crs("EPSG:6341", tmp_path)
+
+
+def test_dem_data_check_without_full_read(tmp_path):
+    """Stored stats answer directly; a DEM with no positive pixel falls back to an exact scan."""
+    import numpy as np
+    import rasterio
+    from rasterio.transform import from_origin
+
+    meta = {
+        "driver": "GTiff", "width": 600, "height": 400, "count": 1, "dtype": "float32",
+        "crs": "EPSG:6340", "nodata": -9999.0, "transform": from_origin(400000.0, 3800000.0, 1, 1),
+    }
+    data = np.full((400, 600), -9999.0, dtype="float32")
+    data[200, 300] = 12.5  # a single valid pixel, not in any sampled block
+    with rasterio.open(tmp_path / "stats.tif", "w", **meta) as dst:
+        dst.write(data, 1)
+        dst.update_tags(1, STATISTICS_MINIMUM="12.5", STATISTICS_MAXIMUM="12.5")
+    result = validate_asset_dem(tmp_path / "stats.tif")
+    assert result["has_data"] and result["data_check"] == "stats"
+
+    with rasterio.open(tmp_path / "sparse.tif", "w", **meta) as dst:
+        dst.write(data, 1)
+    result = validate_asset_dem(tmp_path / "sparse.tif")
+    assert result["has_data"] and result["data_check"] == "exact"
+
+    data[200, 300] = -3.0
+    with rasterio.open(tmp_path / "below.tif", "w", **meta) as dst:
+        dst.write(data, 1)
+    cache_path = tmp_path / "dem_validation.json"
+    result = validate_asset_dem(tmp_path / "below.tif", cache_path=cache_path)
+    assert result["valid"] and not result["has_data"]
+    assert str((tmp_path / "below.tif").resolve()) in cache_path.read_text()
+
+
+def test_shapefile_headers_flag_missing_crs(tmp_path):
+    """Header-only checks report layers without a .prj (or unreadable) as missing CRS."""
+    import geopandas as gpd
+    from shapely.geometry import Point
+    from src.validation import shapefile_header
+
+    gdf = gpd.GeoDataFrame({"name": ["a", "b"]}, geometry=[Point(0, 0), Point(1, 2)], crs="EPSG:4326")
+    gdf.to_file(tmp_path / "good.shp")
+    gdf.to_file(tmp_path / "bare.shp")
+    (tmp_path / "bare.prj").unlink()
+    (tmp_path / "broken.shp").write_bytes(b"not a shapefile")
+
+    header = shapefile_header(tmp_path / "good.shp")
+    assert header["count"] == 2 and header["geometry"] == "Point"
+    assert header["bounds"] == (0.0, 0.0, 1.0, 2.0)
+    assert "name" in header["fields"]
+    assert validate_asset_shapefiles(tmp_path) == {
+        "valid": False,
+        "count": 3,
+        "with_crs": 1,
+        "missing_crs": ["bare.shp", "broken.shp"],
+    }
@@ -0,0 +1,29 @@
+"""Batch mode: layers loaded once per worker."""
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from src.batch import _load_layers, _sites_bounds
+
+
+def test_layers_limited_to_site_bounds(tmp_path):
+    """Only features within the largest buffer of some site are loaded."""
+    shape_dir = tmp_path / "shapes"
+    shape_dir.mkdir()
+    points = [Point(-118.70, 34.10), Point(-118.69, 34.10), Point(-117.00, 35.00)]
+    gpd.GeoDataFrame({"id": [0, 1, 2]}, geometry=points, crs="EPSG:4326").to_file(
+        shape_dir / "wells.shp",
+    )
+    sites = [("a", 34.10, -118.70), ("b", 34.11, -118.69)]
+    bounds = _sites_bounds(sites, "EPSG:6340", 2000)
+    [(name, gdf)] = _load_layers(shape_dir, "EPSG:6340", None, bounds)
+    assert name == "wells" and sorted(gdf["id"]) == [0, 1]
+    assert gdf.crs == "EPSG:6340"
+    [(_, everything)] = _load_layers(shape_dir, "EPSG:6340", None, None)
+    assert len(everything) == 3
@@ -7,9 +7,15 @@ import sys
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+import numpy as np
+import rasterio
+from pyproj import Transformer
+
+from src import clipping
+from src.clipping import run_clip_multi
 from src.config import OUTPUT_DIR, QGIS_100M_DIR, DEM_PATH, BUFFER_200M, BUFFER_100M
 from src.validation import validate_dem_output, validate_buffer, validate_shapefiles
-import rasterio
+from tests.helpers import write_dem
 
 
 @pytest.fixture(scope="module")
@@ -69,3 +75,26 @@ def test_100m_shapefiles_count():
     """100m output has expected shapefiles."""
     result = validate_shapefiles(QGIS_100M_DIR, "100m")
     assert result["total"] > 0
+
+
+def test_stream_clip_matches_in_memory_clip(tmp_path, monkeypatch):
+    """Streamed (tiled) clipping writes the same pixels as the in-memory mask."""
+    monkeypatch.setattr(clipping, "SHAPE_DIR", tmp_path / "no_layers")
+    dem = write_dem(
+        tmp_path / "dem.tif", np.random.default_rng(0).random((1500, 1300)), res=0.5,
+    )
+    lon, lat = Transformer.from_crs("EPSG:6340", "EPSG:4326", always_xy=True).transform(
+        400321.3, 3799628.9,
+    )
+    results = []
+    for stream in (False, True):
+        clips = [(302, tmp_path / f"{stream}", "a"), (90, tmp_path / f"{stream}" / "b", "b")]
+        run_clip_multi(lat, lon, "EPSG:6340", clips, dem_path=dem, stream=stream)
+        arrays = []
+        for _, out_dir, suffix in clips:
+            with rasterio.open(out_dir / f"dem_clipped_{suffix}.tif") as out:
+                arrays.append((out.transform, out.read()))
+        results.append(arrays)
+    for (t_mem, a_mem), (t_stream, a_stream) in zip(*results):
+        assert t_mem == t_stream
+        np.testing.assert_array_equal(a_mem, a_stream)
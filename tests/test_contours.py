@@ -0,0 +1,125 @@
+"""Marching-squares contour engine tests (synthetic DEMs, no assets needed)."""
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import pytest
+import shapely
+
+from rasterio.transform import from_origin
+
+from src.contours import _levels, _marching_squares, contour_lines, contour_lines_tiled
+from tests.helpers import write_dem
+
+NODATA = -9999.0
+
+
+def _cone(n: int = 41) -> np.ndarray:
+    """Distance from the centre cell: concentric circles at every level."""
+    r, c = np.mgrid[:n, :n] - n // 2
+    return np.hypot(r, c)
+
+
+def _rough_dem(seed: int) -> np.ndarray:
+    """Smoothed noise on a slope with a nodata hole: rings and lines across seams."""
+    rng = np.random.default_rng(seed)
+    z = rng.random((47, 61)) * 4
+    z = (z[:-2, :-2] + z[1:-1, 1:-1] + z[2:, 2:]) / 3 + np.arange(59) * 0.05
+    z[20:26, 30:37] = NODATA
+    return z
+
+
+def test_cone_gives_closed_rings():
+    """Each level inside the grid is one closed ring at the right radius."""
+    levels = np.array([3.5, 7.5, 12.5])
+    lines, elevations = contour_lines(_cone(), levels, from_origin(0, 41, 1, 1))
+    assert len(lines) == 3
+    np.testing.assert_array_equal(elevations, levels)
+    for line, level in zip(lines, elevations):
+        assert line.is_closed and line.is_simple
+        centre = shapely.Point(20.5, 20.5)
+        d = shapely.distance(centre, shapely.points(shapely.get_coordinates(line)))
+        np.testing.assert_allclose(d, level, atol=0.1)
+
+
+def test_open_lines_end_on_the_border():
+    """A plane gives one straight open line per level, edge to edge."""
+    z = np.tile(np.arange(10.0), (6, 1))  # rises to the east
+    xy, part, part_level = _marching_squares(z, np.array([2.5, 6.5]))
+    assert part_level.tolist() == [0, 1]
+    for p, level in enumerate([2.5, 6.5]):
+        pts = xy[part == p]
+        np.testing.assert_allclose(pts[:, 1], level)
+        assert sorted(pts[[0, -1], 0].tolist()) == [0.0, 5.0]
+
+
+def test_nodata_hole_breaks_lines():
+    """Cells touching NaN are skipped: no vertex lies inside the hole."""
+    z = np.tile(np.arange(10.0), (9, 1))
+    z[3:6, 3:7] = np.nan
+    xy, part, _ = _marching_squares(z, np.array([4.5]))
+    assert part.max() == 1  # the line is cut in two
+    inside = (xy[:, 0] > 2) & (xy[:, 0] < 6) & (xy[:, 1] > 2) & (xy[:, 1] < 7)
+    assert not inside.any()
+
+
+def test_saddle_is_resolved_by_cell_mean():
+    """A saddle joins the corners on the side of the cell-centre value."""
+    z = np.array([[1.0, 0.0], [0.0, 1.0]])
+    xy, part, _ = _marching_squares(z, np.array([0.6]))  # centre 0.5 is below
+    assert part.max() == 1
+    # each segment cuts off one high corner, so stays close to it
+    for p in range(2):
+        seg = xy[part == p]
+        corner = np.round(seg.mean(axis=0))
+        assert corner.tolist() in ([0.0, 0.0], [1.0, 1.0])
+
+
+def test_lines_chain_across_cells():
+    """Segments sharing a crossing point are joined into one polyline."""
+    lines, _ = contour_lines(_cone(), np.array([7.5]), from_origin(0, 41, 1, 1))
+    n = shapely.get_num_coordinates(lines[0])
+    assert n > 40  # one vertex per crossed cell edge, not two per segment
+    assert len(np.unique(shapely.get_coordinates(lines[0])[:-1], axis=0)) == n - 1
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+@pytest.mark.parametrize("tile_size", [7, 16])
+@pytest.mark.parametrize("quantised", [False, True])
+def test_tiled_matches_in_memory(tmp_path, seed, tile_size, quantised):
+    """Pieces merged across seams give the untiled lines, level by level.
+
+    Quantised (integer) elevations put levels exactly on pixel centres,
+    seam pixels included.
+    """
+    dem = _rough_dem(seed)
+    interval = 0.25
+    if quantised:
+        dem = np.where(dem == NODATA, NODATA, np.round(dem * 2))
+        interval = 1.0
+    path = write_dem(tmp_path / "dem.tif", dem)
+    z = np.where(dem == NODATA, np.nan, dem)
+    lines, elevations = contour_lines(
+        z, _levels(np.nanmin(z), np.nanmax(z), interval), from_origin(400000.0, 3800000.0, 1.0, 1.0),
+    )
+    tiled, tiled_elev = contour_lines_tiled(path, interval, tile_size=tile_size)
+    np.testing.assert_array_equal(np.sort(tiled_elev), np.sort(elevations))
+    assert shapely.is_closed(tiled).sum() == shapely.is_closed(lines).sum()
+    for level in np.unique(elevations):
+        np.testing.assert_allclose(
+            shapely.length(tiled[tiled_elev == level]).sum(),
+            shapely.length(lines[elevations == level]).sum(),
+        )
+
+
+def test_tiled_ring_across_tile_corner(tmp_path):
+    """A ring cut into four pieces by a tile corner is merged back into one closed line."""
+    path = write_dem(tmp_path / "cone.tif", _cone())
+    for jobs in (1, 2):
+        lines, elevations = contour_lines_tiled(path, 7.5, tile_size=20, jobs=jobs)
+        ring = lines[elevations == 7.5]
+        assert len(ring) == 1 and ring[0].is_closed and ring[0].is_simple
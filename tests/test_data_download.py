@@ -0,0 +1,219 @@
+"""download_all against a local stub ArcGIS REST server (no network needed)."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import json
+import threading
+import time
+import urllib.parse
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import geopandas as gpd
+import pytest
+
+from src import data_download
+from src.data_download import ConnectionPool, Dataset, download_all
+
+# Seconds each stub query takes, and features in the area, by service name in the URL
+DELAY = {"slow": 1.0, "paged": 0.0, "crawl": 0.3}
+DEFAULT_DELAY = 0.4
+FEATURES = {"paged": 8, "crawl": 8, "stuck": 8, "ids": 8}
+MAX_RECORD_COUNT = 3
+# Services that always answer with the first page, and those of them that
+# say so in their layer description
+IGNORE_OFFSET = {"stuck", "ids"}
+NO_PAGINATION = {"ids"}
+OWNER = " / ".join(["Los Angeles County Flood Control District"] * 3)  # over fiona's default 80
+
+
+class _StubArcGIS(BaseHTTPRequestHandler):
+    """.../<service>/MapServer/<layer>/query -> point features as GeoJSON.
+
+    Like a real server, at most MAX_RECORD_COUNT features are returned from
+    resultOffset on, with exceededTransferLimit set when more remain;
+    returnIdsOnly and objectIds queries are answered too.
+    .../<service>/MapServer/<layer> describes the layer's fields; "value"
+    is a double that is whole on the first page only.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        url = urllib.parse.urlsplit(self.path)
+        service = url.path.split("/")[1]
+        if not url.path.endswith("/query"):
+            self._send({
+                "geometryType": "esriGeometryPoint",
+                "objectIdField": "oid",
+                "maxRecordCount": MAX_RECORD_COUNT,
+                "advancedQueryCapabilities": {"supportsPagination": service not in NO_PAGINATION},
+                "fields": [
+                    {"name": "oid", "type": "esriFieldTypeOID"},
+                    {"name": "service", "type": "esriFieldTypeString", "length": 50},
+                    {"name": "owner", "type": "esriFieldTypeString", "length": len(OWNER)},
+                    {"name": "value", "type": "esriFieldTypeDouble"},
+                ],
+            })
+            return
+        query = urllib.parse.parse_qs(url.query)
+        total = FEATURES.get(service, 1)
+        if "returnIdsOnly" in query:
+            self._send({"objectIdFieldName": "oid", "objectIds": list(range(total))})
+            return
+        if "objectIds" in query:
+            ids = [int(i) for i in query["objectIds"][0].split(",")][:MAX_RECORD_COUNT]
+            more = False
+        else:
+            offset = int(query.get("resultOffset", ["0"])[0])
+            self.server.offsets.append(offset)
+            self.server.order.append(query.get("orderByFields", [None])[0])
+            if service in IGNORE_OFFSET:
+                offset = 0
+            ids = range(offset, min(offset + MAX_RECORD_COUNT, total))
+            more = ids.stop < total
+        time.sleep(DELAY.get(service, DEFAULT_DELAY))
+        self._send({
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "properties": {"service": service, "oid": i, "owner": OWNER,
+                               "value": i if i < MAX_RECORD_COUNT else i + 0.5},
+                "geometry": {"type": "Point", "coordinates": [-118.2, 34.0 + i * 1e-4]},
+            } for i in ids],
+            "properties": {"exceededTransferLimit": more},
+        })
+
+    def _send(self, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/geo+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except OSError:
+            pass  # the client timed out and left
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubArcGIS)
+    server.daemon_threads = True
+    server.clients = set()
+    server.offsets = []
+    server.order = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _stub_datasets(server, services: dict[str, float]) -> dict[str, Dataset]:
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    return {
+        name: Dataset(f"{host}/{name}/MapServer", 0, name, f"{name}.shp", timeout)
+        for name, timeout in services.items()
+    }
+
+
+def test_download_all_concurrent(stub_server, tmp_path, monkeypatch):
+    """All datasets arrive, in DATASETS order, in about the time of one."""
+    services = {name: 5.0 for name in ("a", "b", "c", "d", "e")}
+    monkeypatch.setattr(data_download, "DATASETS", _stub_datasets(stub_server, services))
+    start = time.perf_counter()
+    results = download_all(34.0, -118.2, 200, tmp_path)
+    assert time.perf_counter() - start < 4 * DEFAULT_DELAY  # serial would take 5x
+    assert list(results) == list(services)
+    assert all(results[name] == tmp_path / f"{name}.shp" and results[name].exists()
+               for name in services)
+
+
+def test_per_dataset_timeout(stub_server, tmp_path, monkeypatch):
+    """A dataset past its own timeout fails alone; the others are written."""
+    datasets = _stub_datasets(stub_server, {"fast": 5.0, "slow": 0.2})
+    monkeypatch.setattr(data_download, "DATASETS", datasets)
+    results = download_all(34.0, -118.2, 200, tmp_path)
+    assert results["fast"] is not None and results["slow"] is None
+
+
+def test_connections_reused_per_host(stub_server):
+    """Requests to one host share kept-alive connections, at most per_host at once."""
+    url = f"http://127.0.0.1:{stub_server.server_address[1]}/a/MapServer/0/query?f=geojson"
+    with ConnectionPool(per_host=2) as pool:
+        for _ in range(3):
+            pool.get(url, time.monotonic() + 5.0)
+        assert len(stub_server.clients) == 1
+        deadline = time.monotonic() + 5.0
+        threads = [threading.Thread(target=pool.get, args=(url, deadline)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert len(stub_server.clients) == 2
+
+
+def test_deadline_covers_connection_wait(stub_server):
+    """Waiting for a busy host's connection counts against the deadline."""
+    url = f"http://127.0.0.1:{stub_server.server_address[1]}/slow/MapServer/0/query?f=geojson"
+    with ConnectionPool(per_host=1) as pool:
+        busy = threading.Thread(target=pool.get, args=(url, time.monotonic() + 5.0))
+        busy.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            pool.get(url, time.monotonic() + 0.2)
+        assert time.perf_counter() - start < 0.5
+        busy.join()
+
+
+def test_timeout_covers_all_pages(stub_server, tmp_path, monkeypatch):
+    """Pages that each arrive in time still fail the dataset once its timeout is spent."""
+    # 3 pages of 0.3 s: none reaches the 0.5 s timeout alone, together they do
+    monkeypatch.setattr(data_download, "DATASETS", _stub_datasets(stub_server, {"crawl": 0.5}))
+    start = time.perf_counter()
+    results = download_all(34.0, -118.2, 200, tmp_path)
+    assert results["crawl"] is None
+    assert time.perf_counter() - start < 3 * DELAY["crawl"]
+
+
+def test_paginated_past_max_record_count(stub_server, tmp_path, monkeypatch, capsys):
+    """Pages are requested until the server stops flagging more, and all are written."""
+    monkeypatch.setattr(data_download, "DATASETS", _stub_datasets(stub_server, {"paged": 5.0}))
+    results = download_all(34.0, -118.2, 200, tmp_path)
+    assert stub_server.offsets == [0, 3, 6]
+    assert stub_server.order == ["oid"] * 3  # stable order across pages
+    assert len(stub_server.clients) == 1  # one kept-alive connection for all pages
+    gdf = gpd.read_file(results["paged"])
+    assert sorted(gdf["oid"]) == list(range(FEATURES["paged"]))
+    # typed from the layer's fields, not from the whole numbers on page 1
+    assert gdf.sort_values("oid")["value"].tolist() == [0, 1, 2, 3.5, 4.5, 5.5, 6.5, 7.5]
+    assert (gdf["owner"] == OWNER).all()  # not cut to a default width
+    assert "8 features -> paged.shp (3 pages)" in capsys.readouterr().out
+
+
+def test_repeated_page_fails(stub_server, tmp_path, monkeypatch, capsys):
+    """A server that ignores resultOffset fails on the second page, not at the timeout."""
+    monkeypatch.setattr(data_download, "DATASETS", _stub_datasets(stub_server, {"stuck": 5.0}))
+    start = time.perf_counter()
+    results = download_all(34.0, -118.2, 200, tmp_path)
+    assert results["stuck"] is None
+    assert time.perf_counter() - start < 2.0
+    assert stub_server.offsets == [0, 3]
+    assert "repeats the previous one" in capsys.readouterr().out
+    assert not (tmp_path / "stuck.shp").exists()
+
+
+def test_object_id_batches_without_pagination(stub_server, tmp_path, monkeypatch, capsys):
+    """A layer that cannot page by resultOffset is fetched by object ids instead."""
+    monkeypatch.setattr(data_download, "DATASETS", _stub_datasets(stub_server, {"ids": 5.0}))
+    results = download_all(34.0, -118.2, 200, tmp_path)
+    assert stub_server.offsets == []  # no resultOffset query at all
+    gdf = gpd.read_file(results["ids"])
+    assert sorted(gdf["oid"]) == list(range(FEATURES["ids"]))
+    assert "8 features -> ids.shp (3 pages)" in capsys.readouterr().out
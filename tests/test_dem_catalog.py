@@ -0,0 +1,81 @@
+"""DEM tile catalog and VRT mosaic tests."""
+import pytest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from src.dem_catalog import build_dem_catalog, tiles_for_bounds, write_mosaic_vrt
+
+
+def _write_tiles(tile_dir: Path) -> tuple[np.ndarray, object]:
+    """Split a 40 x 60 grid into a left and a right tile; return the full grid."""
+    data = np.arange(40 * 60, dtype="float32").reshape(40, 60)
+    transform = from_origin(400000.0, 3800000.0, 1.0, 1.0)
+    tile_dir.mkdir()
+    for name, col0, col1 in [("west.tif", 0, 25), ("east.tif", 25, 60)]:
+        window = Window(col0, 0, col1 - col0, 40)
+        with rasterio.open(
+            tile_dir / name, "w", driver="GTiff", width=col1 - col0, height=40,
+            count=1, dtype="float32", crs="EPSG:6340", nodata=-9999.0,
+            transform=rasterio.windows.transform(window, transform),
+        ) as dst:
+            dst.write(data[:, col0:col1], 1)
+    return data, transform
+
+
+def test_mosaic_across_tile_seam(tmp_path):
+    """A window straddling two tiles reads back exactly like the unsplit grid."""
+    data, transform = _write_tiles(tmp_path / "tiles")
+    catalog = build_dem_catalog(tmp_path / "tiles", tmp_path / "catalog.json")
+    assert len(catalog["tiles"]) == 2
+
+    # Columns 20..34, rows 5..14 of the full grid
+    bounds = (400020.0, 3800000.0 - 15, 400035.0, 3800000.0 - 5)
+    assert len(tiles_for_bounds(catalog, bounds)) == 2
+    vrt = write_mosaic_vrt(catalog, bounds, tmp_path / "mosaic.vrt")
+    with rasterio.open(vrt) as src:
+        assert src.crs.to_epsg() == 6340
+        assert src.shape == (10, 15)
+        np.testing.assert_array_equal(src.read(1), data[5:15, 20:35])
+
+
+def test_catalog_skips_tiles_without_crs(tmp_path):
+    """Tiles with no CRS are listed as skipped, not indexed."""
+    _write_tiles(tmp_path / "tiles")
+    with rasterio.open(
+        tmp_path / "tiles" / "bare.tif", "w", driver="GTiff", width=2, height=2,
+        count=1, dtype="float32",
+    ) as dst:
+        dst.write(np.zeros((2, 2), dtype="float32"), 1)
+    catalog = build_dem_catalog(tmp_path / "tiles", tmp_path / "catalog.json")
+    assert len(catalog["tiles"]) == 2
+    assert [Path(p).name for p in catalog["skipped"]] == ["bare.tif"]
+    with pytest.raises(ValueError):
+        write_mosaic_vrt(catalog, (0.0, 0.0, 1.0, 1.0), tmp_path / "none.vrt")
+
+
+def test_catalog_suffixes_and_unsupported_dtype(tmp_path):
+    """.TIF and .tiff tiles are indexed; an int64 tile fails with ValueError, not KeyError."""
+    _write_tiles(tmp_path / "tiles")
+    (tmp_path / "tiles" / "west.tif").rename(tmp_path / "tiles" / "WEST.TIF")
+    (tmp_path / "tiles" / "east.tif").rename(tmp_path / "tiles" / "east.tiff")
+    catalog = build_dem_catalog(tmp_path / "tiles", tmp_path / "catalog.json")
+    assert sorted(Path(p).name for p in catalog["tiles"]) == ["WEST.TIF", "east.tiff"]
+
+    (tmp_path / "wide").mkdir()
+    with rasterio.open(
+        tmp_path / "wide" / "int64.tif", "w", driver="GTiff", width=4, height=4, count=1,
+        dtype="int64", crs="EPSG:6340", transform=from_origin(400000.0, 3800000.0, 1.0, 1.0),
+    ) as dst:
+        dst.write(np.zeros((4, 4), dtype="int64"), 1)
+    catalog = build_dem_catalog(tmp_path / "wide", tmp_path / "wide.json")
+    with pytest.raises(ValueError, match="unsupported data type"):
+        write_mosaic_vrt(catalog, (400000.0, 3799996.0, 400004.0, 3800000.0), tmp_path / "w.vrt")
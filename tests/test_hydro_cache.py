@@ -0,0 +1,87 @@
+"""Hydrology raster cache and multi-threshold runs: routing is done once."""
+import pytest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import geopandas as gpd
+import numpy as np
+
+from src.hydro_cache import hydro_cache_key, load_hydrology
+from src.streams import _route_in_memory, delineate_streams, threshold_path
+from tests.helpers import write_dem
+
+NODATA = -9999.0
+
+
+def _valley(rows: int = 30, cols: int = 40) -> np.ndarray:
+    """V-shaped valley draining south, with some noise and a nodata corner."""
+    r, c = np.mgrid[0:rows, 0:cols]
+    dem = np.abs(c - cols / 2) + (rows - r) * 0.5
+    dem += np.random.default_rng(0).random((rows, cols)) * 0.3
+    dem[:3, :3] = NODATA
+    return dem
+
+
+@pytest.mark.parametrize("tile_size", [None, 8])
+def test_rerun_reuses_routing(tmp_path, capsys, tile_size):
+    """The second run skips routing and writes the same streams."""
+    dem = write_dem(tmp_path / "dem.tif", _valley())
+    cache = tmp_path / "cache"
+    delineate_streams(dem, tmp_path / "a.shp", threshold=20, tile_size=tile_size, cache_dir=cache)
+    assert "Computing flow accumulation" in capsys.readouterr().out
+
+    # A different threshold also hits the cache
+    delineate_streams(dem, tmp_path / "b.shp", threshold=20, tile_size=tile_size, cache_dir=cache)
+    delineate_streams(dem, tmp_path / "c.shp", threshold=40, tile_size=tile_size, cache_dir=cache)
+    out = capsys.readouterr().out
+    assert "Computing flow accumulation" not in out
+    assert out.count("from cache") == 2
+
+    a, b = gpd.read_file(tmp_path / "a.shp"), gpd.read_file(tmp_path / "b.shp")
+    assert a.equals(b)
+    assert len(gpd.read_file(tmp_path / "c.shp")) < len(a)
+
+
+def test_cached_rasters_match_routing(tmp_path):
+    """Cached arrays round-trip exactly, in memory and memory-mapped."""
+    dem = write_dem(tmp_path / "dem.tif", _valley())
+    cache = tmp_path / "cache"
+    delineate_streams(dem, tmp_path / "s.shp", threshold=20, cache_dir=cache)
+    key = hydro_cache_key(dem)
+    for cached in (load_hydrology(key, cache), load_hydrology(key, cache, tmp_path)):
+        for got, want in zip(cached, _route_in_memory(dem, None)):
+            np.testing.assert_array_equal(got, want)
+            assert got.dtype == want.dtype
+
+
+def test_key_follows_contents(tmp_path):
+    """Rewriting the same DEM keeps the key; new pixels or weights change it."""
+    data = _valley()
+    key = hydro_cache_key(write_dem(tmp_path / "dem.tif", data))
+    assert hydro_cache_key(write_dem(tmp_path / "dem.tif", data)) == key
+    assert hydro_cache_key(write_dem(tmp_path / "copy.tif", data)) == key
+
+    data[10, 10] += 1.0
+    assert hydro_cache_key(write_dem(tmp_path / "dem.tif", data)) != key
+    weights = write_dem(tmp_path / "w.tif", np.ones(data.shape))
+    assert hydro_cache_key(tmp_path / "dem.tif", weights) != hydro_cache_key(tmp_path / "dem.tif")
+    assert hydro_cache_key(tmp_path / "dem.tif", breach=(3.0, 100)) != hydro_cache_key(tmp_path / "dem.tif")
+    assert load_hydrology("missing", tmp_path / "cache") is None
+
+
+def test_several_thresholds_in_one_call(tmp_path, capsys):
+    """A list of thresholds routes once and writes one layer per threshold."""
+    dem = write_dem(tmp_path / "dem.tif", _valley())
+    written = delineate_streams(dem, tmp_path / "s.shp", threshold=[20, 40, 10**6], cache_dir=None)
+    out = capsys.readouterr().out
+    assert out.count("Computing flow accumulation") == 1
+    assert written[10**6] is None
+    assert written[20] == threshold_path(tmp_path / "s.shp", 20) == tmp_path / "s_t20.shp"
+
+    single = delineate_streams(dem, tmp_path / "one.shp", threshold=40, cache_dir=None)
+    assert gpd.read_file(written[40]).equals(gpd.read_file(single))
+    assert len(gpd.read_file(written[20])) > len(gpd.read_file(written[40]))
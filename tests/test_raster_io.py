@@ -0,0 +1,59 @@
+"""Raster output profile tests (plain GeoTIFF vs COG)."""
+import pytest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from src.raster_io import copy_raster, write_raster
+
+META = {
+    "driver": "GTiff",
+    "width": 1200,
+    "height": 1000,
+    "count": 1,
+    "dtype": "float32",
+    "crs": "EPSG:6340",
+    "nodata": -9999.0,
+    "transform": from_origin(400000.0, 3800000.0, 0.5, 0.5),
+}
+
+
+def _surface() -> np.ndarray:
+    rows, cols = np.mgrid[0:META["height"], 0:META["width"]]
+    return (100 + 0.01 * rows + 0.02 * cols).astype("float32")[np.newaxis]
+
+
+def test_cog_profile_is_lossless_tiled_with_overviews(tmp_path):
+    """The COG profile keeps every pixel and adds tiles, compression and overviews."""
+    data = _surface()
+    data[0, :10, :10] = META["nodata"]
+    path = tmp_path / "dem.tif"
+    write_raster(path, data, META, "cog")
+    with rasterio.open(path) as src:
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        assert src.profile["compress"] == "deflate"
+        assert src.block_shapes[0] == (512, 512)
+        assert src.overviews(1)
+        assert src.nodata == META["nodata"]
+        np.testing.assert_array_equal(src.read(), data)
+
+
+def test_copy_raster_converts_plain_geotiff(tmp_path):
+    """copy_raster turns a plain GeoTIFF into a COG; gtiff copies unchanged."""
+    plain = tmp_path / "plain.tif"
+    write_raster(plain, _surface(), META)
+    copy_raster(plain, tmp_path / "same.tif")
+    copy_raster(plain, tmp_path / "cog.tif", "cog")
+    assert (tmp_path / "same.tif").read_bytes() == plain.read_bytes()
+    with rasterio.open(tmp_path / "cog.tif") as src:
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        np.testing.assert_array_equal(src.read(), _surface())
+    with pytest.raises(ValueError):
+        write_raster(tmp_path / "x.tif", _surface(), META, "png")
@@ -0,0 +1,57 @@
+"""Topology-safe line simplification tests."""
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+import shapely
+
+from src.simplify import simplify_lines
+
+
+def _staircase(n: int, y0: float = 0.0) -> shapely.LineString:
+    """D8-style steps from (0, y0) to (n, y0 + n)."""
+    xy = [(0.0, y0)]
+    for k in range(n):
+        xy += [(k + 1.0, y0 + k), (k + 1.0, y0 + k + 1.0)]
+    return shapely.LineString(xy)
+
+
+def test_staircase_keeps_endpoints(capsys):
+    """A staircase becomes its chord; first and last vertex are unchanged."""
+    lines = np.array([_staircase(10), _staircase(10, y0=5.0)])
+    out = simplify_lines(lines, 1.0)
+    for before, after in zip(lines, out):
+        assert shapely.get_num_coordinates(after) == 2
+        assert after.coords[0] == before.coords[0] and after.coords[-1] == before.coords[-1]
+    assert "42 -> 4 vertices" in capsys.readouterr().out
+
+
+def test_no_new_crossings():
+    """A line whose chord would cut another keeps its shape instead."""
+    corner = shapely.LineString([(0, 0), (0, 10), (10, 10)])
+    inside = shapely.LineString([(3, 6), (6, 3)])  # crossed by the chord (0,0)-(10,10)
+    out = simplify_lines(np.array([corner, inside]), 8.0)
+    assert not out[0].intersects(out[1])
+    assert shapely.get_num_coordinates(out[0]) == 3
+
+
+def test_existing_contacts_allowed():
+    """Links meeting at a confluence still meet there after simplification."""
+    a = _staircase(6)
+    b = shapely.LineString([(12, 0), (9, 3), (6, 6)])  # ends on a's last vertex
+    out = simplify_lines(np.array([a, b]), 1.0)
+    assert out[0].coords[-1] == out[1].coords[-1] == (6.0, 6.0)
+    assert shapely.get_num_coordinates(out[0]) == 2
+
+
+def test_touching_lines_do_not_cross():
+    """Links meeting at a confluence keep that as their only contact."""
+    a = shapely.LineString([(0, 0), (5, 1.5), (10, 0)])
+    b = shapely.LineString([(0, 0), (5, 0.8), (5, -5)])  # a's chord would cut b at (5, 0)
+    out = simplify_lines(np.array([a, b]), 2.0)
+    assert shapely.equals(shapely.intersection(out[0], out[1]), shapely.Point(0, 0))
+    assert shapely.get_num_coordinates(out[0]) == 3
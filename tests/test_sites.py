@@ -0,0 +1,36 @@
+"""Sites file parsing tests (batch mode)."""
+import pytest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.utils import read_sites
+
+
+def test_read_sites_csv(tmp_path):
+    """CSV sites keep file order; names are made folder-safe; blanks are numbered."""
+    path = tmp_path / "sites.csv"
+    path.write_text("Name,Latitude,Longitude\nCreek A,34.1,-118.7\n,34.2,-118.8\n")
+    assert read_sites(path) == [("Creek_A", 34.1, -118.7), ("site_002", 34.2, -118.8)]
+
+
+def test_read_sites_geojson(tmp_path):
+    """GeoJSON point sites are read as (name, lat, lon)."""
+    path = tmp_path / "sites.geojson"
+    path.write_text(
+        '{"type": "FeatureCollection", "features": ['
+        '{"type": "Feature", "properties": {"name": "s1"},'
+        ' "geometry": {"type": "Point", "coordinates": [-118.7, 34.1]}}]}'
+    )
+    assert read_sites(path) == [("s1", 34.1, -118.7)]
+
+
+def test_read_sites_rejects_duplicate_names(tmp_path):
+    """Duplicate names would share an output folder."""
+    path = tmp_path / "sites.csv"
+    path.write_text("name,lat,lon\na,34.1,-118.7\na,34.2,-118.8\n")
+    with pytest.raises(ValueError, match="Duplicate"):
+        read_sites(path)
@@ -0,0 +1,42 @@
+"""8-neighbour stencil views must match explicit np.pad slicing."""
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from src.stencil import DC, DR, neighbours, pad, shifted, window
+
+
+def test_views_match_np_pad():
+    """View i at (r, c) is the value at (r + DR[i], c + DC[i]), or fill outside."""
+    grid = np.arange(20.0).reshape(4, 5)
+    padded = np.pad(grid, 1, constant_values=-1.0)
+    for i, nb in enumerate(neighbours(grid, -1.0)):
+        expected = padded[1 + DR[i]:5 + DR[i], 1 + DC[i]:6 + DC[i]]
+        np.testing.assert_array_equal(nb, expected)
+
+
+def test_reused_buffer():
+    """pad() writes into out, so views of it follow the latest grid."""
+    buf = np.empty((5, 6), dtype=np.int32)
+    views = shifted(buf)
+    for value in (1, 2):
+        assert pad(np.full((3, 4), value), 0, out=buf) is buf
+        assert views[0][0, 0] == value and views[0][0, -1] == 0
+    assert pad(np.ones((3, 4), dtype=bool), False, out=buf).dtype == np.int32
+
+
+def test_tile_windows_share_one_buffer():
+    """Each tile's halo window, written into one buffer, matches slicing np.pad."""
+    grid = np.arange(42.0).reshape(6, 7)
+    padded = np.pad(grid, 2, constant_values=np.nan)
+    buf = np.empty((4 + 4) ** 2)
+    for r0, c0 in [(0, 0), (0, 4), (4, 0), (4, 4)]:
+        r1, c1 = min(r0 + 4, 6), min(c0 + 4, 7)
+        win = window(grid, r0, r1, c0, c1, np.nan, width=2, out=buf)
+        assert np.shares_memory(win, buf)
+        np.testing.assert_array_equal(win, padded[r0:r1 + 4, c0:c1 + 4])
@@ -0,0 +1,288 @@
+"""Stream delineation engine tests (synthetic DEMs, no assets needed)."""
+import heapq
+import pytest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+import sys
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from rasterio.transform import from_origin
+
+from src.config import HYDRO_BYTES_PER_TILE_CELL
+from src.stencil import DC, DR
+from src.streams import (
+    _breach_depressions, _fill_sinks, _flow_accumulation, _flow_direction_d8, _outlet_cells,
+    _resolve_flats, _stream_network, plan_tile_size,
+)
+
+NODATA = -9999.0
+
+
+def _reference_priority_flood(dem: np.ndarray) -> np.ndarray:
+    """Textbook priority-flood (heap, one cell at a time) for comparison."""
+    rows, cols = dem.shape
+    valid = dem != NODATA
+    filled = dem.copy()
+    done = ~valid
+    heap = []
+    for r, c in zip(*np.nonzero(_outlet_cells(valid))):
+        heapq.heappush(heap, (dem[r, c], r, c))
+        done[r, c] = True
+    while heap:
+        level, r, c = heapq.heappop(heap)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                rr, cc = r + dr, c + dc
+                if 0 <= rr < rows and 0 <= cc < cols and not done[rr, cc]:
+                    done[rr, cc] = True
+                    filled[rr, cc] = max(dem[rr, cc], level)
+                    heapq.heappush(heap, (filled[rr, cc], rr, cc))
+    return filled
+
+
+def _random_dem(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows, cols = rng.integers(3, 30, 2)
+    dem = np.round(rng.random((rows, cols)) * 10, int(rng.integers(0, 3)))
+    dem[rng.random((rows, cols)) < 0.1] = NODATA
+    return dem
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_fill_matches_priority_flood(seed):
+    """Filled levels equal a heap-based priority-flood, with nodata as outlets."""
+    dem = _random_dem(seed)
+    np.testing.assert_array_equal(_fill_sinks(dem, NODATA), _reference_priority_flood(dem))
+
+
+def test_fill_multi_cell_depression():
+    """A walled basin several cells wide fills to its lowest rim cell."""
+    dem = np.full((7, 7), 10.0)
+    dem[1:6, 1:6] = 2.0
+    dem[3, 0] = 6.0  # spill point on the edge
+    dem[1:6, 1] = dem[1:6, 5] = dem[1, 1:6] = dem[5, 1:6] = 8.0
+    dem[3, 1] = 7.0
+    filled = _fill_sinks(dem, None)
+    assert np.all(filled[2:5, 2:5] == 7.0)
+    assert filled[3, 0] == 6.0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_epsilon_fill_drains_every_cell(seed):
+    """With epsilon, every valid non-outlet cell has a strictly lower neighbour."""
+    dem = _random_dem(seed)
+    valid = dem != NODATA
+    exact = _fill_sinks(dem, NODATA)
+    filled = _fill_sinks(dem, NODATA, epsilon=True)
+    assert np.all(filled[valid] >= exact[valid])
+    np.testing.assert_allclose(filled, exact, rtol=0, atol=1e-9)
+    padded = np.pad(np.where(valid, filled, np.inf), 1, constant_values=np.inf)
+    rows, cols = dem.shape
+    lowest = np.min([
+        padded[1 + dr:rows + 1 + dr, 1 + dc:cols + 1 + dc]
+        for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc
+    ], axis=0)
+    inner = valid & ~_outlet_cells(valid)
+    assert np.all(lowest[inner] < filled[inner])
+
+
+def _embankment_valley() -> np.ndarray:
+    """Valley draining south, dammed by a 3-cell-wide embankment 2 units high."""
+    r, c = np.mgrid[0:60, 0:80]
+    dem = np.abs(c - 40) * 0.5 + (60 - r) * 0.2
+    dem[30:33, 10:70] += 2.0
+    return dem
+
+
+def test_breach_cuts_embankment_instead_of_flooding():
+    """Breaching carves a short graded channel; filling leaves a flat lake behind it."""
+    dem = _embankment_valley()
+    filled = _fill_sinks(dem, None)
+    breached = _breach_depressions(dem, None, 3.0, 100)
+    assert np.all(breached <= dem) and 0 < (breached < dem).sum() < 10
+    assert (dem - breached).max() <= 3.0
+    flats = [(_flow_direction_d8(z) < 0)[1:-1, 1:-1].sum() for z in (filled, breached)]
+    assert flats[0] > 20 and flats[1] == 0
+
+
+def test_breach_depth_ignores_drop_beyond_barrier():
+    """Ground far below the embankment does not deepen the cut through it."""
+    dem = _embankment_valley()
+    dem[33:] -= 20.0
+    breached = _breach_depressions(dem, None, 3.0, 100)
+    assert 0 < (breached < dem).sum() < 10
+    assert (dem - breached).max() <= 3.0
+    assert (_flow_direction_d8(breached) < 0)[1:-1, 1:-1].sum() == 0
+
+
+def test_breach_limits_fall_back_to_fill():
+    """Channels deeper or longer than the limits are not carved; the lake is filled."""
+    dem = _embankment_valley()
+    for depth, length in ((1.0, 100), (3.0, 2)):
+        np.testing.assert_array_equal(_breach_depressions(dem, None, depth, length),
+                                      _fill_sinks(dem, None))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_breach_leaves_no_depressions(seed):
+    """The result needs no more filling and is never above the filled DEM."""
+    dem = _random_dem(seed)
+    for depth, length in ((0.5, 2), (5.0, 10)):
+        breached = _breach_depressions(dem, NODATA, depth, length)
+        assert np.all(breached[dem == NODATA] == NODATA)
+        np.testing.assert_array_equal(_fill_sinks(breached, NODATA), breached)
+        assert np.all(breached <= _fill_sinks(dem, NODATA))
+
+
+def _routed(dem: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Fill, D8 and flat resolution as delineate_streams runs them."""
+    filled = _fill_sinks(dem, NODATA)
+    filled[dem == NODATA] = np.nan
+    return filled, _resolve_flats(filled, _flow_direction_d8(filled))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_resolved_flats_leave_no_dead_ends_or_loops(seed):
+    """After flat resolution only outlets lack a direction, and every path ends."""
+    filled, fdir = _routed(_random_dem(seed))
+    valid = ~np.isnan(filled)
+    assert not np.any(valid & ~_outlet_cells(valid) & (fdir < 0))
+
+    rows, cols = fdir.shape
+    d = fdir.ravel()
+    cell = np.arange(rows * cols)
+    nxt = np.where(d >= 0, cell + DR[d] * cols + DC[d], cell)
+    for _ in range(int(np.log2(rows * cols)) + 1):
+        nxt = nxt[nxt]
+    assert np.all(d[nxt] < 0)
+
+
+def test_flat_floor_drains_to_its_outlet():
+    """Every cell of a flat basin floor gets a direction, and paths reach the outlet."""
+    dem = np.full((9, 9), 10.0)
+    dem[2:7, 2:7] = 5.0           # flat floor
+    dem[4, 0:2] = 5.0             # channel from the floor to the west edge
+    dem[4, 0] = 4.0
+    _, fdir = _routed(dem)
+    assert np.all(fdir[2:7, 2:7] >= 0)
+    # Following the directions from the far corner ends at the west edge
+    r, c = 6, 6
+    for _ in range(81):
+        if fdir[r, c] < 0:
+            break
+        r, c = r + DR[fdir[r, c]], c + DC[fdir[r, c]]
+    assert (r, c) == (4, 0)
+
+
+def _reference_accumulation(fdir: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Walk every cell's flow path and add its weight to each cell on it."""
+    rows, cols = fdir.shape
+    acc = np.zeros((rows, cols))
+    for r0, c0 in np.ndindex(rows, cols):
+        r, c = r0, c0
+        while True:
+            acc[r, c] += weights[r0, c0]
+            d = fdir[r, c]
+            if d < 0:
+                break
+            r, c = r + DR[d], c + DC[d]
+            if not (0 <= r < rows and 0 <= c < cols):
+                break
+    return acc
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_accumulation_matches_path_walk(seed):
+    """Cell counts and weighted sums equal summing weights along every flow path."""
+    _, fdir = _routed(_random_dem(seed))
+    ones = np.ones(fdir.shape)
+    np.testing.assert_array_equal(_flow_accumulation(fdir), _reference_accumulation(fdir, ones))
+    weights = np.random.default_rng(seed).random(fdir.shape)
+    np.testing.assert_allclose(
+        _flow_accumulation(fdir, weights), _reference_accumulation(fdir, weights), rtol=1e-12,
+    )
+
+
+def test_accumulation_along_long_channel():
+    """A single serpentine path (one cell per BFS wave) accumulates to its full length."""
+    rows, cols = 40, 50
+    fdir = np.full((rows, cols), 0, dtype=np.int8)  # east
+    fdir[1::2] = 4                                   # west on odd rows
+    fdir[0::2, -1] = fdir[1::2, 0] = 2               # turn south at the row ends
+    fdir[-1, 0] = -1
+    acc = _flow_accumulation(fdir)
+    assert acc[-1, 0] == rows * cols
+    assert acc[0, 0] == 1
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_float32_routing_matches_float64(seed):
+    """Lean float32 fill, directions and accumulation equal float64 on whole-metre DEMs."""
+    dem = _random_dem(seed)
+    dem = np.where(dem == NODATA, NODATA, np.floor(dem))
+    filled, fdir = _routed(dem)
+    filled32, fdir32 = _routed(dem.astype(np.float32))
+    assert filled32.dtype == np.float32
+    np.testing.assert_array_equal(filled32, filled)
+    np.testing.assert_array_equal(fdir32, fdir)
+    acc32 = _flow_accumulation(fdir32, dtype=np.float32)
+    assert acc32.dtype == np.float32
+    np.testing.assert_array_equal(acc32, _flow_accumulation(fdir))
+
+
+def test_plan_tile_size():
+    """Small DEMs stay in memory; large ones get tiles that fit the ceiling."""
+    assert plan_tile_size((1000, 1000), 1.0) is None
+    size = plan_tile_size((100_000, 100_000), 4.0)
+    assert size % 256 == 0 and size * size * HYDRO_BYTES_PER_TILE_CELL <= 4 * 2**30
+    assert plan_tile_size((100_000, 100_000), 0.001) == 256
+
+
+def test_network_splits_links_at_confluences():
+    """Two tributaries joining give three connected links with order and ids."""
+    fdir = np.full((5, 5), -1, dtype=np.int8)
+    fdir[0, 0] = fdir[1, 1] = 1                # west tributary, SE to (2, 2)
+    fdir[0, 4] = fdir[1, 3] = 3                # east tributary, SW to (2, 2)
+    fdir[2, 2] = fdir[3, 2] = fdir[4, 2] = 2   # trunk, south off the raster
+    acc = np.where(fdir >= 0, _flow_accumulation(fdir), 0)
+    filled = np.arange(25, dtype=np.float64)[::-1].reshape(5, 5)
+    gdf = _stream_network(fdir, acc, filled, 1, from_origin(0, 5, 1, 1), "EPSG:6340")
+
+    assert len(gdf) == 3
+    trunk = gdf[gdf["ds_id"] == -1].iloc[0]
+    tributaries = gdf[gdf["ds_id"] == trunk["stream_id"]]
+    assert list(tributaries["strahler"]) == [1, 1] and trunk["strahler"] == 2
+    assert list(tributaries["shreve"]) == [1, 1] and trunk["shreve"] == 2
+    # Each tributary ends on the confluence, where the trunk starts
+    for line in tributaries.geometry:
+        assert line.coords[-1] == trunk.geometry.coords[0] == (2.5, 2.5)
+    assert list(tributaries["length"]) == pytest.approx([2 * np.sqrt(2)] * 2)
+    assert trunk["length"] == pytest.approx(2.0)
+    assert trunk["up_area"] == 7
+    assert trunk["slope"] == pytest.approx((filled[2, 2] - filled[4, 2]) / 2.0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_network_links_are_consistent(seed):
+    """Links cover stream cells without overlap and connect to their ds link."""
+    dem = np.random.default_rng(seed).random((40, 40)) * 10
+    filled, fdir = _routed(dem)
+    acc = _flow_accumulation(fdir)
+    gdf = _stream_network(fdir, acc, filled, 5, from_origin(0, 40, 1, 1), None)
+    stream = {(c + 0.5, 40 - r - 0.5) for r, c in zip(*np.nonzero(acc >= 5))}
+    starts = {}
+    own = []  # every vertex but the last one belongs to exactly one link
+    for sid, line in zip(gdf["stream_id"], gdf.geometry):
+        starts[sid] = line.coords[0]
+        own.extend(line.coords[:-1])
+        assert set(line.coords) <= stream
+    assert len(own) == len(set(own))
+    for line, ds in zip(gdf.geometry, gdf["ds_id"]):
+        if ds >= 0:
+            assert line.coords[-1] == starts[ds]
+    assert (gdf["slope"] >= 0).all()
+    assert (gdf["strahler"] <= gdf["shreve"]).all()